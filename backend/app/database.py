@@ -1,11 +1,141 @@
-from sqlalchemy import create_engine
+import logging
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from .config import settings
 
-engine = create_engine(settings.database_url)
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+# Connection pools count checkouts, time spent waiting for a connection and
+# checkouts that timed out, so pool exhaustion shows up in /health/ready and
+# the logs instead of as requests that just hang
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+class _InstrumentedPool:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            logger.warning("Database pool exhausted: %s", self.status())
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.stats.wait_seconds += waited
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+        self.stats.checkouts += 1
+        return connection
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+def engine_options(async_driver: bool) -> dict:
+    url = make_url(settings.database_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # in-memory databases live and die with their one connection
+    
+    options = {"pool_pre_ping": settings.db_pool_pre_ping}
+    if settings.db_pool_size > 0:
+        options.update(
+            poolclass=InstrumentedAsyncQueuePool if async_driver else InstrumentedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    else:
+        options["poolclass"] = NullPool  # e.g. behind PgBouncer, which pools for us
+    
+    if url.get_backend_name() == "postgresql":
+        connect_args = {}
+        if settings.db_pgbouncer:
+            # Transaction pooling hands each transaction to any server
+            # connection, so named prepared statements must not be reused, and
+            # PgBouncer rejects startup parameters such as statement_timeout
+            # (set that on the database role instead)
+            if async_driver:
+                connect_args.update(
+                    statement_cache_size=0,
+                    prepared_statement_cache_size=0,
+                    prepared_statement_name_func=lambda: f"__asyncpg_{uuid.uuid4()}__",
+                )
+        elif settings.db_statement_timeout_ms:
+            if async_driver:
+                connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+            else:
+                connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+        options["connect_args"] = connect_args
+    return options
+
+# Sync engine: Alembic, create_all and background workers
+engine = create_engine(settings.database_url, **engine_options(async_driver=False))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: request handlers
+async_engine = create_async_engine(to_async_url(settings.database_url), **engine_options(async_driver=True))
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+# SQLite only honours ON DELETE CASCADE with foreign keys switched on per connection
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+for _engine in (engine, async_engine.sync_engine):
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine, "connect", _enable_sqlite_foreign_keys)
+
+def pool_status(engine: Engine) -> dict:
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=settings.db_max_overflow,
+        )
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update({key: round(value, 4) if isinstance(value, float) else value for key, value in asdict(stats).items()})
+    return status
+
 Base = declarative_base()
 
 def get_db():
@@ -13,4 +143,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
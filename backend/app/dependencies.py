@@ -0,0 +1,74 @@
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
+from .models.campaign import Campaign
+from .models.npc import NPC
+from .models.session import Session as SessionModel
+from .models.user import User
+from .routers.auth import get_current_user
+from .services import rate_limits
+
+# Shared ownership checks. Campaigns, sessions and NPCs all carry owner_id, so
+# proving access is a primary-key lookup filtered by owner instead of a join
+# up to the campaign. Results are memoized on the request's database session
+# (one AsyncSession per request), so repeated checks for the same object in
+# one request hit the database once.
+#
+# A deleted campaign is tombstoned until the cleanup job removes it; the
+# campaign and everything under it read as not found from that point on.
+
+NOT_FOUND = {Campaign: "Campaign not found", SessionModel: "Session not found", NPC: "NPC not found"}
+
+def live(model):
+    # WHERE clause hiding tombstoned campaigns and their sessions and NPCs
+    if model is Campaign:
+        return Campaign.deleted_at.is_(None)
+    return model.campaign_id.not_in(select(Campaign.id).where(Campaign.deleted_at.is_not(None)))
+
+async def get_owned(db: AsyncSession, model, object_id: int, current_user: User, *options):
+    memo = db.info.setdefault("owned", {})
+    key = (model, object_id, current_user.id)
+    # Calls that ask for extra loader options always query so the options apply
+    if key in memo and not options:
+        return memo[key]
+
+    result = await db.execute(select(model).where(
+        model.id == object_id,
+        model.owner_id == current_user.id,
+        live(model)
+    ).options(*options))
+    obj = result.scalar_one_or_none()
+    if not obj:
+        raise HTTPException(status_code=404, detail=NOT_FOUND[model])
+    memo[key] = obj
+    return obj
+
+async def owned_campaign(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> Campaign:
+    return await get_owned(db, Campaign, campaign_id, current_user)
+
+async def owned_session(
+    session_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> SessionModel:
+    return await get_owned(db, SessionModel, session_id, current_user)
+
+async def owned_npc(
+    npc_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> NPC:
+    return await get_owned(db, NPC, npc_id, current_user)
+
+
+def rate_limited(group: str):
+    # Dependency drawing from the caller's bucket for a route group; applied
+    # per router in main.py and per route for the expensive endpoints
+    async def check(request: Request, current_user: User = Depends(get_current_user)):
+        await rate_limits.check(request, current_user, group)
+    return check
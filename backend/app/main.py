@@ -1,10 +1,16 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, campaigns, sessions, npcs, uploads
-from .database import engine
-from .models import Base
+from .routers import auth, campaigns, events, sessions, npcs, uploads, search
+from .config import settings
+from .database import async_engine, pool_status
+from .dependencies import rate_limited
+from .services import health, jobs, metrics
+from .services.rate_limits import RateLimitHeadersMiddleware
+from .services import deletion, documents, recaps, transcription, vector_index  # noqa: F401 (registers job handlers)
 
-Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic (`alembic upgrade head`), not create_all
 
 app = FastAPI(title="RPG Campaign Assistant", version="1.0.0")
 
@@ -14,13 +20,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # List endpoints page through these; the frontend follows them
+    expose_headers=["X-Next-Cursor", "Link"],
 )
 
+app.add_middleware(RateLimitHeadersMiddleware)
+# Added last so it is outermost and times everything above
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Per-user rate limits by route group (services/rate_limits). Uploads get
+# their own, larger bucket since resumable uploads send one request per chunk.
+# Event streams are long-lived and not rate limited.
+api_limit = [Depends(rate_limited("api"))]
+
 app.include_router(auth.router, prefix="/auth", tags=["authentication"])
-app.include_router(campaigns.router, prefix="/campaigns", tags=["campaigns"])
-app.include_router(sessions.router, prefix="/sessions", tags=["sessions"])
-app.include_router(npcs.router, prefix="/npcs", tags=["npcs"])
-app.include_router(uploads.router, prefix="/uploads", tags=["uploads"])
+app.include_router(campaigns.router, prefix="/campaigns", tags=["campaigns"], dependencies=api_limit)
+app.include_router(events.router, prefix="/campaigns", tags=["events"])
+app.include_router(sessions.router, prefix="/sessions", tags=["sessions"], dependencies=api_limit)
+app.include_router(npcs.router, prefix="/npcs", tags=["npcs"], dependencies=api_limit)
+app.include_router(uploads.router, prefix="/uploads", tags=["uploads"], dependencies=[Depends(rate_limited("uploads"))])
+app.include_router(search.router, prefix="/search", tags=["search"], dependencies=api_limit)
+
+# Without Redis there is no separate worker process, so drain the in-process
+# job queue from the API process itself
+@app.on_event("startup")
+async def start_job_worker():
+    app.state.job_worker = None
+    if not settings.redis_enabled:
+        app.state.job_worker = asyncio.create_task(jobs.worker_loop())
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    # Wait for the worker to hand its unfinished jobs back before the
+    # database goes away
+    if app.state.job_worker is not None:
+        app.state.job_worker.cancel()
+        await asyncio.gather(app.state.job_worker, return_exceptions=True)
+
+@app.on_event("shutdown")
+async def close_database():
+    await async_engine.dispose()
 
 @app.get("/")
 async def root():
@@ -28,4 +67,21 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+# Liveness stays static; readiness checks the database and Redis and reports
+# connection pool usage, answering 503 while a dependency is down
+@app.get("/health/ready")
+async def readiness_check():
+    checks = await health.check_all()
+    ready = all(check["status"] != "error" for check in checks.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks, "pool": pool_status(async_engine)},
+        status_code=200 if ready else 503
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if not settings.metrics_enabled:
+        return Response(status_code=404)
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
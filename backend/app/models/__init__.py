@@ -2,5 +2,14 @@ from .user import User
 from .campaign import Campaign
 from .session import Session
 from .npc import NPC
+from .upload import StoredBlob, UploadedFile
+from .job import Job
+from .summary import SummaryCache
+from .document import DocumentText, DocumentChunk, CampaignDocument, LegacyCampaignDocument
+from .embedding import EmbeddingChunk, EmbeddingVersion
 
-__all__ = ["User", "Campaign", "Session", "NPC"]
\ No newline at end of file
+__all__ = [
+    "User", "Campaign", "Session", "NPC", "StoredBlob", "UploadedFile", "Job", "SummaryCache",
+    "DocumentText", "DocumentChunk", "CampaignDocument", "LegacyCampaignDocument", "EmbeddingChunk",
+    "EmbeddingVersion",
+]
\ No newline at end of file
@@ -1,10 +1,19 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, text
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from ..database import Base
 
 class Campaign(Base):
     __tablename__ = "campaigns"
+    __table_args__ = (
+        Index("ix_campaigns_owner_created", "owner_id", "created_at"),
+        # Tombstones are rare; a partial index keeps the "not deleted" checks cheap
+        Index(
+            "ix_campaigns_deleted", "id",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+            sqlite_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -14,14 +23,16 @@ class Campaign(Base):
     # Owner
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
-    # Campaign content
-    campaign_notes = Column(Text, nullable=True)
-    uploaded_documents = Column(Text, nullable=True)  # JSON array of file paths
+    # Campaign content (large; loaded only when asked for)
+    campaign_notes = deferred(Column(Text, nullable=True))
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    deleted_at = Column(DateTime(timezone=True), nullable=True)  # tombstone; the row goes once cleanup has run
     
     # Relationships
     owner = relationship("User", back_populates="campaigns")
-    sessions = relationship("Session", back_populates="campaign")
\ No newline at end of file
+    # Children are removed by ON DELETE CASCADE rather than loaded and deleted one by one
+    sessions = relationship("Session", back_populates="campaign", cascade="all, delete-orphan", passive_deletes=True)
+    documents = relationship("CampaignDocument", back_populates="campaign", cascade="all, delete-orphan", passive_deletes=True)
@@ -0,0 +1,66 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from ..database import Base
+
+class DocumentText(Base):
+    __tablename__ = "document_texts"
+
+    # Extraction is shared by every upload of the same content
+    sha256 = Column(String(64), primary_key=True)
+    status = Column(String, nullable=False, default="pending")  # pending, extracting, completed, failed
+    page_count = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    chunks = relationship("DocumentChunk", back_populates="document", order_by="DocumentChunk.page_number")
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+    __table_args__ = (
+        UniqueConstraint("sha256", "page_number", name="uq_document_chunks_sha256_page"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), ForeignKey("document_texts.sha256"), nullable=False)
+    page_number = Column(Integer, nullable=False)  # 1-based; text files are split into page-sized chunks
+    text = Column(Text, nullable=False)
+    
+    # Relationships
+    document = relationship("DocumentText", back_populates="chunks")
+
+class CampaignDocument(Base):
+    __tablename__ = "campaign_documents"
+    __table_args__ = (
+        UniqueConstraint("campaign_id", "uploaded_file_id", name="uq_campaign_documents_campaign_file"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False, index=True)
+    uploaded_file_id = Column(Integer, ForeignKey("uploaded_files.id"), nullable=False)
+    sha256 = Column(String(64), ForeignKey("document_texts.sha256"), nullable=False)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    campaign = relationship("Campaign", back_populates="documents")
+    uploaded_file = relationship("UploadedFile")
+    text = relationship("DocumentText")
+
+class LegacyCampaignDocument(Base):
+    __tablename__ = "legacy_campaign_documents"
+
+    # Paths from the retired campaigns.uploaded_documents column whose files
+    # were not in the upload catalogue when it was migrated; the catalogue
+    # (services/catalogue) attaches them once it has imported the file
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False, index=True)
+    path = Column(String, nullable=False)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, LargeBinary, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from ..database import Base
+
+class EmbeddingChunk(Base):
+    __tablename__ = "embedding_chunks"
+    __table_args__ = (
+        UniqueConstraint("source_type", "source_id", "chunk_index", name="uq_embedding_chunks_source_chunk"),
+        Index("ix_embedding_chunks_campaign_model", "campaign_id", "model"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False)
+    
+    # What the text came from: campaign (description + notes), session (recap) or npc
+    source_type = Column(String, nullable=False)
+    source_id = Column(Integer, nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    
+    # Content
+    text = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    
+    # Embedding: L2-normalized float32 vector stored as raw bytes
+    model = Column(String, nullable=False)
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class EmbeddingVersion(Base):
+    # Bumped in the same transaction as every write to a campaign's chunks, so
+    # cached search indexes can tell they are stale (timestamps can tie)
+    __tablename__ = "embedding_versions"
+
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_kind_target", "kind", "target_id"),
+        Index("ix_jobs_status", "status"),  # recovery sweeps
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # transcription, ...
+    target_id = Column(Integer, nullable=True)  # id of the row the job works on
+    payload = Column(Text, nullable=True)  # JSON
+    
+    # Status
+    status = Column(String, nullable=False, default="queued")  # queued, running, completed, failed
+    progress = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")  # times a worker has claimed it
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # refreshed while running
@@ -1,13 +1,19 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Index, event, select
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from ..database import Base
+from .session import Session
 
 class NPC(Base):
     __tablename__ = "npcs"
+    __table_args__ = (
+        Index("ix_npcs_session_status", "session_id", "integration_status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False, index=True)  # copy of sessions.campaign_id
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # copy of sessions.owner_id
     
     # Basic info
     name = Column(String, nullable=False)
@@ -16,7 +22,7 @@ class NPC(Base):
     # Description
     appearance = Column(Text, nullable=True)
     personality_traits = Column(Text, nullable=True)
-    backstory = Column(Text, nullable=True)
+    backstory = deferred(Column(Text, nullable=True))  # large; loaded only when asked for
     
     # Game mechanics
     relevant_skills_stats = Column(Text, nullable=True)  # JSON or text
@@ -34,4 +40,14 @@ class NPC(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    session = relationship("Session", back_populates="npcs")
\ No newline at end of file
+    session = relationship("Session", back_populates="npcs")
+
+# campaign_id and owner_id are denormalized from the session; fill them for
+# any insert path that didn't set them
+@event.listens_for(NPC, "before_insert")
+def _fill_ownership(mapper, connection, target):
+    if target.campaign_id is None or target.owner_id is None:
+        row = connection.execute(
+            select(Session.campaign_id, Session.owner_id).where(Session.id == target.session_id)
+        ).one()
+        target.campaign_id, target.owner_id = row.campaign_id, row.owner_id
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Index, event, select
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from ..database import Base
+from .campaign import Campaign
 import enum
 
 class SessionStatus(enum.Enum):
@@ -11,16 +12,22 @@ class SessionStatus(enum.Enum):
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        # Unique index rather than a constraint so SQLite can add it without a
+        # table rebuild; also serves campaign_id lookups and session ordering
+        Index("uq_sessions_campaign_number", "campaign_id", "session_number", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # copy of campaigns.owner_id
     session_number = Column(Integer, nullable=False)
     name = Column(String, nullable=True)
     
     # Session content
     preparation_notes = Column(Text, nullable=True)
     audio_recording_path = Column(String, nullable=True)
-    transcript = Column(Text, nullable=True)
+    transcript = deferred(Column(Text, nullable=True))  # large; loaded only when asked for
     recap = Column(Text, nullable=True)
     
     # Status
@@ -36,4 +43,13 @@ class Session(Base):
     
     # Relationships
     campaign = relationship("Campaign", back_populates="sessions")
-    npcs = relationship("NPC", back_populates="session")
\ No newline at end of file
+    npcs = relationship("NPC", back_populates="session", cascade="all, delete-orphan", passive_deletes=True)
+
+# owner_id is denormalized so ownership checks are a point lookup; fill it
+# from the campaign for any insert path that didn't set it
+@event.listens_for(Session, "before_insert")
+def _fill_owner(mapper, connection, target):
+    if target.owner_id is None:
+        target.owner_id = connection.execute(
+            select(Campaign.owner_id).where(Campaign.id == target.campaign_id)
+        ).scalar_one()
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, DateTime, Text, Integer
+from sqlalchemy.sql import func
+from ..database import Base
+
+class SummaryCache(Base):
+    __tablename__ = "summary_cache"
+
+    # SHA-256 of model, prompt and input text
+    key = Column(String(64), primary_key=True)
+    summary = Column(Text, nullable=False)
+    input_tokens = Column(Integer, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from ..database import Base
+
+class StoredBlob(Base):
+    __tablename__ = "blobs"
+
+    # Content address: hex SHA-256 of the file body
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    
+    # Number of uploaded_files rows pointing at this blob
+    ref_count = Column(Integer, nullable=False, default=0)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class UploadedFile(Base):
+    __tablename__ = "uploaded_files"
+    __table_args__ = (
+        Index("ix_uploaded_files_owner_created", "owner_id", "created_at"),
+        Index("ix_uploaded_files_owner_campaign_created", "owner_id", "campaign_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(String, unique=True, index=True, nullable=False)
+    
+    # Owner
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="SET NULL"), nullable=True)
+    
+    # File info
+    original_name = Column(String, nullable=False)
+    content_type = Column(String, nullable=False, default="application/octet-stream")
+    size = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=False, index=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    owner = relationship("User")
+    campaign = relationship("Campaign")
+    blob = relationship("StoredBlob")
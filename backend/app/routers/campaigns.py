@@ -1,10 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import datetime
+from pathlib import Path
+from ..database import get_async_db
 from ..models.campaign import Campaign
+from ..models.document import CampaignDocument, DocumentChunk, DocumentText
+from ..models.upload import UploadedFile
 from ..models.user import User
 from ..routers.auth import get_current_user
+from ..dependencies import get_owned, live, owned_campaign
+from ..services import archive, deletion, documents, downloads, jobs, response_cache
+from ..services.pagination import DEFAULT_LIMIT, MAX_LIMIT, finish_page, paginate, parse_fields
+from ..services.uploads import find_upload
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -24,18 +36,76 @@ class CampaignResponse(BaseModel):
     id: int
     name: str
     rpg_system: str
-    description: str = None
-    campaign_notes: str = None
-    created_at: str
-    updated_at: str = None
+    description: Optional[str] = None
+    campaign_notes: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# List rows never carry campaign_notes; use GET /{id}/notes for that
+LIST_FIELDS = ["id", "name", "rpg_system", "description", "created_at", "updated_at"]
+
+class CampaignListItem(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    rpg_system: Optional[str] = None
+    description: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class CampaignNotes(BaseModel):
+    id: int
+    campaign_notes: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class CampaignImportResponse(BaseModel):
+    campaign_id: int
+    sessions: int
+    npcs: int
+    files: int
+
+class DocumentAttach(BaseModel):
+    file_id: str
+
+class DocumentResponse(BaseModel):
+    id: int
+    campaign_id: int
+    file_id: str
+    filename: str
+    sha256: str
+    status: str
+    page_count: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class DocumentPage(BaseModel):
+    page_number: int
+    text: str
 
     class Config:
         from_attributes = True
 
+def document_response(document: CampaignDocument, uploaded: UploadedFile, text: DocumentText):
+    return DocumentResponse(
+        id=document.id,
+        campaign_id=document.campaign_id,
+        file_id=uploaded.file_id,
+        filename=uploaded.original_name,
+        sha256=document.sha256,
+        status=text.status,
+        page_count=text.page_count,
+        error=text.error,
+        created_at=document.created_at
+    )
+
 @router.post("/", response_model=CampaignResponse)
 async def create_campaign(
     campaign: CampaignCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     db_campaign = Campaign(
@@ -45,66 +115,181 @@ async def create_campaign(
         owner_id=current_user.id
     )
     db.add(db_campaign)
-    db.commit()
-    db.refresh(db_campaign)
+    await db.commit()
+    await db.refresh(db_campaign)
+    await db.refresh(db_campaign, ["campaign_notes"])
     return db_campaign
 
-@router.get("/", response_model=List[CampaignResponse])
+# Archives are a tar of NDJSON tables plus the referenced files; see
+# services.archive for the layout
+@router.post("/import", response_model=CampaignImportResponse, status_code=201)
+async def import_campaign(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        result = await archive.import_campaign(db, current_user.id, request.stream())
+        await db.commit()
+    except archive.ArchiveTooLarge as e:
+        await db.rollback()
+        raise HTTPException(status_code=413, detail=str(e))
+    except archive.ArchiveError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Archive contains conflicting or incomplete rows")
+    return result
+
+@router.get("/{campaign_id}/export")
+async def export_campaign(campaign: Campaign = Depends(owned_campaign)):
+    return StreamingResponse(
+        archive.export_campaign(campaign.id, campaign.owner_id),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": downloads.content_disposition("attachment", f"campaign-{campaign.id}.tar")}
+    )
+
+@router.get("/", response_model=List[CampaignListItem], response_model_exclude_unset=True)
 async def list_campaigns(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of: " + ", ".join(LIST_FIELDS)),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    campaigns = db.query(Campaign).filter(Campaign.owner_id == current_user.id).all()
-    return campaigns
+    selected = parse_fields(fields, LIST_FIELDS, LIST_FIELDS)
+    columns = {name: getattr(Campaign, name) for name in set(selected) | {"id"}}
+    query = paginate(
+        select(*columns.values()).where(Campaign.owner_id == current_user.id, live(Campaign)),
+        [Campaign.id], cursor, limit
+    )
+    rows = (await db.execute(query)).mappings().all()
+    rows = finish_page(rows, ["id"], limit, response, request.url)
+    return [{name: row[name] for name in selected} for row in rows]
 
 @router.get("/{campaign_id}", response_model=CampaignResponse)
 async def get_campaign(
     campaign_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    campaign = db.query(Campaign).filter(
+    async def load():
+        campaign = await get_owned(db, Campaign, campaign_id, current_user, undefer(Campaign.campaign_notes))
+        return response_cache.CacheEntry(body=response_cache.render(CampaignResponse, campaign), owner_id=current_user.id)
+    return await response_cache.cached(request, current_user, [response_cache.campaign_scope(campaign_id)], load)
+
+@router.get("/{campaign_id}/notes", response_model=CampaignNotes)
+async def get_campaign_notes(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = await db.execute(select(Campaign.id, Campaign.campaign_notes).where(
         Campaign.id == campaign_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not campaign:
+        Campaign.owner_id == current_user.id,
+        live(Campaign)
+    ))
+    row = result.first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    return campaign
+    return row
 
 @router.put("/{campaign_id}", response_model=CampaignResponse)
 async def update_campaign(
-    campaign_id: int,
     campaign_update: CampaignUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    campaign: Campaign = Depends(owned_campaign),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    campaign = db.query(Campaign).filter(
-        Campaign.id == campaign_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not campaign:
-        raise HTTPException(status_code=404, detail="Campaign not found")
-    
     for field, value in campaign_update.model_dump(exclude_unset=True).items():
         setattr(campaign, field, value)
     
-    db.commit()
-    db.refresh(campaign)
+    await db.commit()
+    await db.refresh(campaign)
+    await db.refresh(campaign, ["campaign_notes"])
     return campaign
 
-@router.delete("/{campaign_id}")
+@router.delete("/{campaign_id}", status_code=202)
 async def delete_campaign(
+    campaign: Campaign = Depends(owned_campaign),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Tombstone now; files, sessions and NPCs are removed by a background job
+    campaign.deleted_at = func.now()
+    job = await jobs.enqueue(db, deletion.JOB_KIND, target_id=campaign.id)
+    return {"message": "Campaign scheduled for deletion", "job_id": job.id}
+
+@router.post("/{campaign_id}/documents", response_model=DocumentResponse)
+async def attach_document(
     campaign_id: int,
-    db: Session = Depends(get_db),
+    attach: DocumentAttach,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    campaign = db.query(Campaign).filter(
-        Campaign.id == campaign_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not campaign:
-        raise HTTPException(status_code=404, detail="Campaign not found")
+    await get_owned(db, Campaign, campaign_id, current_user)
+    if Path(attach.file_id).suffix.lower() not in documents.DOCUMENT_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Only .pdf, .md and .txt files can be ingested")
+    uploaded = await find_upload(db, current_user.id, attach.file_id)
+    if not uploaded:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    document = await documents.attach_document(db, campaign_id, uploaded)
+    text = await db.get(DocumentText, document.sha256)
+    return document_response(document, uploaded, text)
+
+@router.get("/{campaign_id}/documents", response_model=List[DocumentResponse])
+async def list_documents(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    await get_owned(db, Campaign, campaign_id, current_user)
+    result = await db.execute(
+        select(CampaignDocument, UploadedFile, DocumentText)
+        .join(UploadedFile, CampaignDocument.uploaded_file_id == UploadedFile.id)
+        .join(DocumentText, CampaignDocument.sha256 == DocumentText.sha256)
+        .where(CampaignDocument.campaign_id == campaign_id)
+        .order_by(CampaignDocument.created_at)
+    )
+    return [document_response(*row) for row in result.all()]
+
+@router.get("/{campaign_id}/documents/{document_id}/pages", response_model=List[DocumentPage])
+async def list_document_pages(
+    campaign_id: int,
+    document_id: int,
+    start: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    await get_owned(db, Campaign, campaign_id, current_user)
+    document = await db.get(CampaignDocument, document_id)
+    if not document or document.campaign_id != campaign_id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    result = await db.execute(
+        select(DocumentChunk)
+        .where(DocumentChunk.sha256 == document.sha256, DocumentChunk.page_number >= start)
+        .order_by(DocumentChunk.page_number)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+@router.delete("/{campaign_id}/documents/{document_id}")
+async def detach_document(
+    campaign_id: int,
+    document_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    await get_owned(db, Campaign, campaign_id, current_user)
+    document = await db.get(CampaignDocument, document_id)
+    if not document or document.campaign_id != campaign_id:
+        raise HTTPException(status_code=404, detail="Document not found")
     
-    db.delete(campaign)
-    db.commit()
-    return {"message": "Campaign deleted successfully"}
\ No newline at end of file
+    await db.delete(document)
+    await db.commit()
+    return {"message": "Document removed from campaign"}
@@ -0,0 +1,87 @@
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, WebSocketException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..models.campaign import Campaign
+from ..models.user import User
+from ..routers.auth import get_stream_user
+from ..dependencies import get_owned
+from ..services import changefeed
+
+router = APIRouter()
+
+# Change feed for one campaign. Events look like
+#   {"type": "change", "entity": "npc", "action": "created", "id": 7, "campaign_id": 1, "session_id": 3}
+# plus {"type": "resync"} when the client fell behind and should refetch, and
+# periodic pings so proxies keep the connection open.
+
+async def _subscribe(db: AsyncSession, campaign_id: int, current_user: User) -> changefeed.Subscription:
+    await get_owned(db, Campaign, campaign_id, current_user)
+    # Streams live for hours; don't hold a pooled connection for all of that
+    await db.close()
+    return await changefeed.get_broker().subscribe(campaign_id)
+
+@router.get("/{campaign_id}/events")
+async def campaign_events(
+    campaign_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_stream_user)
+):
+    subscription = await _subscribe(db, campaign_id, current_user)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.get()
+                if event is changefeed.PING:
+                    yield ": ping\n\n"
+                else:
+                    yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            changefeed.get_broker().unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/{campaign_id}/ws")
+async def campaign_events_ws(
+    websocket: WebSocket,
+    campaign_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_stream_user)
+):
+    try:
+        subscription = await _subscribe(db, campaign_id, current_user)
+    except HTTPException as exc:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=exc.detail)
+    await websocket.accept()
+
+    async def receive():
+        # Clients have nothing to say; reading notices when they hang up
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while True:
+            getter = asyncio.create_task(subscription.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                break
+            await websocket.send_json(getter.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        changefeed.get_broker().unsubscribe(subscription)
@@ -1,14 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+import json
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+from typing import List, Optional
+from datetime import datetime
+from ..database import get_async_db
 from ..models.npc import NPC
 from ..models.session import Session as SessionModel
-from ..models.campaign import Campaign
 from ..models.user import User
 from ..routers.auth import get_current_user
+from ..dependencies import get_owned, live, owned_npc, rate_limited
+from ..services import bulk, npc_generation, prompt_context, rate_limits, response_cache, vector_index
+from ..services.bulk import BulkItemError, BulkItemResult, BulkResponse
+from ..services.pagination import DEFAULT_LIMIT, MAX_LIMIT, finish_page, paginate, parse_fields
 from pydantic import BaseModel
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 class NPCCreate(BaseModel):
@@ -22,6 +35,14 @@ class NPCCreate(BaseModel):
     relationship_to_campaign: str = None
     generated_parameters: str = None
 
+class NPCGenerate(BaseModel):
+    session_id: int
+    name: str = None
+    role: str = None
+    personality_traits: str = None
+    relationship_to_campaign: str = None
+    instructions: str = None
+
 class NPCUpdate(BaseModel):
     name: str = None
     role: str = None
@@ -32,42 +53,67 @@ class NPCUpdate(BaseModel):
     relationship_to_campaign: str = None
     integration_status: str = None
 
+class NPCBulkUpdate(NPCUpdate):
+    id: int
+
 class NPCResponse(BaseModel):
     id: int
     session_id: int
     name: str
-    role: str = None
-    appearance: str = None
-    personality_traits: str = None
-    backstory: str = None
-    relevant_skills_stats: str = None
-    relationship_to_campaign: str = None
-    integration_status: str
-    ai_generated: bool
-    created_at: str
+    role: Optional[str] = None
+    appearance: Optional[str] = None
+    personality_traits: Optional[str] = None
+    backstory: Optional[str] = None
+    relevant_skills_stats: Optional[str] = None
+    relationship_to_campaign: Optional[str] = None
+    integration_status: Optional[str] = None
+    ai_generated: Optional[bool] = None
+    created_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
-async def verify_session_access(session_id: int, current_user: User, db: Session):
-    session = db.query(SessionModel).join(Campaign).filter(
-        SessionModel.id == session_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    return session
+# The backstory is never part of a list row; use GET /{id}/backstory
+LIST_FIELDS = [
+    "id", "session_id", "name", "role", "appearance", "personality_traits",
+    "relevant_skills_stats", "relationship_to_campaign", "integration_status",
+    "ai_generated", "created_at", "updated_at"
+]
+DEFAULT_LIST_FIELDS = LIST_FIELDS[:-1]
+
+class NPCListItem(BaseModel):
+    id: Optional[int] = None
+    session_id: Optional[int] = None
+    name: Optional[str] = None
+    role: Optional[str] = None
+    appearance: Optional[str] = None
+    personality_traits: Optional[str] = None
+    relevant_skills_stats: Optional[str] = None
+    relationship_to_campaign: Optional[str] = None
+    integration_status: Optional[str] = None
+    ai_generated: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class NPCBackstory(BaseModel):
+    id: int
+    backstory: Optional[str] = None
+
+    class Config:
+        from_attributes = True
 
 @router.post("/", response_model=NPCResponse)
 async def create_npc(
     npc: NPCCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    await verify_session_access(npc.session_id, current_user, db)
+    session = await get_owned(db, SessionModel, npc.session_id, current_user)
     
     db_npc = NPC(
-        session_id=npc.session_id,
+        session_id=session.id,
+        campaign_id=session.campaign_id,
+        owner_id=session.owner_id,
         name=npc.name,
         role=npc.role,
         appearance=npc.appearance,
@@ -78,69 +124,246 @@ async def create_npc(
         generated_parameters=npc.generated_parameters
     )
     db.add(db_npc)
-    db.commit()
-    db.refresh(db_npc)
+    await db.commit()
+    await db.refresh(db_npc)
+    await db.refresh(db_npc, ["backstory"])
     return db_npc
 
-@router.get("/session/{session_id}", response_model=List[NPCResponse])
+# Streams the NPC as server-sent events while the model writes it:
+#   {"type": "field", "field": "name", "text": "Mira"} for each piece of text,
+# then {"type": "npc", "npc": {...}} once it is saved, or {"type": "error", ...}.
+# Closing the stream abandons the draft: generation stops and nothing is saved.
+@router.post("/generate", dependencies=[Depends(rate_limited("ai"))])
+async def generate_npc(
+    generation: NPCGenerate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    session = await get_owned(db, SessionModel, generation.session_id, current_user)
+    slot = await rate_limits.acquire(current_user, "generation")
+    try:
+        parameters = generation.model_dump(exclude={"session_id"}, exclude_none=True)
+        context = await prompt_context.build(db, session.campaign_id, session.id)
+        prompt = npc_generation.build_prompt(context, parameters)
+        # The model takes a while; don't hold a pooled connection meanwhile
+        await db.close()
+    except BaseException:
+        await slot.release()
+        raise
+
+    def event(data: dict) -> str:
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def stream():
+        parser = npc_generation.SectionParser()
+        try:
+            async for field, text in npc_generation.stream_fields(prompt, parser):
+                yield event({"type": "field", "field": field, "text": text})
+        except Exception:
+            logger.exception("NPC generation failed for session %s", session.id)
+            yield event({"type": "error", "detail": "Generation failed"})
+            return
+
+        npc = npc_generation.build_npc(session, parser.values, parameters)
+        db.add(npc)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # The session or campaign was deleted while the model was writing
+            await db.rollback()
+            yield event({"type": "error", "detail": "Session not found"})
+            return
+        await db.refresh(npc)
+        await db.refresh(npc, ["backstory"])
+        yield event({"type": "npc", "npc": NPCResponse.model_validate(npc).model_dump(mode="json")})
+
+    # The slot is released once the stream ends, finished or abandoned
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(slot.release)
+    )
+
+# Bulk endpoints take {"items": [...]} or an NDJSON stream (see services.bulk);
+# valid items are written in one transaction and bad ones reported by index
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_create_npcs(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = BulkResponse()
+    campaign_ids = {}  # session_id -> campaign_id, or None if not the caller's
+    async for batch in bulk.iter_batches(request, NPCCreate, result):
+        unknown = {item.session_id for _, item in batch} - campaign_ids.keys()
+        if unknown:
+            rows = await db.execute(select(SessionModel.id, SessionModel.campaign_id).where(
+                SessionModel.id.in_(unknown),
+                SessionModel.owner_id == current_user.id,
+                live(SessionModel)
+            ))
+            campaign_ids.update(dict.fromkeys(unknown))
+            campaign_ids.update({row.id: row.campaign_id for row in rows})
+        
+        accepted = []
+        for index, item in batch:
+            if campaign_ids[item.session_id] is None:
+                result.errors.append(BulkItemError(index=index, detail="Session not found"))
+                continue
+            values = item.model_dump()
+            values.update(campaign_id=campaign_ids[item.session_id], owner_id=current_user.id)
+            accepted.append((index, values))
+        if not accepted:
+            continue
+        
+        try:
+            new_ids = (await db.scalars(
+                insert(NPC).returning(NPC.id, sort_by_parameter_order=True),
+                [values for _, values in accepted]
+            )).all()
+        except IntegrityError:
+            # A session was deleted after the ownership check
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Sessions changed concurrently; retry the import")
+        result.succeeded.extend(
+            BulkItemResult(index=index, id=npc_id) for (index, _), npc_id in zip(accepted, new_ids)
+        )
+        vector_index.queue_refresh(db, "npc", new_ids)
+    
+    await db.commit()
+    result.errors.sort(key=lambda error: error.index)
+    return result
+
+@router.patch("/bulk", response_model=BulkResponse)
+async def bulk_update_npcs(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = BulkResponse()
+    async for batch in bulk.iter_batches(request, NPCBulkUpdate, result):
+        owned = set((await db.scalars(select(NPC.id).where(
+            NPC.id.in_({item.id for _, item in batch}),
+            NPC.owner_id == current_user.id,
+            live(NPC)
+        ))).all())
+        
+        changes, reindex = [], set()
+        for index, item in batch:
+            if item.id not in owned:
+                result.errors.append(BulkItemError(index=index, detail="NPC not found"))
+                continue
+            values = item.model_dump(exclude_unset=True)
+            if len(values) > 1:
+                changes.append(values)
+            if not set(values).isdisjoint(vector_index.NPC_FIELDS):
+                reindex.add(item.id)
+            result.succeeded.append(BulkItemResult(index=index, id=item.id))
+        if changes:
+            # ORM bulk UPDATE by primary key: one executemany per set of columns
+            await db.execute(update(NPC), changes)
+        vector_index.queue_refresh(db, "npc", reindex)
+    
+    await db.commit()
+    result.errors.sort(key=lambda error: error.index)
+    return result
+
+@router.delete("/bulk", response_model=BulkResponse)
+async def bulk_delete_npcs(
+    ids: str = Query(..., description="Comma-separated NPC ids"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    requested = bulk.parse_ids(ids)
+    owned = set((await db.scalars(select(NPC.id).where(
+        NPC.id.in_(requested),
+        NPC.owner_id == current_user.id,
+        live(NPC)
+    ))).all())
+    
+    if owned:
+        await db.execute(delete(NPC).where(NPC.id.in_(owned)))
+        await vector_index.drop_sources(db, "npc", owned)
+        await db.commit()
+    return BulkResponse(
+        succeeded=[BulkItemResult(index=i, id=npc_id) for i, npc_id in enumerate(requested) if npc_id in owned],
+        errors=[BulkItemError(index=i, detail="NPC not found") for i, npc_id in enumerate(requested) if npc_id not in owned]
+    )
+
+@router.get("/session/{session_id}", response_model=List[NPCListItem], response_model_exclude_unset=True)
 async def list_npcs(
     session_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of: " + ", ".join(LIST_FIELDS)),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    await verify_session_access(session_id, current_user, db)
-    
-    npcs = db.query(NPC).filter(NPC.session_id == session_id).all()
-    return npcs
+    async def load():
+        session = await get_owned(db, SessionModel, session_id, current_user)
+        
+        selected = parse_fields(fields, LIST_FIELDS, DEFAULT_LIST_FIELDS)
+        columns = {name: getattr(NPC, name) for name in set(selected) | {"id"}}
+        query = paginate(
+            select(*columns.values()).where(NPC.session_id == session_id),
+            [NPC.id], cursor, limit
+        )
+        rows = (await db.execute(query)).mappings().all()
+        rows = finish_page(rows, ["id"], limit, response, request.url)
+        return response_cache.CacheEntry(
+            body=response_cache.render(List[NPCListItem], [{name: row[name] for name in selected} for row in rows], exclude_unset=True),
+            owner_id=current_user.id,
+            headers=dict(response.headers),
+            depends_on=[response_cache.campaign_scope(session.campaign_id)]
+        )
+    return await response_cache.cached(request, current_user, [response_cache.npcs_scope(session_id)], load)
 
 @router.get("/{npc_id}", response_model=NPCResponse)
 async def get_npc(
     npc_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    npc = db.query(NPC).join(SessionModel).join(Campaign).filter(
+    return await get_owned(db, NPC, npc_id, current_user, undefer(NPC.backstory))
+
+@router.get("/{npc_id}/backstory", response_model=NPCBackstory)
+async def get_npc_backstory(
+    npc_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = await db.execute(select(NPC.id, NPC.backstory).where(
         NPC.id == npc_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not npc:
+        NPC.owner_id == current_user.id,
+        live(NPC)
+    ))
+    row = result.first()
+    if row is None:
         raise HTTPException(status_code=404, detail="NPC not found")
-    return npc
+    return row
 
 @router.put("/{npc_id}", response_model=NPCResponse)
 async def update_npc(
-    npc_id: int,
     npc_update: NPCUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    npc: NPC = Depends(owned_npc),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    npc = db.query(NPC).join(SessionModel).join(Campaign).filter(
-        NPC.id == npc_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not npc:
-        raise HTTPException(status_code=404, detail="NPC not found")
-    
     for field, value in npc_update.model_dump(exclude_unset=True).items():
         setattr(npc, field, value)
     
-    db.commit()
-    db.refresh(npc)
+    await db.commit()
+    await db.refresh(npc)
+    await db.refresh(npc, ["backstory"])
     return npc
 
 @router.delete("/{npc_id}")
 async def delete_npc(
-    npc_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    npc: NPC = Depends(owned_npc),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    npc = db.query(NPC).join(SessionModel).join(Campaign).filter(
-        NPC.id == npc_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not npc:
-        raise HTTPException(status_code=404, detail="NPC not found")
-    
-    db.delete(npc)
-    db.commit()
+    await db.delete(npc)
+    await db.commit()
     return {"message": "NPC deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Sequence
+from ..database import get_async_db
+from ..models.campaign import Campaign
+from ..models.user import User
+from ..routers.auth import get_current_user
+from ..dependencies import get_owned
+from ..services import search as search_service, vector_index
+from pydantic import BaseModel
+
+router = APIRouter()
+
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    campaign_id: int
+    title: Optional[str] = None
+    rank: float
+    snippet: Optional[str] = None
+
+class LoreResult(BaseModel):
+    source_type: str
+    source_id: int
+    chunk_index: int
+    text: str
+    score: float
+
+def parse_kinds(value: Optional[str], allowed: Sequence[str], name: str) -> Optional[List[str]]:
+    # None means every kind; anything unknown or an empty list is a client error
+    if value is None:
+        return None
+    kinds = [kind.strip() for kind in value.split(",") if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown {name}: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+    if not kinds:
+        raise HTTPException(status_code=400, detail=f"No {name} given")
+    return kinds
+
+@router.get("/", response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    campaign_id: Optional[int] = None,
+    types: Optional[str] = Query(None, description="Comma separated: campaign, session, npc"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    kinds = parse_kinds(types, search_service.SEARCH_TYPES, "types")
+    return await search_service.search(
+        db, current_user.id, q, types=kinds, campaign_id=campaign_id, limit=limit
+    )
+
+
+@router.get("/lore", response_model=List[LoreResult])
+async def search_lore(
+    campaign_id: int,
+    q: str = Query(..., min_length=1, max_length=2000),
+    k: int = Query(5, ge=1, le=50),
+    sources: Optional[str] = Query(None, description="Comma separated: campaign, session, npc"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    await get_owned(db, Campaign, campaign_id, current_user)
+    source_types = parse_kinds(sources, vector_index.SOURCE_TYPES, "sources")
+    return await vector_index.search(db, campaign_id, q, k=k, source_types=source_types)
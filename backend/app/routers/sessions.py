@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
-from ..database import get_db
+from ..database import get_async_db
 from ..models.session import Session as SessionModel, SessionStatus
 from ..models.campaign import Campaign
 from ..models.user import User
 from ..routers.auth import get_current_user
+from ..dependencies import get_owned, live, owned_session, rate_limited
+from ..models.npc import NPC
+from ..services import bulk, jobs, rate_limits, recaps, response_cache, transcription, vector_index
+from ..services.bulk import BulkItemError, BulkItemResult, BulkResponse
+from ..services.pagination import DEFAULT_LIMIT, MAX_LIMIT, finish_page, paginate, parse_fields
+from ..services.uploads import find_upload
 from pydantic import BaseModel
+from pathlib import Path
 
 router = APIRouter()
 
@@ -25,110 +34,350 @@ class SessionUpdate(BaseModel):
     actual_date: Optional[datetime] = None
     recap: str = None
 
+class SessionBulkUpdate(SessionUpdate):
+    id: int
+
 class SessionResponse(BaseModel):
     id: int
     campaign_id: int
     session_number: int
-    name: str = None
-    preparation_notes: str = None
+    name: Optional[str] = None
+    preparation_notes: Optional[str] = None
     status: SessionStatus
     scheduled_date: Optional[datetime] = None
     actual_date: Optional[datetime] = None
-    recap: str = None
-    created_at: str
+    recap: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# The transcript is never part of a list row; use GET /{id}/transcript
+LIST_FIELDS = [
+    "id", "campaign_id", "session_number", "name", "preparation_notes", "status",
+    "scheduled_date", "actual_date", "recap", "created_at", "updated_at"
+]
+DEFAULT_LIST_FIELDS = LIST_FIELDS[:-1]
+
+class SessionListItem(BaseModel):
+    id: Optional[int] = None
+    campaign_id: Optional[int] = None
+    session_number: Optional[int] = None
+    name: Optional[str] = None
+    preparation_notes: Optional[str] = None
+    status: Optional[SessionStatus] = None
+    scheduled_date: Optional[datetime] = None
+    actual_date: Optional[datetime] = None
+    recap: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class SessionTranscript(BaseModel):
+    id: int
+    transcript: Optional[str] = None
 
     class Config:
         from_attributes = True
 
-async def verify_campaign_access(campaign_id: int, current_user: User, db: Session):
-    campaign = db.query(Campaign).filter(
-        Campaign.id == campaign_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not campaign:
-        raise HTTPException(status_code=404, detail="Campaign not found")
-    return campaign
+class TranscriptionRequest(BaseModel):
+    file_id: Optional[str] = None  # uploaded recording; defaults to the session's current one
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: int
+    total: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
 
 @router.post("/", response_model=SessionResponse)
 async def create_session(
     session: SessionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    await verify_campaign_access(session.campaign_id, current_user, db)
+    await get_owned(db, Campaign, session.campaign_id, current_user)
     
     db_session = SessionModel(
         campaign_id=session.campaign_id,
+        owner_id=current_user.id,
         session_number=session.session_number,
         name=session.name,
         scheduled_date=session.scheduled_date
     )
     db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Session number already exists in this campaign")
+    await db.refresh(db_session)
     return db_session
 
-@router.get("/campaign/{campaign_id}", response_model=List[SessionResponse])
+# Bulk endpoints take {"items": [...]} or an NDJSON stream (see services.bulk);
+# valid items are written in one transaction and bad ones reported by index
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_create_sessions(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = BulkResponse()
+    owned = {}  # campaign_id -> whether it is the caller's
+    async for batch in bulk.iter_batches(request, SessionCreate, result):
+        unknown = {item.campaign_id for _, item in batch} - owned.keys()
+        if unknown:
+            mine = set((await db.scalars(select(Campaign.id).where(
+                Campaign.id.in_(unknown),
+                Campaign.owner_id == current_user.id,
+                live(Campaign)
+            ))).all())
+            owned.update({campaign_id: campaign_id in mine for campaign_id in unknown})
+        
+        # Report duplicate session numbers per item instead of letting the
+        # unique index abort the whole transaction
+        taken = set((await db.execute(select(SessionModel.campaign_id, SessionModel.session_number).where(
+            SessionModel.campaign_id.in_({item.campaign_id for _, item in batch}),
+            SessionModel.session_number.in_({item.session_number for _, item in batch})
+        ))).all())
+        
+        accepted = []
+        for index, item in batch:
+            key = (item.campaign_id, item.session_number)
+            if not owned[item.campaign_id]:
+                result.errors.append(BulkItemError(index=index, detail="Campaign not found"))
+            elif key in taken:
+                result.errors.append(BulkItemError(index=index, detail="Session number already exists in this campaign"))
+            else:
+                taken.add(key)
+                accepted.append((index, {**item.model_dump(), "owner_id": current_user.id}))
+        if not accepted:
+            continue
+        
+        try:
+            new_ids = (await db.scalars(
+                insert(SessionModel).returning(SessionModel.id, sort_by_parameter_order=True),
+                [values for _, values in accepted]
+            )).all()
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Session numbers changed concurrently; retry the import")
+        result.succeeded.extend(
+            BulkItemResult(index=index, id=session_id) for (index, _), session_id in zip(accepted, new_ids)
+        )
+    
+    await db.commit()
+    result.errors.sort(key=lambda error: error.index)
+    return result
+
+@router.patch("/bulk", response_model=BulkResponse)
+async def bulk_update_sessions(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = BulkResponse()
+    async for batch in bulk.iter_batches(request, SessionBulkUpdate, result):
+        owned = set((await db.scalars(select(SessionModel.id).where(
+            SessionModel.id.in_({item.id for _, item in batch}),
+            SessionModel.owner_id == current_user.id,
+            live(SessionModel)
+        ))).all())
+        
+        changes, reindex = [], set()
+        for index, item in batch:
+            if item.id not in owned:
+                result.errors.append(BulkItemError(index=index, detail="Session not found"))
+                continue
+            values = item.model_dump(exclude_unset=True)
+            if len(values) > 1:
+                changes.append(values)
+            if not set(values).isdisjoint(vector_index.SESSION_FIELDS):
+                reindex.add(item.id)
+            result.succeeded.append(BulkItemResult(index=index, id=item.id))
+        if changes:
+            # ORM bulk UPDATE by primary key: one executemany per set of columns
+            await db.execute(update(SessionModel), changes)
+        vector_index.queue_refresh(db, "session", reindex)
+    
+    await db.commit()
+    result.errors.sort(key=lambda error: error.index)
+    return result
+
+@router.delete("/bulk", response_model=BulkResponse)
+async def bulk_delete_sessions(
+    ids: str = Query(..., description="Comma-separated session ids"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    requested = bulk.parse_ids(ids)
+    owned = set((await db.scalars(select(SessionModel.id).where(
+        SessionModel.id.in_(requested),
+        SessionModel.owner_id == current_user.id,
+        live(SessionModel)
+    ))).all())
+    
+    if owned:
+        # NPCs go with their session (ON DELETE CASCADE); their embeddings don't
+        npc_ids = (await db.scalars(select(NPC.id).where(NPC.session_id.in_(owned)))).all()
+        await db.execute(delete(SessionModel).where(SessionModel.id.in_(owned)))
+        await vector_index.drop_sources(db, "npc", npc_ids)
+        await vector_index.drop_sources(db, "session", owned)
+        await db.commit()
+    return BulkResponse(
+        succeeded=[BulkItemResult(index=i, id=session_id) for i, session_id in enumerate(requested) if session_id in owned],
+        errors=[BulkItemError(index=i, detail="Session not found") for i, session_id in enumerate(requested) if session_id not in owned]
+    )
+
+@router.get("/campaign/{campaign_id}", response_model=List[SessionListItem], response_model_exclude_unset=True)
 async def list_sessions(
     campaign_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of: " + ", ".join(LIST_FIELDS)),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    await verify_campaign_access(campaign_id, current_user, db)
-    
-    sessions = db.query(SessionModel).filter(
-        SessionModel.campaign_id == campaign_id
-    ).order_by(SessionModel.session_number).all()
-    return sessions
+    async def load():
+        await get_owned(db, Campaign, campaign_id, current_user)
+        
+        selected = parse_fields(fields, LIST_FIELDS, DEFAULT_LIST_FIELDS)
+        columns = {name: getattr(SessionModel, name) for name in set(selected) | {"session_number", "id"}}
+        query = paginate(
+            select(*columns.values()).where(SessionModel.campaign_id == campaign_id),
+            [SessionModel.session_number, SessionModel.id], cursor, limit
+        )
+        rows = (await db.execute(query)).mappings().all()
+        rows = finish_page(rows, ["session_number", "id"], limit, response, request.url)
+        return response_cache.CacheEntry(
+            body=response_cache.render(List[SessionListItem], [{name: row[name] for name in selected} for row in rows], exclude_unset=True),
+            owner_id=current_user.id,
+            headers=dict(response.headers)
+        )
+    scopes = [response_cache.sessions_scope(campaign_id), response_cache.campaign_scope(campaign_id)]
+    return await response_cache.cached(request, current_user, scopes, load)
 
 @router.get("/{session_id}", response_model=SessionResponse)
-async def get_session(
+async def get_session(session: SessionModel = Depends(owned_session)):
+    return session
+
+@router.get("/{session_id}/transcript", response_model=SessionTranscript)
+async def get_session_transcript(
     session_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    session = db.query(SessionModel).join(Campaign).filter(
+    result = await db.execute(select(SessionModel.id, SessionModel.transcript).where(
         SessionModel.id == session_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not session:
+        SessionModel.owner_id == current_user.id,
+        live(SessionModel)
+    ))
+    row = result.first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    return row
 
 @router.put("/{session_id}", response_model=SessionResponse)
 async def update_session(
-    session_id: int,
     session_update: SessionUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    session: SessionModel = Depends(owned_session),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    session = db.query(SessionModel).join(Campaign).filter(
-        SessionModel.id == session_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
     for field, value in session_update.model_dump(exclude_unset=True).items():
         setattr(session, field, value)
     
-    db.commit()
-    db.refresh(session)
+    await db.commit()
+    await db.refresh(session)
     return session
 
 @router.delete("/{session_id}")
 async def delete_session(
+    session: SessionModel = Depends(owned_session),
+    db: AsyncSession = Depends(get_async_db)
+):
+    npc_ids = (await db.scalars(select(NPC.id).where(NPC.session_id == session.id))).all()
+    await db.delete(session)
+    await vector_index.drop_sources(db, "npc", npc_ids)
+    await db.commit()
+    return {"message": "Session deleted successfully"}
+
+@router.post("/{session_id}/transcription", response_model=JobResponse, status_code=202, dependencies=[Depends(rate_limited("ai"))])
+async def start_transcription(
+    request: TranscriptionRequest,
+    session: SessionModel = Depends(owned_session),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    file_id = request.file_id or session.audio_recording_path
+    if not file_id:
+        raise HTTPException(status_code=400, detail="Session has no audio recording")
+    if Path(file_id).suffix.lower() not in transcription.AUDIO_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Recording must be an .mp3 or .wav file")
+    if not await find_upload(db, current_user.id, file_id):
+        raise HTTPException(status_code=404, detail="Recording not found")
+    
+    await rate_limits.lock_jobs(db, current_user)
+    job = await jobs.latest_job(db, transcription.JOB_KIND, session.id)
+    if job and job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="Transcription already in progress")
+    await rate_limits.check_jobs(db, current_user, transcription.JOB_KIND)
+    
+    # Committed together with the job, which releases the job lock
+    session.audio_recording_path = file_id
+    session.transcript = None
+    return await jobs.enqueue(db, transcription.JOB_KIND, target_id=session.id)
+
+@router.get("/{session_id}/transcription", response_model=JobResponse)
+async def get_transcription_status(
+    session: SessionModel = Depends(owned_session),
+    db: AsyncSession = Depends(get_async_db)
+):
+    job = await jobs.latest_job(db, transcription.JOB_KIND, session.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No transcription for this session")
+    return job
+
+
+@router.post("/{session_id}/recap/generation", response_model=JobResponse, status_code=202, dependencies=[Depends(rate_limited("ai"))])
+async def start_recap_generation(
     session_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    session = db.query(SessionModel).join(Campaign).filter(
+    # Only asks whether there is a transcript; it can run to megabytes
+    has_transcript = SessionModel.transcript.is_not(None) & (SessionModel.transcript != "")
+    result = await db.execute(select(has_transcript.label("has_transcript")).where(
         SessionModel.id == session_id,
-        Campaign.owner_id == current_user.id
-    ).first()
-    if not session:
+        SessionModel.owner_id == current_user.id,
+        live(SessionModel)
+    ))
+    row = result.first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Session not found")
+    if not row.has_transcript:
+        raise HTTPException(status_code=400, detail="Session has no transcript")
     
-    db.delete(session)
-    db.commit()
-    return {"message": "Session deleted successfully"}
\ No newline at end of file
+    await rate_limits.lock_jobs(db, current_user)
+    job = await jobs.latest_job(db, recaps.JOB_KIND, session_id)
+    if job and job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="Recap generation already in progress")
+    await rate_limits.check_jobs(db, current_user, recaps.JOB_KIND)
+    return await jobs.enqueue(db, recaps.JOB_KIND, target_id=session_id)
+
+@router.get("/{session_id}/recap/generation", response_model=JobResponse)
+async def get_recap_generation_status(
+    session: SessionModel = Depends(owned_session),
+    db: AsyncSession = Depends(get_async_db)
+):
+    job = await jobs.latest_job(db, recaps.JOB_KIND, session.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No recap generation for this session")
+    return job
@@ -1,92 +1,334 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Query
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pathlib import Path
+from pydantic import BaseModel
+from typing import Optional
+import hashlib
 import os
 import uuid
-from ..database import get_db
+from ..database import get_async_db
+from ..models.campaign import Campaign
 from ..models.user import User
+from ..models.upload import UploadedFile
 from ..routers.auth import get_current_user
+from ..dependencies import get_owned
 from ..config import settings
+from ..services import documents, downloads, uploads as upload_service
+from ..services.storage import get_storage, staging_dir
 
 router = APIRouter()
 
 ALLOWED_EXTENSIONS = {'.pdf', '.mp3', '.wav', '.txt', '.md'}
 MAX_FILE_SIZE = settings.max_file_size
+MAX_RESUMABLE_FILE_SIZE = settings.max_resumable_file_size
 
-async def validate_file(file: UploadFile):
-    if not file.filename:
+SORT_COLUMNS = {
+    "created_at": UploadedFile.created_at,
+    "name": UploadedFile.original_name,
+    "size": UploadedFile.size,
+}
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    campaign_id: Optional[int] = None
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    offset: int
+    campaign_id: Optional[int] = None
+
+def file_too_large(max_size: int = MAX_FILE_SIZE):
+    return HTTPException(
+        status_code=413, 
+        detail=f"File too large. Maximum size: {max_size} bytes"
+    )
+
+def validate_filename(filename: str):
+    if not filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    file_extension = Path(file.filename).suffix.lower()
+    file_extension = Path(filename).suffix.lower()
     if file_extension not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400, 
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
+
+async def validate_file(file: UploadFile):
+    validate_filename(file.filename)
     
     if file.size and file.size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413, 
-            detail=f"File too large. Maximum size: {MAX_FILE_SIZE} bytes"
-        )
+        raise file_too_large()
+
+def parse_upload_id(upload_id: str) -> str:
+    try:
+        return str(uuid.UUID(upload_id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+def upload_response(uploaded: UploadedFile):
+    local_path = get_storage().local_path(uploaded.sha256)
+    return {
+        "filename": uploaded.original_name,
+        "file_id": uploaded.file_id,
+        "file_path": str(local_path) if local_path else None,
+        "file_size": uploaded.size,
+        "sha256": uploaded.sha256,
+        "content_type": uploaded.content_type,
+        "campaign_id": uploaded.campaign_id,
+        "created_at": uploaded.created_at.timestamp() if uploaded.created_at else None
+    }
+
+async def attach_to_campaign(db: AsyncSession, uploaded: UploadedFile):
+    # Documents uploaded into a campaign are queued for text extraction
+    if uploaded.campaign_id is None:
+        return
+    if Path(uploaded.original_name).suffix.lower() in documents.DOCUMENT_EXTENSIONS:
+        await documents.attach_document(db, uploaded.campaign_id, uploaded)
 
 @router.post("/file")
 async def upload_file(
     file: UploadFile = File(...),
+    campaign_id: Optional[int] = Form(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     await validate_file(file)
-    
-    # Create upload directory if it doesn't exist
-    upload_dir = Path(settings.upload_folder) / str(current_user.id)
-    upload_dir.mkdir(parents=True, exist_ok=True)
+    if campaign_id is not None:
+        await get_owned(db, Campaign, campaign_id, current_user)
     
     # Generate unique filename
     file_extension = Path(file.filename).suffix
     unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = upload_dir / unique_filename
+    staged_path = staging_dir() / f"{unique_filename}.part"
     
-    # Save file
+    # Stream to disk in fixed-size chunks, hashing as we go
+    hasher = hashlib.sha256()
     try:
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        file_size = await upload_service.write_stream(
+            upload_service.iter_upload_file(file), staged_path, MAX_FILE_SIZE, hasher=hasher
+        )
+        uploaded = await upload_service.register_upload(
+            db, current_user.id, unique_filename, file.filename,
+            staged_path, hasher.hexdigest(), file_size, campaign_id=campaign_id
+        )
+    except upload_service.UploadTooLarge:
+        await upload_service.remove_quietly(staged_path)
+        raise file_too_large()
     except Exception as e:
+        await upload_service.remove_quietly(staged_path)
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
-    return {
-        "filename": file.filename,
-        "file_id": unique_filename,
-        "file_path": str(file_path),
-        "file_size": len(content)
-    }
+    await attach_to_campaign(db, uploaded)
+    return upload_response(uploaded)
+
+@router.get("/files/by-hash/{sha256}")
+async def find_file_by_hash(
+    sha256: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Lets clients skip re-uploading content they already stored
+    result = await db.execute(
+        select(UploadedFile).where(
+            UploadedFile.owner_id == current_user.id,
+            UploadedFile.sha256 == sha256.lower()
+        ).limit(1)
+    )
+    uploaded = result.scalar_one_or_none()
+    if not uploaded:
+        raise HTTPException(status_code=404, detail="File not found")
+    return upload_response(uploaded)
+
+@router.post("/sessions", response_model=UploadSessionResponse)
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    validate_filename(upload.filename)
+    if upload.campaign_id is not None:
+        await get_owned(db, Campaign, upload.campaign_id, current_user)
+    if upload.size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be positive")
+    if upload.size > MAX_RESUMABLE_FILE_SIZE:
+        raise file_too_large(MAX_RESUMABLE_FILE_SIZE)
+    
+    return await upload_service.create_upload_session(
+        current_user.id, str(uuid.uuid4()), upload.filename, upload.size,
+        campaign_id=upload.campaign_id
+    )
 
-@router.get("/file/{file_id}")
+@router.get("/sessions/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    upload_id = parse_upload_id(upload_id)
+    meta = await upload_service.get_upload_session(current_user.id, upload_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return meta
+
+@router.put("/sessions/{upload_id}", response_model=UploadSessionResponse)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    # The request body is appended at `offset`; clients resume by asking
+    # GET /sessions/{upload_id} for the current offset and sending the rest.
+    upload_id = parse_upload_id(upload_id)
+    meta = await upload_service.get_upload_session(current_user.id, upload_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    try:
+        meta["offset"] = await upload_service.append_to_upload_session(
+            current_user.id, upload_id, meta, offset, request.stream()
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except upload_service.UploadBusy:
+        raise HTTPException(
+            status_code=409,
+            detail="Another chunk is being written to this upload",
+            headers={"Retry-After": "1"}
+        )
+    except upload_service.UploadOffsetMismatch as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Offset mismatch, resume from {e.expected}",
+            headers={"Upload-Offset": str(e.expected)}
+        )
+    except upload_service.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Chunk exceeds declared upload size")
+    return meta
+
+@router.post("/sessions/{upload_id}/complete")
+async def complete_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    upload_id = parse_upload_id(upload_id)
+    # Holds the same lock as chunk writes, so a retried complete waits its
+    # turn and then finds the session gone instead of hashing a moved file
+    try:
+        async with upload_service.locked_upload_session(current_user.id, upload_id) as meta:
+            if not meta:
+                raise HTTPException(status_code=404, detail="Upload not found")
+            if meta["offset"] != meta["size"]:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Upload incomplete: {meta['offset']} of {meta['size']} bytes received",
+                    headers={"Upload-Offset": str(meta["offset"])}
+                )
+            # The campaign may have been deleted since the session was opened
+            if meta.get("campaign_id") is not None:
+                await get_owned(db, Campaign, meta["campaign_id"], current_user)
+            
+            part_path = upload_service.part_path(current_user.id, upload_id)
+            sha256 = await upload_service.hash_file(part_path)
+            unique_filename = f"{upload_id}{Path(meta['filename']).suffix}"
+            uploaded = await upload_service.register_upload(
+                db, current_user.id, unique_filename, meta["filename"],
+                part_path, sha256, meta["size"], campaign_id=meta.get("campaign_id")
+            )
+            await upload_service.discard_upload_session(current_user.id, upload_id)
+    except upload_service.UploadBusy:
+        raise HTTPException(
+            status_code=409,
+            detail="This upload is being written or completed",
+            headers={"Retry-After": "1"}
+        )
+    
+    await attach_to_campaign(db, uploaded)
+    return upload_response(uploaded)
+
+@router.delete("/sessions/{upload_id}")
+async def abort_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    upload_id = parse_upload_id(upload_id)
+    await upload_service.discard_upload_session(current_user.id, upload_id)
+    return {"message": "Upload aborted"}
+
+def legacy_path(user_id: int, file_id: str) -> Path:
+    # Files uploaded before content-addressed storage live under uploads/<user_id>/
+    return Path(settings.upload_folder) / str(user_id) / Path(file_id).name
+
+@router.api_route("/file/{file_id}", methods=["GET", "HEAD"])
 async def download_file(
     file_id: str,
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    file_path = Path(settings.upload_folder) / str(current_user.id) / file_id
+    uploaded = await upload_service.find_upload(db, current_user.id, file_id)
+    if not uploaded:
+        file_path = legacy_path(current_user.id, file_id)
+        if not file_path.is_file():
+            raise HTTPException(status_code=404, detail="File not found")
+        return FileResponse(
+            path=file_path,
+            filename=file_id,
+            media_type=downloads.guess_media_type(file_id)
+        )
     
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
+    # Blobs are immutable, so the content hash is a strong validator
+    etag = downloads.strong_etag(uploaded.sha256)
+    headers = downloads.cache_headers(etag, uploaded.created_at)
+    if downloads.is_not_modified(request.headers, etag, uploaded.created_at):
+        return Response(status_code=304, headers=headers)
     
-    return FileResponse(
-        path=file_path,
-        filename=file_id,
-        media_type='application/octet-stream'
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header and downloads.range_applies(request.headers, etag, uploaded.created_at):
+        try:
+            ranges = downloads.parse_range(range_header, uploaded.size)
+        except downloads.RangeNotSatisfiable:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{uploaded.size}"}
+            )
+    
+    media_type = downloads.guess_media_type(uploaded.original_name)
+    disposition = "inline" if media_type.startswith(("audio/", "application/pdf")) else "attachment"
+    headers["Content-Disposition"] = downloads.content_disposition(disposition, uploaded.original_name)
+    return downloads.BlobResponse(
+        get_storage(),
+        uploaded.sha256,
+        uploaded.size,
+        media_type,
+        headers,
+        ranges=ranges,
+        send_body=request.method != "HEAD"
     )
 
 @router.delete("/file/{file_id}")
 async def delete_file(
     file_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    file_path = Path(settings.upload_folder) / str(current_user.id) / file_id
+    uploaded = await upload_service.find_upload(db, current_user.id, file_id)
+    if uploaded:
+        try:
+            await upload_service.release_upload(db, uploaded)
+            return {"message": "File deleted successfully"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
     
-    if not file_path.exists():
+    file_path = legacy_path(current_user.id, file_id)
+    if not file_path.is_file():
         raise HTTPException(status_code=404, detail="File not found")
     
     try:
@@ -96,19 +338,38 @@ async def delete_file(
         raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
 
 @router.get("/files")
-async def list_files(current_user: User = Depends(get_current_user)):
-    upload_dir = Path(settings.upload_folder) / str(current_user.id)
-    
-    if not upload_dir.exists():
-        return {"files": []}
-    
-    files = []
-    for file_path in upload_dir.iterdir():
-        if file_path.is_file():
-            files.append({
-                "file_id": file_path.name,
-                "file_size": file_path.stat().st_size,
-                "created_at": file_path.stat().st_ctime
-            })
-    
-    return {"files": files}
\ No newline at end of file
+async def list_files(
+    campaign_id: Optional[int] = None,
+    file_type: Optional[str] = Query(None, alias="type", description="MIME type or prefix, e.g. audio or application/pdf"),
+    sort: str = Query("-created_at", description="created_at, name or size; prefix with - for descending"),
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    sort_column = SORT_COLUMNS.get(sort.lstrip("-"))
+    if sort_column is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort. Allowed: {', '.join(SORT_COLUMNS)}"
+        )
+    
+    query = select(UploadedFile).where(UploadedFile.owner_id == current_user.id)
+    if campaign_id is not None:
+        query = query.where(UploadedFile.campaign_id == campaign_id)
+    if file_type:
+        query = query.where(UploadedFile.content_type.startswith(file_type.lower(), autoescape=True))
+    
+    direction = sort_column.desc() if sort.startswith("-") else sort_column.asc()
+    # id breaks ties so pages are stable
+    id_direction = UploadedFile.id.desc() if sort.startswith("-") else UploadedFile.id.asc()
+    # Fetch one extra row to know whether there is a next page without a COUNT(*)
+    result = await db.execute(query.order_by(direction, id_direction).offset(offset).limit(limit + 1))
+    rows = result.scalars().all()
+    
+    return {
+        "files": [upload_response(uploaded) for uploaded in rows[:limit]],
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if len(rows) > limit else None
+    }
@@ -0,0 +1,442 @@
+import enum
+import hashlib
+import json
+import tarfile
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+from sqlalchemy import DateTime, Enum, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.campaign import Campaign
+from ..models.document import CampaignDocument
+from ..models.npc import NPC
+from ..models.session import Session as SessionModel
+from ..models.upload import UploadedFile
+from . import documents, vector_index
+from . import uploads as upload_service
+from .bulk import iter_lines
+from .storage import get_storage, staging_dir
+
+# Campaign archives: an uncompressed tar stream with these members, in order
+#
+#   manifest.json      format, version, export time
+#   campaign.ndjson    the campaign row
+#   files.ndjson       one line per uploaded file the campaign references
+#   sessions.ndjson    one line per session
+#   npcs.ndjson        one line per NPC
+#   files/<sha256>     each distinct blob, once
+#
+# Export writes tar headers by hand so the archive is produced lazily: table
+# rows are streamed from the database into a spooled temp file (tar needs each
+# member's size up front) and blobs are copied from storage chunk by chunk.
+# Import parses the tar incrementally off the request body and writes
+# everything in the caller's transaction with batched INSERT ... RETURNING.
+
+FORMAT = "rpassistant-campaign"
+VERSION = 1
+BLOCK = tarfile.BLOCKSIZE
+RECORD = tarfile.RECORDSIZE
+SPOOL_SIZE = 8 * 1024 * 1024
+BATCH_ROWS = 500
+BATCH_BYTES = 8 * 1024 * 1024
+MAX_METADATA_SIZE = 1024 * 1024
+
+CAMPAIGN_COLUMNS = ("id", "name", "rpg_system", "description", "campaign_notes", "created_at", "updated_at")
+SESSION_COLUMNS = (
+    "id", "session_number", "name", "preparation_notes", "audio_recording_path", "transcript", "recap",
+    "status", "scheduled_date", "actual_date", "created_at", "updated_at",
+)
+NPC_COLUMNS = (
+    "id", "session_id", "name", "role", "appearance", "personality_traits", "backstory",
+    "relevant_skills_stats", "relationship_to_campaign", "generated_parameters", "ai_generated",
+    "integration_status", "created_at", "updated_at",
+)
+
+class ArchiveError(Exception):
+    pass
+
+class ArchiveTooLarge(ArchiveError):
+    pass
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+def _ndjson_line(row) -> bytes:
+    return json.dumps({key: _encode(value) for key, value in row.items()}).encode() + b"\n"
+
+def _decode_row(model, columns, row: dict) -> dict:
+    values = {}
+    for name in columns:
+        if name == "id" or name not in row:
+            continue
+        value = row[name]
+        column_type = model.__table__.c[name].type
+        try:
+            if value is not None and isinstance(column_type, DateTime):
+                value = datetime.fromisoformat(value)
+            elif value is not None and isinstance(column_type, Enum) and column_type.enum_class:
+                value = column_type.enum_class(value)
+        except (TypeError, ValueError):
+            raise ArchiveError(f"Invalid value for {model.__tablename__}.{name}: {value!r}")
+        values[name] = value
+    return values
+
+# -- export -------------------------------------------------------------------
+
+def _header(name: str, size: int, mtime: int) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.USTAR_FORMAT)
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % BLOCK)
+
+async def _campaign_files(db: AsyncSession, campaign_id: int, owner_id: int) -> List[dict]:
+    # Files uploaded into the campaign, attached as documents, or used as a
+    # session recording
+    documents_query = select(CampaignDocument.uploaded_file_id).where(CampaignDocument.campaign_id == campaign_id)
+    recordings_query = select(SessionModel.audio_recording_path).where(
+        SessionModel.campaign_id == campaign_id,
+        SessionModel.audio_recording_path.is_not(None)
+    )
+    result = await db.execute(
+        select(
+            UploadedFile.file_id, UploadedFile.original_name, UploadedFile.content_type,
+            UploadedFile.size, UploadedFile.sha256, UploadedFile.created_at,
+            UploadedFile.campaign_id, UploadedFile.id.in_(documents_query).label("document")
+        )
+        .where(UploadedFile.owner_id == owner_id, or_(
+            UploadedFile.campaign_id == campaign_id,
+            UploadedFile.id.in_(documents_query),
+            UploadedFile.file_id.in_(recordings_query)
+        ))
+        .order_by(UploadedFile.id)
+    )
+    return [
+        {
+            "file_id": row.file_id, "original_name": row.original_name, "content_type": row.content_type,
+            "size": row.size, "sha256": row.sha256, "created_at": row.created_at,
+            "attached": row.campaign_id == campaign_id, "document": bool(row.document),
+        }
+        for row in result
+    ]
+
+async def _spooled_member(name: str, lines: AsyncIterator[bytes], mtime: int) -> AsyncIterator[bytes]:
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, dir=staging_dir()) as spool:
+        size = 0
+        async for line in lines:
+            spool.write(line)
+            size += len(line)
+        spool.seek(0)
+        yield _header(name, size, mtime)
+        while True:
+            chunk = spool.read(settings.upload_chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        yield _padding(size)
+
+async def _rows(db: AsyncSession, query) -> AsyncIterator[bytes]:
+    result = await db.stream(query.execution_options(yield_per=BATCH_ROWS))
+    async for row in result.mappings():
+        yield _ndjson_line(row)
+
+async def export_campaign(campaign_id: int, owner_id: int) -> AsyncIterator[bytes]:
+    # Runs after the request's own session is gone, so it opens its own
+    mtime = int(time.time())
+    written = 0
+    blobs: Dict[str, int] = {}
+    async with AsyncSessionLocal() as db:
+        files = await _campaign_files(db, campaign_id, owner_id)
+        for entry in files:
+            blobs[entry["sha256"]] = entry["size"]
+
+        manifest = json.dumps({
+            "format": FORMAT, "version": VERSION,
+            "exported_at": datetime.utcnow().isoformat() + "Z",
+            "files": len(files), "bytes": sum(blobs.values()),
+        }).encode()
+        for chunk in (_header("manifest.json", len(manifest), mtime), manifest, _padding(len(manifest))):
+            written += len(chunk)
+            yield chunk
+
+        async def file_lines():
+            for entry in files:
+                yield _ndjson_line(entry)
+
+        members = [
+            ("campaign.ndjson", _rows(db, select(*(getattr(Campaign, name) for name in CAMPAIGN_COLUMNS))
+                                      .where(Campaign.id == campaign_id))),
+            ("files.ndjson", file_lines()),
+            ("sessions.ndjson", _rows(db, select(*(getattr(SessionModel, name) for name in SESSION_COLUMNS))
+                                      .where(SessionModel.campaign_id == campaign_id)
+                                      .order_by(SessionModel.id))),
+            ("npcs.ndjson", _rows(db, select(*(getattr(NPC, name) for name in NPC_COLUMNS))
+                                  .where(NPC.campaign_id == campaign_id)
+                                  .order_by(NPC.id))),
+        ]
+        for name, lines in members:
+            async for chunk in _spooled_member(name, lines, mtime):
+                written += len(chunk)
+                yield chunk
+
+    storage = get_storage()
+    for digest, size in blobs.items():
+        yield _header(f"files/{digest}", size, mtime)
+        async for chunk in storage.iter_chunks(digest):
+            yield chunk
+        yield _padding(size)
+        written += BLOCK + size + len(_padding(size))
+
+    # End-of-archive marker, padded to a whole record like tar(1) does
+    trailer = 2 * BLOCK
+    yield b"\0" * (trailer + (-(written + trailer) % RECORD))
+
+# -- import -------------------------------------------------------------------
+
+class TarReader:
+    # Minimal streaming reader for the ustar/pax archives export produces;
+    # each member's data must be consumed (or is skipped) before the next
+    def __init__(self, chunks: AsyncIterator[bytes], max_size: int):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+        self._remaining = 0
+        self._padding = 0
+        self.total = 0
+        self.max_size = max_size
+
+    async def _fill(self, size: int):
+        while len(self._buffer) < size:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                raise ArchiveError("Archive is truncated")
+            self.total += len(chunk)
+            if self.total > self.max_size:
+                raise ArchiveTooLarge(f"Archive exceeds {self.max_size} bytes")
+            self._buffer += chunk
+
+    async def _take(self, size: int) -> bytes:
+        await self._fill(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def data(self, chunk_size: int = settings.upload_chunk_size) -> AsyncIterator[bytes]:
+        while self._remaining:
+            if not self._buffer:
+                await self._fill(1)
+            size = min(self._remaining, chunk_size, len(self._buffer))
+            self._remaining -= size
+            yield await self._take(size)
+
+    async def read(self, limit: int) -> bytes:
+        if self._remaining > limit:
+            raise ArchiveError(f"Archive member larger than {limit} bytes")
+        return b"".join([chunk async for chunk in self.data()])
+
+    async def _skip(self):
+        async for _ in self.data():
+            pass
+        await self._take(self._padding)
+        self._padding = 0
+
+    async def members(self) -> AsyncIterator[tarfile.TarInfo]:
+        pax_path = None
+        while True:
+            await self._skip()
+            block = await self._take(BLOCK)
+            if not block.strip(b"\0"):
+                return
+            try:
+                info = tarfile.TarInfo.frombuf(block, "utf-8", "surrogateescape")
+            except tarfile.HeaderError as exc:
+                raise ArchiveError(f"Invalid tar header: {exc}")
+            self._remaining, self._padding = info.size, -info.size % BLOCK
+            if info.type == tarfile.XHDTYPE:
+                # pax extended header: only the path override matters here
+                for record in (await self.read(MAX_METADATA_SIZE)).decode("utf-8", "replace").split("\n"):
+                    key, _, value = record.partition(" ")[2].partition("=")
+                    if key == "path":
+                        pax_path = value
+                continue
+            if pax_path is not None:
+                info.name, pax_path = pax_path, None
+            if info.isreg():
+                yield info
+
+async def _ndjson(reader: TarReader) -> AsyncIterator[dict]:
+    async for line in iter_lines(reader.data()):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise ArchiveError("Invalid NDJSON line in archive")
+        if not isinstance(row, dict):
+            raise ArchiveError("Archive rows must be JSON objects")
+        yield row
+
+async def _batches(rows: AsyncIterator[dict]) -> AsyncIterator[List[dict]]:
+    # Bounded by row count and by size, since transcripts can be large
+    batch, size = [], 0
+    async for row in rows:
+        batch.append(row)
+        size += sum(len(value) for value in row.values() if isinstance(value, str))
+        if len(batch) >= BATCH_ROWS or size >= BATCH_BYTES:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+class _Import:
+    def __init__(self, db: AsyncSession, owner_id: int):
+        self.db = db
+        self.owner_id = owner_id
+        self.campaign_id: Optional[int] = None
+        self.session_ids: Dict[int, int] = {}
+        self.file_ids: Dict[str, str] = {}
+        self.files_by_blob: Dict[str, List[dict]] = {}
+        self.npc_count = 0
+        self.file_count = 0
+        self.staged: List[Path] = []
+
+    def require_campaign(self):
+        if self.campaign_id is None:
+            raise ArchiveError("campaign.ndjson must come before sessions, NPCs and files")
+
+    async def campaign(self, reader: TarReader):
+        async for row in _ndjson(reader):
+            if self.campaign_id is not None:
+                raise ArchiveError("Archive contains more than one campaign")
+            campaign = Campaign(**_decode_row(Campaign, CAMPAIGN_COLUMNS, row), owner_id=self.owner_id)
+            self.db.add(campaign)
+            await self.db.flush()
+            self.campaign_id = campaign.id
+        self.require_campaign()
+
+    async def files(self, reader: TarReader):
+        self.require_campaign()
+        async for row in _ndjson(reader):
+            digest, file_id = row.get("sha256"), row.get("file_id")
+            if not isinstance(digest, str) or len(digest) != 64 or not isinstance(file_id, str):
+                raise ArchiveError("files.ndjson rows need file_id and sha256")
+            self.file_ids[file_id] = f"{uuid.uuid4()}{Path(file_id).suffix}"
+            self.files_by_blob.setdefault(digest, []).append(row)
+
+    async def sessions(self, reader: TarReader):
+        self.require_campaign()
+        async for batch in _batches(_ndjson(reader)):
+            values = []
+            for row in batch:
+                session = _decode_row(SessionModel, SESSION_COLUMNS, row)
+                session.update(campaign_id=self.campaign_id, owner_id=self.owner_id)
+                session["audio_recording_path"] = self.file_ids.get(session.get("audio_recording_path"))
+                values.append(session)
+            new_ids = (await self.db.scalars(
+                insert(SessionModel).returning(SessionModel.id, sort_by_parameter_order=True), values
+            )).all()
+            self.session_ids.update(zip((row.get("id") for row in batch), new_ids))
+            vector_index.queue_refresh(self.db, "session", new_ids)
+
+    async def npcs(self, reader: TarReader):
+        self.require_campaign()
+        async for batch in _batches(_ndjson(reader)):
+            values = []
+            for row in batch:
+                session_id = self.session_ids.get(row.get("session_id"))
+                if session_id is None:
+                    raise ArchiveError(f"NPC {row.get('name')!r} references an unknown session")
+                npc = _decode_row(NPC, NPC_COLUMNS, row)
+                npc.update(session_id=session_id, campaign_id=self.campaign_id, owner_id=self.owner_id)
+                values.append(npc)
+            new_ids = (await self.db.scalars(
+                insert(NPC).returning(NPC.id, sort_by_parameter_order=True), values
+            )).all()
+            self.npc_count += len(new_ids)
+            vector_index.queue_refresh(self.db, "npc", new_ids)
+
+    async def blob(self, reader: TarReader, digest: str, size: int):
+        entries = self.files_by_blob.pop(digest, None)
+        if entries is None:
+            raise ArchiveError(f"Archive member files/{digest} is not listed in files.ndjson")
+
+        # Verified even when the blob is already stored here: registering a
+        # digest grants access to its bytes, so the archive has to prove it
+        # has them. register_upload drops the staged copy if it isn't needed.
+        staged = staging_dir() / f"{uuid.uuid4()}.import"
+        self.staged.append(staged)
+        hasher = hashlib.sha256()
+        await upload_service.write_stream(reader.data(), staged, size, hasher=hasher)
+        if hasher.hexdigest() != digest:
+            raise ArchiveError(f"Checksum mismatch for files/{digest}")
+
+        for entry in entries:
+            uploaded = await upload_service.register_upload(
+                self.db, self.owner_id, self.file_ids[entry["file_id"]],
+                entry.get("original_name") or entry["file_id"], staged, digest, size,
+                campaign_id=self.campaign_id if entry.get("attached") else None, commit=False
+            )
+            if entry.get("document"):
+                await documents.attach_document(self.db, self.campaign_id, uploaded, commit=False)
+            self.file_count += 1
+
+async def import_campaign(db: AsyncSession, owner_id: int, chunks: AsyncIterator[bytes]) -> dict:
+    # Everything is written in `db`'s transaction; the caller commits, or
+    # rolls back on ArchiveError. Blobs already moved into storage by a failed
+    # import are unreferenced and removed by the catalogue job.
+    reader = TarReader(chunks, settings.max_import_size)
+    state = _Import(db, owner_id)
+    manifest = None
+    try:
+        async for info in reader.members():
+            name = info.name
+            if manifest is None:
+                if name != "manifest.json":
+                    raise ArchiveError("manifest.json must be the first member")
+                try:
+                    manifest = json.loads(await reader.read(MAX_METADATA_SIZE))
+                except ValueError:
+                    raise ArchiveError("manifest.json is not valid JSON")
+                if not isinstance(manifest, dict) or manifest.get("format") != FORMAT:
+                    raise ArchiveError("Not a campaign archive")
+                if manifest.get("version") != VERSION:
+                    raise ArchiveError(f"Unsupported archive version {manifest.get('version')}")
+            elif name == "campaign.ndjson":
+                await state.campaign(reader)
+            elif name == "files.ndjson":
+                await state.files(reader)
+            elif name == "sessions.ndjson":
+                await state.sessions(reader)
+            elif name == "npcs.ndjson":
+                await state.npcs(reader)
+            elif name.startswith("files/"):
+                state.require_campaign()
+                await state.blob(reader, name[len("files/"):], info.size)
+            # Unknown members are skipped so newer exports stay importable
+    finally:
+        for path in state.staged:
+            await upload_service.remove_quietly(path)
+
+    if manifest is None:
+        raise ArchiveError("Archive is empty")
+    state.require_campaign()
+    if state.files_by_blob:
+        raise ArchiveError(f"Archive is missing {len(state.files_by_blob)} file(s) listed in files.ndjson")
+    return {
+        "campaign_id": state.campaign_id,
+        "sessions": len(state.session_ids),
+        "npcs": state.npc_count,
+        "files": state.file_count,
+    }
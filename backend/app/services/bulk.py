@@ -0,0 +1,108 @@
+import json
+from typing import AsyncIterator, List, Optional, Tuple, Type
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+
+# Shared plumbing for the bulk endpoints. A request body is either a JSON
+# object {"items": [...]} or, with Content-Type application/x-ndjson, one item
+# per line streamed straight off the socket. Items are validated one at a
+# time so a bad item is reported by its index instead of failing the request,
+# and handed to the router in batches so ownership checks and writes run once
+# per batch rather than once per item.
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+BATCH_SIZE = 500
+MAX_JSON_ITEMS = 1000
+
+class BulkItemError(BaseModel):
+    index: int
+    detail: str
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: int
+
+class BulkResponse(BaseModel):
+    succeeded: List[BulkItemResult] = []
+    errors: List[BulkItemError] = []
+
+def _validation_detail(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+def is_ndjson(request: Request) -> bool:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type in NDJSON_TYPES
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    yield buffer
+
+async def _raw_items(request: Request) -> AsyncIterator[Tuple[int, object]]:
+    if is_ndjson(request):
+        index = 0
+        async for line in iter_lines(request.stream()):
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError:
+                yield index, None
+            index += 1
+        return
+
+    try:
+        body = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON or NDJSON")
+    items = body.get("items") if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail='Body must be an object with an "items" list')
+    if len(items) > MAX_JSON_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_JSON_ITEMS} items per JSON request; send larger imports as NDJSON"
+        )
+    for index, item in enumerate(items):
+        yield index, item
+
+async def iter_batches(
+    request: Request,
+    model: Type[BaseModel],
+    result: BulkResponse,
+    batch_size: int = BATCH_SIZE
+) -> AsyncIterator[List[Tuple[int, BaseModel]]]:
+    batch = []
+    async for index, raw in _raw_items(request):
+        if raw is None:
+            result.errors.append(BulkItemError(index=index, detail="Invalid JSON"))
+            continue
+        try:
+            item = model.model_validate(raw)
+        except ValidationError as exc:
+            result.errors.append(BulkItemError(index=index, detail=_validation_detail(exc)))
+            continue
+        batch.append((index, item))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def parse_ids(ids: Optional[str], limit: int = MAX_JSON_ITEMS) -> List[int]:
+    try:
+        parsed = [int(value) for value in (ids or "").split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not parsed:
+        raise HTTPException(status_code=400, detail="No ids given")
+    if len(parsed) > limit:
+        raise HTTPException(status_code=413, detail=f"At most {limit} ids per request")
+    return parsed
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from pathlib import Path
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..models.campaign import Campaign
+from ..models.document import LegacyCampaignDocument
+from ..models.user import User
+from ..models.upload import StoredBlob, UploadedFile
+from . import documents
+from . import uploads as upload_service
+from .storage import LocalStorage, get_storage, staging_dir
+
+STALE_STAGING_SECONDS = 24 * 60 * 60
+
+# Rebuilds the uploaded_files catalogue and blob reference counts from what is
+# actually on disk. Safe to run repeatedly while the API is serving, e.g. from
+# cron: the recount holds the blob lock (see uploads.lock_blobs) exclusively.
+#
+#     python -m app.services.catalogue
+
+async def import_legacy_files(db: AsyncSession, report: dict):
+    # Files written before the catalogue existed live in uploads/<user_id>/
+    root = Path(settings.upload_folder)
+    if not root.exists():
+        return
+    for user_dir in sorted(root.iterdir()):
+        if not user_dir.is_dir() or not user_dir.name.isdigit():
+            continue
+        owner_id = int(user_dir.name)
+        if await db.get(User, owner_id) is None:
+            report["skipped_unknown_owner"] += 1
+            continue
+        for path in sorted(user_dir.iterdir()):
+            if not path.is_file():
+                continue
+            if await upload_service.find_upload(db, owner_id, path.name):
+                continue
+            digest = await upload_service.hash_file(path)
+            await upload_service.register_upload(
+                db, owner_id, path.name, path.name, path, digest, path.stat().st_size
+            )
+            report["imported"] += 1
+
+async def attach_legacy_documents(db: AsyncSession, report: dict):
+    # Paths the campaigns.uploaded_documents migration could not resolve yet
+    # (migrations/versions/0007); the files are imported above by now
+    result = await db.execute(
+        select(LegacyCampaignDocument, Campaign.owner_id)
+        .join(Campaign, Campaign.id == LegacyCampaignDocument.campaign_id)
+        .where(Campaign.deleted_at.is_(None))
+    )
+    for legacy, owner_id in result.all():
+        uploaded = await upload_service.find_upload(db, owner_id, Path(legacy.path).name)
+        if uploaded is None:
+            report["unresolved_legacy_documents"] += 1
+            continue
+        if uploaded.campaign_id is None:
+            uploaded.campaign_id = legacy.campaign_id
+        if Path(uploaded.original_name).suffix.lower() in documents.DOCUMENT_EXTENSIONS:
+            await documents.attach_document(db, legacy.campaign_id, uploaded, commit=False)
+        await db.delete(legacy)
+        report["legacy_documents_attached"] += 1
+    await db.commit()
+
+async def recount_references(db: AsyncSession, report: dict):
+    # Uploads and releases wait while this runs, so no reference can appear
+    # between counting a blob as unreferenced and deleting its bytes. The bytes
+    # go before the commit for the same reason; blobs counted at zero here are
+    # unreferenced even if the commit fails.
+    await upload_service.lock_blobs(db, exclusive=True)
+    refs = (
+        select(func.count(UploadedFile.id))
+        .where(UploadedFile.sha256 == StoredBlob.sha256)
+        .scalar_subquery()
+    )
+    await db.execute(update(StoredBlob).values(ref_count=refs))
+    result = await db.execute(select(StoredBlob.sha256).where(StoredBlob.ref_count <= 0))
+    unreferenced = result.scalars().all()
+    storage = get_storage()
+    for digest in unreferenced:
+        await storage.delete(digest)
+    if unreferenced:
+        await db.execute(delete(StoredBlob).where(StoredBlob.sha256.in_(unreferenced)))
+    await db.commit()
+    report["unreferenced_blobs_removed"] = len(unreferenced)
+
+async def check_blobs(db: AsyncSession, report: dict):
+    storage = get_storage()
+    result = await db.execute(select(StoredBlob.sha256))
+    known = set()
+    for digest in result.scalars():
+        known.add(digest)
+        if not await storage.exists(digest):
+            report["missing_blobs"].append(digest)
+    
+    # Only the local driver can be walked cheaply; S3 orphans are left to bucket
+    # lifecycle rules. Recent files may belong to uploads still being committed.
+    if isinstance(storage, LocalStorage) and storage.root.exists():
+        cutoff = time.time() - STALE_STAGING_SECONDS
+        for path in storage.root.glob("*/*/*"):
+            if path.is_file() and path.name not in known and path.stat().st_mtime < cutoff:
+                path.unlink()
+                report["orphaned_blobs_removed"] += 1
+
+def clean_staging(report: dict):
+    cutoff = time.time() - STALE_STAGING_SECONDS
+    for path in staging_dir().iterdir():
+        if path.is_file() and path.stat().st_mtime < cutoff:
+            path.unlink()
+            report["stale_staging_removed"] += 1
+    report["expired_upload_sessions_removed"] = upload_service.expire_upload_sessions()
+
+async def reconcile_catalogue(db: AsyncSession) -> dict:
+    report = {
+        "imported": 0,
+        "skipped_unknown_owner": 0,
+        "legacy_documents_attached": 0,
+        "unresolved_legacy_documents": 0,
+        "unreferenced_blobs_removed": 0,
+        "orphaned_blobs_removed": 0,
+        "stale_staging_removed": 0,
+        "expired_upload_sessions_removed": 0,
+        "missing_blobs": [],
+    }
+    await import_legacy_files(db, report)
+    await attach_legacy_documents(db, report)
+    await recount_references(db, report)
+    await check_blobs(db, report)
+    clean_staging(report)
+    return report
+
+async def main():
+    from ..database import AsyncSessionLocal, async_engine
+    async with AsyncSessionLocal() as db:
+        report = await reconcile_catalogue(db)
+    await async_engine.dispose()
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
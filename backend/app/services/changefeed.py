@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Set
+from ..config import settings
+from . import changes
+from .cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Per-campaign change feed. Committed session and NPC changes (and changes to
+# the campaign itself) are published as small events; clients subscribed over
+# SSE or WebSocket refetch what they need. With Redis enabled events travel
+# over pub/sub so every worker's subscribers see every write; otherwise the
+# broker is in-process, which suits single-node and test setups.
+#
+# Each subscriber has a bounded queue. A client that falls behind loses its
+# backlog and receives a single resync event telling it to refetch, so one
+# slow connection can't hold memory or delay anyone else.
+
+CHANNEL_PREFIX = "rpassistant:feed:"
+RESYNC = {"type": "resync"}
+PING = {"type": "ping"}
+
+class Subscription:
+    def __init__(self, campaign_id: int, maxsize: int = settings.changefeed_queue_size):
+        self.campaign_id = campaign_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def deliver(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout: float = settings.changefeed_heartbeat_seconds) -> dict:
+        # Returns a ping when nothing happened for `timeout` seconds
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return PING
+
+class LocalBroker:
+    def __init__(self):
+        self.subscribers: Dict[int, Set[Subscription]] = {}
+
+    def deliver(self, campaign_id: int, event: dict):
+        for subscription in list(self.subscribers.get(campaign_id, ())):
+            subscription.deliver(event)
+
+    async def publish(self, campaign_id: int, event: dict):
+        self.deliver(campaign_id, event)
+
+    async def subscribe(self, campaign_id: int) -> Subscription:
+        subscription = Subscription(campaign_id)
+        self.subscribers.setdefault(campaign_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self.subscribers.get(subscription.campaign_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscribers[subscription.campaign_id]
+
+class RedisBroker(LocalBroker):
+    # One pattern subscription per process fans Redis messages out to the
+    # local subscribers
+    def __init__(self, redis):
+        super().__init__()
+        self.redis = redis
+        self._listener: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+    async def publish(self, campaign_id: int, event: dict):
+        await self.redis.publish(f"{CHANNEL_PREFIX}{campaign_id}", json.dumps(event))
+
+    async def subscribe(self, campaign_id: int) -> Subscription:
+        if self._listener is None or self._listener.done():
+            self._ready.clear()
+            self._listener = asyncio.create_task(self._listen())
+        await self._ready.wait()
+        return await super().subscribe(campaign_id)
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                    self._ready.set()
+                    async for message in pubsub.listen():
+                        if message["type"] != "pmessage":
+                            continue
+                        campaign_id = int(message["channel"][len(CHANNEL_PREFIX):])
+                        self.deliver(campaign_id, json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change feed lost its Redis subscription; reconnecting")
+                # Whatever was published meanwhile is gone
+                for subscribers in list(self.subscribers.values()):
+                    for subscription in list(subscribers):
+                        subscription.deliver(RESYNC)
+                await asyncio.sleep(1)
+
+_broker = None
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        redis = get_redis()
+        _broker = RedisBroker(redis) if redis is not None else LocalBroker()
+    return _broker
+
+def to_event(change: changes.Change) -> dict:
+    return {
+        "type": "change",
+        "entity": change.entity,
+        "action": change.action,
+        "id": change.id,
+        "campaign_id": change.campaign_id,
+        "session_id": change.session_id,
+    }
+
+_publishing: Set[asyncio.Task] = set()
+
+async def _publish(events: List[dict]):
+    broker = get_broker()
+    for event in events:
+        try:
+            await broker.publish(event["campaign_id"], event)
+        except Exception:
+            logger.exception("Could not publish change event")
+
+@changes.on_commit
+def _publish_committed(committed: List[changes.Change]):
+    events = [to_event(change) for change in committed if change.campaign_id is not None]
+    if not events:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Sync sessions (scripts, migrations) run outside the event loop
+        logger.warning("Dropping %d change events committed outside the event loop", len(events))
+        return
+    # The loop only keeps weak references to tasks
+    task = loop.create_task(_publish(events))
+    _publishing.add(task)
+    task.add_done_callback(_publishing.discard)
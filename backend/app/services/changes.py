@@ -0,0 +1,114 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session as OrmSession
+from ..models.campaign import Campaign
+from ..models.npc import NPC
+from ..models.session import Session as SessionModel
+
+logger = logging.getLogger(__name__)
+
+# Row-level change tracking for campaigns, sessions and NPCs, shared by the
+# response cache and the change feed. Unit-of-work changes are seen at flush;
+# bulk INSERT/UPDATE/DELETE statements (the bulk endpoints, imports, campaign
+# cleanup) are seen as they execute, with the affected rows looked up when the
+# statement alone doesn't say which they are. Listeners get the changes once
+# the transaction has committed.
+
+@dataclass(frozen=True)
+class Change:
+    entity: str  # campaign, session or npc
+    action: str  # created, updated or deleted
+    id: Optional[int]
+    campaign_id: Optional[int]
+    session_id: Optional[int] = None
+
+TRACKED = {
+    Campaign: ("campaign", (Campaign.id,)),
+    SessionModel: ("session", (SessionModel.id, SessionModel.campaign_id)),
+    NPC: ("npc", (NPC.id, NPC.session_id, NPC.campaign_id)),
+}
+
+_listeners: List[Callable[[List[Change]], None]] = []
+
+def on_commit(listener: Callable[[List[Change]], None]):
+    _listeners.append(listener)
+    return listener
+
+def _change(model, action: str, row) -> Change:
+    entity, _ = TRACKED[model]
+    if model is Campaign:
+        return Change(entity, action, row.get("id"), row.get("id"))
+    if model is SessionModel:
+        return Change(entity, action, row.get("id"), row.get("campaign_id"), row.get("id"))
+    return Change(entity, action, row.get("id"), row.get("campaign_id"), row.get("session_id"))
+
+def _collect(session, changes):
+    # A dict keeps first-seen order and drops repeats within one transaction
+    pending = session.info.setdefault("row_changes", {})
+    for change in changes:
+        pending[change] = None
+
+def _lookup(session, model, condition) -> list:
+    return session.execute(select(*TRACKED[model][1]).where(condition)).mappings().all()
+
+@event.listens_for(OrmSession, "after_flush")
+def _collect_flushed(session, flush_context):
+    for action, objects in (("created", session.new), ("updated", session.dirty), ("deleted", session.deleted)):
+        for obj in objects:
+            model = type(obj)
+            if model in TRACKED:
+                row = {column.key: getattr(obj, column.key) for column in TRACKED[model][1]}
+                _collect(session, [_change(model, action, row)])
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _collect_bulk(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    model = mapper.class_ if mapper is not None else None
+    if model not in TRACKED:
+        return
+    session = orm_execute_state.session
+    statement = orm_execute_state.statement
+    params = orm_execute_state.parameters
+    rows = params if isinstance(params, list) else [params] if params else []
+
+    if orm_execute_state.is_insert:
+        returning = [column["name"] for column in statement.returning_column_descriptions or ()]
+        if "id" not in returning:
+            _collect(session, [_change(model, "created", row) for row in rows])
+            return
+        # Run the INSERT here to learn the new ids, then hand the caller a
+        # replay of its result
+        frozen = orm_execute_state.invoke_statement().freeze()
+        ids = [row.id for row in frozen()]
+        if ids:
+            _collect(session, [_change(model, "created", row) for row in _lookup(session, model, model.id.in_(ids))])
+        return frozen()
+
+    if statement.whereclause is not None:
+        condition = statement.whereclause
+    elif rows and all("id" in row for row in rows):
+        condition = model.id.in_([row["id"] for row in rows])  # bulk UPDATE by primary key
+    else:
+        return
+    action = "updated" if orm_execute_state.is_update else "deleted"
+    _collect(session, [_change(model, action, row) for row in _lookup(session, model, condition)])
+
+@event.listens_for(OrmSession, "after_commit")
+def _dispatch(session):
+    pending = session.info.pop("row_changes", None)
+    if not pending:
+        return
+    committed = list(pending)
+    for listener in _listeners:
+        try:
+            listener(committed)
+        except Exception:
+            logger.exception("Change listener %s failed", listener)
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard(session):
+    session.info.pop("row_changes", None)
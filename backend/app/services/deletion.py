@@ -0,0 +1,68 @@
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import AsyncSessionLocal
+from ..models.campaign import Campaign
+from ..models.document import CampaignDocument
+from ..models.job import Job
+from ..models.session import Session as SessionModel
+from ..models.upload import UploadedFile
+from . import jobs
+from . import uploads as upload_service
+
+JOB_KIND = "campaign_delete"
+BATCH_SIZE = 100
+
+# Deleting a campaign is two-phase. The API only tombstones the row
+# (deleted_at) and queues this job, so the request returns at once. The job
+# releases the campaign's files in batches, each its own transaction, and then
+# deletes the campaign row; sessions, NPCs, document links and embeddings go
+# with it through ON DELETE CASCADE.
+
+def _releasable_files(campaign: Campaign):
+    # Files uploaded into the campaign and the recordings of its sessions,
+    # unless something outside the campaign still uses them
+    recordings = select(SessionModel.audio_recording_path).where(
+        SessionModel.campaign_id == campaign.id,
+        SessionModel.audio_recording_path.is_not(None)
+    )
+    used_elsewhere = or_(
+        UploadedFile.file_id.in_(select(SessionModel.audio_recording_path).where(
+            SessionModel.owner_id == campaign.owner_id,
+            SessionModel.campaign_id != campaign.id,
+            SessionModel.audio_recording_path.is_not(None)
+        )),
+        UploadedFile.id.in_(select(CampaignDocument.uploaded_file_id).where(
+            CampaignDocument.campaign_id != campaign.id
+        )),
+    )
+    return and_(
+        UploadedFile.owner_id == campaign.owner_id,
+        or_(UploadedFile.campaign_id == campaign.id, UploadedFile.file_id.in_(recordings)),
+        ~used_elsewhere,
+    )
+
+async def purge_campaign(db: AsyncSession, campaign: Campaign, job: Job = None):
+    releasable = _releasable_files(campaign)
+    total = await db.scalar(select(func.count(UploadedFile.id)).where(releasable))
+    done = 0
+    while True:
+        batch = (await db.scalars(select(UploadedFile).where(releasable).limit(BATCH_SIZE))).all()
+        if not batch:
+            break
+        await upload_service.release_uploads(db, batch)
+        done += len(batch)
+        if job is not None:
+            await jobs.set_progress(job.id, done, total)
+
+    await db.execute(delete(Campaign).where(Campaign.id == campaign.id))
+    await db.commit()
+
+@jobs.job_handler(JOB_KIND)
+async def delete_campaign(job: Job, payload: dict):
+    async with AsyncSessionLocal() as db:
+        campaign = await db.get(Campaign, job.target_id)
+        if campaign is None:
+            return
+        if campaign.deleted_at is None:
+            raise ValueError("Campaign is not marked for deletion")
+        await purge_campaign(db, campaign, job)
@@ -0,0 +1,193 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+import aiofiles
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.document import CampaignDocument, DocumentChunk, DocumentText
+from ..models.job import Job
+from ..models.upload import UploadedFile
+from . import jobs
+from .uploads import local_copy
+
+JOB_KIND = "document_ingestion"
+DOCUMENT_EXTENSIONS = {".pdf", ".md", ".txt"}
+
+# Text is extracted once per content hash into document_chunks (one row per
+# PDF page, or per ~page-sized slice of a text file) and shared by every
+# campaign that attaches the same file. Pages are extracted in batches on a
+# process pool and written as they come, so memory stays flat for very large
+# sourcebooks and an interrupted extraction resumes after the last stored page.
+
+Page = Tuple[int, str]
+
+def pdf_page_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(path).pages)
+
+def extract_pdf_pages(path: str, start: int, stop: int) -> List[Page]:
+    # Runs in a pool process; `start`/`stop` are 0-based page indexes
+    from PyPDF2 import PdfReader
+    reader = PdfReader(path)
+    pages = []
+    for index in range(start, min(stop, len(reader.pages))):
+        text = reader.pages[index].extract_text() or ""
+        pages.append((index + 1, text.replace("\x00", "")))
+    return pages
+
+async def iter_text_pages(path: Path, page_chars: int) -> AsyncIterator[Page]:
+    page_number, current, size = 1, [], 0
+    async with aiofiles.open(path, "r", encoding="utf-8", errors="replace") as f:
+        async for line in f:
+            if current and size + len(line) > page_chars:
+                yield page_number, "".join(current)
+                page_number, current, size = page_number + 1, [], 0
+            current.append(line)
+            size += len(line)
+    if current:
+        yield page_number, "".join(current)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.document_workers)
+    return _pool
+
+def _insert(db: AsyncSession):
+    return postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+
+async def _store_pages(sha256: str, pages: List[Page]):
+    if not pages:
+        return
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            _insert(db)(DocumentChunk)
+            .values([{"sha256": sha256, "page_number": n, "text": text} for n, text in pages])
+            .on_conflict_do_nothing(index_elements=["sha256", "page_number"])
+        )
+        await db.commit()
+
+async def _stored_pages(sha256: str) -> int:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(func.max(DocumentChunk.page_number)).where(DocumentChunk.sha256 == sha256)
+        )
+        return result.scalar() or 0
+
+async def _extract_pdf(job: Job, sha256: str, path: Path) -> int:
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    page_count = await loop.run_in_executor(pool, pdf_page_count, str(path))
+    batch = settings.document_pages_per_batch
+    
+    # Batches run in parallel, so a previous interrupted run can leave gaps;
+    # only batches with missing pages are extracted again.
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(DocumentChunk.page_number).where(DocumentChunk.sha256 == sha256))
+        stored = set(result.scalars())
+    starts = [
+        start for start in range(0, page_count, batch)
+        if any(n not in stored for n in range(start + 1, min(start + batch, page_count) + 1))
+    ]
+    
+    # Keep a bounded number of batches in flight; each one stores its own pages
+    slots = asyncio.Semaphore(settings.document_workers or 4)
+    done = len(stored)
+    
+    async def run(start: int):
+        nonlocal done
+        async with slots:
+            pages = await loop.run_in_executor(pool, extract_pdf_pages, str(path), start, start + batch)
+            await _store_pages(sha256, pages)
+        done = min(done + len(pages), page_count)
+        await jobs.set_progress(job.id, done, page_count)
+    
+    await jobs.set_progress(job.id, done, page_count)
+    await asyncio.gather(*(run(start) for start in starts))
+    return page_count
+
+async def _extract_text(job: Job, sha256: str, path: Path) -> int:
+    resume_after = await _stored_pages(sha256)
+    pages: List[Page] = []
+    page_count = 0
+    async for page_number, text in iter_text_pages(path, settings.document_page_chars):
+        page_count = page_number
+        if page_number <= resume_after:
+            continue
+        pages.append((page_number, text))
+        if len(pages) >= settings.document_pages_per_batch:
+            await _store_pages(sha256, pages)
+            await jobs.set_progress(job.id, page_number)
+            pages = []
+    await _store_pages(sha256, pages)
+    return page_count
+
+async def _set_text_status(sha256: str, **values):
+    async with AsyncSessionLocal() as db:
+        document = await db.get(DocumentText, sha256)
+        for field, value in values.items():
+            setattr(document, field, value)
+        await db.commit()
+
+@jobs.job_handler(JOB_KIND)
+async def ingest_document(job: Job, payload: dict):
+    async with AsyncSessionLocal() as db:
+        uploaded = await db.get(UploadedFile, job.target_id)
+        if uploaded is None:
+            raise ValueError("Uploaded file not found")
+        document = await db.get(DocumentText, uploaded.sha256)
+        if document is not None and document.status == "completed":
+            return
+    
+    sha256 = uploaded.sha256
+    await _set_text_status(sha256, status="extracting", error=None)
+    try:
+        async with local_copy(uploaded) as path:
+            if Path(uploaded.original_name).suffix.lower() == ".pdf":
+                page_count = await _extract_pdf(job, sha256, path)
+            else:
+                page_count = await _extract_text(job, sha256, path)
+    except Exception as e:
+        await _set_text_status(sha256, status="failed", error=str(e))
+        raise
+    await _set_text_status(
+        sha256, status="completed", page_count=page_count, completed_at=datetime.now(timezone.utc)
+    )
+
+async def attach_document(
+    db: AsyncSession, campaign_id: int, uploaded: UploadedFile, commit: bool = True
+) -> CampaignDocument:
+    result = await db.execute(select(CampaignDocument).where(
+        CampaignDocument.campaign_id == campaign_id,
+        CampaignDocument.uploaded_file_id == uploaded.id
+    ))
+    document = result.scalar_one_or_none()
+    if document is not None:
+        return document
+    
+    text = await db.get(DocumentText, uploaded.sha256)
+    if text is None:
+        text = DocumentText(sha256=uploaded.sha256, status="pending")
+        db.add(text)
+    document = CampaignDocument(campaign_id=campaign_id, uploaded_file_id=uploaded.id, sha256=uploaded.sha256)
+    db.add(document)
+    if not commit:
+        # Caller owns the transaction; extraction is queued once it commits
+        await db.flush()
+        if text.status in ("pending", "failed"):
+            jobs.enqueue_after_commit(db.sync_session, JOB_KIND, target_id=uploaded.id)
+        return document
+    await db.commit()
+    await db.refresh(document)
+    
+    # Re-uploads of already extracted content cost nothing
+    if text.status in ("pending", "failed"):
+        await jobs.enqueue(db, JOB_KIND, target_id=uploaded.id)
+    return document
@@ -0,0 +1,212 @@
+import mimetypes
+import os
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from .storage import StorageBackend
+
+MEDIA_TYPES = {
+    ".pdf": "application/pdf",
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".txt": "text/plain",
+    ".md": "text/markdown",
+}
+
+ByteRange = Tuple[int, int]  # inclusive start, inclusive end
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def guess_media_type(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in MEDIA_TYPES:
+        return MEDIA_TYPES[extension]
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+def content_disposition(disposition: str, filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+def strong_etag(digest: str) -> str:
+    return f'"{digest}"'
+
+def _etag_list(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _truncate(moment: datetime) -> datetime:
+    # HTTP dates have one second resolution
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.replace(microsecond=0)
+
+def is_not_modified(headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    # RFC 9110 13.2.2: If-None-Match takes precedence and uses weak comparison
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _etag_list(if_none_match)
+        return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+    
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and _truncate(last_modified) <= since
+    return False
+
+def range_applies(headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_range = headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag  # strong comparison only
+    since = _parse_http_date(if_range)
+    return since is not None and last_modified is not None and _truncate(last_modified) == since
+
+def parse_range(header: str, size: int, max_ranges: int = 16) -> Optional[List[ByteRange]]:
+    # Returns None for headers we ignore (serve the whole body) and raises
+    # RangeNotSatisfiable when no requested range overlaps the content.
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start_text, sep, end_text = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_text:
+                start = int(start_text)
+                end = int(end_text) if end_text else size - 1
+            else:
+                suffix = int(end_text)
+                if suffix == 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+        except ValueError:
+            return None
+        if start > end and end_text:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > max_ranges:
+        return None
+    return _coalesce(ranges)
+
+def _coalesce(ranges: List[ByteRange]) -> List[ByteRange]:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def cache_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_truncate(last_modified).astimezone(timezone.utc), usegmt=True)
+    return headers
+
+class BlobResponse(Response):
+    # Streams a stored blob, or byte ranges of it, straight from the storage
+    # backend. For local blobs it uses the ASGI zero-copy send extension when
+    # the server offers it, so the kernel copies file pages to the socket.
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        storage: StorageBackend,
+        digest: str,
+        size: int,
+        media_type: str,
+        headers: dict,
+        ranges: Optional[List[ByteRange]] = None,
+        send_body: bool = True,
+    ):
+        self.storage = storage
+        self.digest = digest
+        self.size = size
+        self.ranges = ranges
+        self.send_body = send_body
+        self.boundary = None
+        self.parts = []
+        
+        if not ranges:
+            status_code = 200
+            content_length = size
+        elif len(ranges) == 1:
+            status_code = 206
+            start, end = ranges[0]
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            content_length = end - start + 1
+        else:
+            status_code = 206
+            self.boundary = uuid.uuid4().hex
+            content_length = 0
+            # Response adds the charset to text types itself, but not to the parts
+            part_type = f"{media_type}; charset={self.charset}" if media_type.startswith("text/") else media_type
+            for start, end in ranges:
+                preamble = (
+                    f"--{self.boundary}\r\n"
+                    f"Content-Type: {part_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                self.parts.append((preamble, start, end))
+                content_length += len(preamble) + (end - start + 1) + 2
+            self.closing = f"--{self.boundary}--\r\n".encode("latin-1")
+            content_length += len(self.closing)
+            media_type = f"multipart/byteranges; boundary={self.boundary}"
+        
+        headers["Content-Length"] = str(content_length)
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        
+        if self.boundary is None:
+            start, end = self.ranges[0] if self.ranges else (0, self.size - 1)
+            await self._send_range(scope, send, start, end)
+        else:
+            for preamble, start, end in self.parts:
+                await send({"type": "http.response.body", "body": preamble, "more_body": True})
+                await self._send_range(scope, send, start, end)
+                await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+            await send({"type": "http.response.body", "body": self.closing, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_range(self, scope: Scope, send: Send, start: int, end: int):
+        length = end - start + 1
+        if length <= 0:
+            return
+        local_path = self.storage.local_path(self.digest)
+        if local_path is not None and "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(local_path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": start,
+                    "count": length,
+                    "more_body": True,
+                })
+            return
+        async for chunk in self.storage.iter_chunks(self.digest, start, length, self.chunk_size):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
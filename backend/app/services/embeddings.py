@@ -0,0 +1,118 @@
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from typing import List, Optional
+import numpy as np
+from ..config import settings
+from .llm import estimate_tokens
+
+# Pluggable text embedders. All of them return L2-normalized float32 rows, so
+# cosine similarity is a plain dot product.
+
+WORD = re.compile(r"[\w']+")
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+class Embedder(ABC):
+    name: str
+    dim: int
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        ...
+
+class HashingEmbedder(Embedder):
+    # Deterministic, offline: signed feature hashing of word unigrams and
+    # bigrams. No semantics beyond shared vocabulary, but stable across runs,
+    # which is what tests and offline development need.
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = WORD.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        return vector
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return normalize(np.stack([self.embed_one(text) for text in texts]))
+
+class OpenAIEmbedder(Embedder):
+    batch_size = 256
+
+    def __init__(self, api_key: str, model: str):
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=api_key)
+        self.name = model
+        self.dim = 0
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            response = await self.client.embeddings.create(
+                model=self.name, input=texts[start:start + self.batch_size]
+            )
+            rows.extend(item.embedding for item in sorted(response.data, key=lambda d: d.index))
+        if not rows:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        vectors = normalize(np.asarray(rows, dtype=np.float32))
+        self.dim = vectors.shape[1]
+        return vectors
+
+_embedder: Optional[Embedder] = None
+
+def get_embedder() -> Embedder:
+    global _embedder
+    if _embedder is None:
+        if settings.embedding_backend == "hashing":
+            _embedder = HashingEmbedder(settings.embedding_dim)
+        elif settings.embedding_backend == "openai":
+            _embedder = OpenAIEmbedder(settings.openai_api_key, settings.embedding_model)
+        else:
+            raise ValueError(f"Unknown embedding backend: {settings.embedding_backend}")
+    return _embedder
+
+def set_embedder(embedder: Optional[Embedder]):
+    global _embedder
+    _embedder = embedder
+
+def chunk_text(text: str, max_tokens: int = settings.embedding_chunk_tokens) -> List[str]:
+    # Paragraph-aligned chunks; paragraphs over budget are split on words
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        pieces = [paragraph]
+        if estimate_tokens(paragraph) > max_tokens:
+            pieces, piece, piece_chars = [], [], 0
+            for word in paragraph.split():
+                if piece and piece_chars + len(word) + 1 > max_tokens * 4:
+                    pieces.append(" ".join(piece))
+                    piece, piece_chars = [], 0
+                piece.append(word)
+                piece_chars += len(word) + 1
+            if piece:
+                pieces.append(" ".join(piece))
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
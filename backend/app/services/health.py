@@ -0,0 +1,37 @@
+import asyncio
+import time
+from sqlalchemy import text
+from ..config import settings
+from ..database import async_engine
+from .cache import get_redis
+
+# Readiness checks for /health/ready. Each reports its status and latency;
+# a check that doesn't answer within health_check_timeout counts as down.
+
+async def _timed(probe) -> dict:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(probe(), settings.health_check_timeout)
+        result = {"status": "ok"}
+    except asyncio.TimeoutError:
+        result = {"status": "error", "error": "timed out"}
+    except Exception as e:
+        result = {"status": "error", "error": str(e) or type(e).__name__}
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+async def check_database() -> dict:
+    async def probe():
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    return await _timed(probe)
+
+async def check_redis() -> dict:
+    redis = get_redis()
+    if redis is None:
+        return {"status": "disabled"}
+    return await _timed(redis.ping)
+
+async def check_all() -> dict:
+    database, redis = await asyncio.gather(check_database(), check_redis())
+    return {"database": database, "redis": redis}
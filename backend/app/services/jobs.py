@@ -0,0 +1,352 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as OrmSession
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.job import Job
+from .cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Background jobs: the jobs table is the source of truth for status and
+# progress, the queue only carries job ids. With REDIS_ENABLED the queue is a
+# Redis list consumed by `python -m app.worker`; otherwise an in-process
+# asyncio queue is drained by a task started with the API (and in tests).
+#
+# Queues can lose ids (a restart empties the in-process queue, a worker can
+# die mid-job), so workers claim jobs atomically in the table, refresh
+# heartbeat_at while they run them, and periodically put queued jobs that no
+# queue holds and running jobs whose heartbeat stopped back on the queue
+# (recover_jobs). An id delivered twice still runs once.
+
+JobHandler = Callable[[Job, dict], Awaitable[None]]
+
+HANDLERS: Dict[str, JobHandler] = {}
+
+def job_handler(kind: str):
+    def register(func: JobHandler) -> JobHandler:
+        HANDLERS[kind] = func
+        return func
+    return register
+
+class InMemoryQueue:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self.waiting: Set[int] = set()
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def push(self, job_id: int):
+        self.waiting.add(job_id)
+        await self.queue.put(job_id)
+
+    async def pop(self, timeout: float) -> Optional[int]:
+        # Not asyncio.wait_for: before Python 3.12 it can swallow a
+        # cancellation that arrives together with an id, and the cancelled
+        # worker then keeps running
+        getter = asyncio.ensure_future(self.queue.get())
+        try:
+            await asyncio.wait([getter], timeout=timeout)
+        except asyncio.CancelledError:
+            if getter.done():
+                self.queue.put_nowait(getter.result())
+            else:
+                getter.cancel()
+            raise
+        if not getter.done():
+            getter.cancel()
+            return None
+        job_id = getter.result()
+        self.waiting.discard(job_id)
+        return job_id
+
+    async def ack(self, job_id: int):
+        pass
+
+    async def contents(self) -> Tuple[Set[int], Set[int]]:
+        return set(self.waiting), set()
+
+    async def release(self, job_ids: Iterable[int]):
+        pass
+
+class RedisQueue:
+    # Popping moves the id onto a processing list (BLMOVE, Redis 6.2+) where
+    # it stays until the worker acks it, so a worker dying in between leaves
+    # it for recover_jobs instead of dropping it
+    def __init__(self, redis, key: str):
+        self.redis = redis
+        self.key = key
+        self.processing_key = f"{key}:processing"
+
+    async def push(self, job_id: int):
+        await self.redis.lpush(self.key, job_id)
+
+    async def pop(self, timeout: float) -> Optional[int]:
+        item = await self.redis.blmove(self.key, self.processing_key, max(int(timeout), 1), "RIGHT", "LEFT")
+        return int(item) if item is not None else None
+
+    async def ack(self, job_id: int):
+        await self.redis.lrem(self.processing_key, 1, job_id)
+
+    async def contents(self) -> Tuple[Set[int], Set[int]]:
+        # Waiting and processing ids, read atomically so none is in flight between the two
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(self.key, 0, -1)
+            pipe.lrange(self.processing_key, 0, -1)
+            waiting, processing = await pipe.execute()
+        return {int(item) for item in waiting}, {int(item) for item in processing}
+
+    async def release(self, job_ids: Iterable[int]):
+        for job_id in job_ids:
+            await self.redis.lrem(self.processing_key, 0, job_id)
+
+_queue = None
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        redis = get_redis()
+        _queue = RedisQueue(redis, settings.job_queue_key) if redis is not None else InMemoryQueue()
+    return _queue
+
+async def enqueue(db: AsyncSession, kind: str, target_id: Optional[int] = None, payload: Optional[dict] = None) -> Job:
+    job = Job(kind=kind, target_id=target_id, payload=json.dumps(payload or {}), status="queued")
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    await get_queue().push(job.id)
+    return job
+
+async def submit(kind: str, target_id: Optional[int] = None, payload: Optional[dict] = None) -> Job:
+    async with AsyncSessionLocal() as db:
+        return await enqueue(db, kind, target_id, payload)
+
+# Follow-up work triggered by ORM changes (reindexing and the like) is queued
+# on the session and only submitted once the transaction has committed.
+
+def enqueue_after_commit(session: OrmSession, kind: str, target_id: Optional[int] = None, payload: Optional[dict] = None):
+    pending = session.info.setdefault("pending_jobs", {})
+    pending[(kind, target_id, json.dumps(payload or {}, sort_keys=True))] = payload
+
+# The loop only keeps weak references to tasks; hold them until they finish
+_submitting: Set[asyncio.Task] = set()
+
+def _submitted(task: asyncio.Task):
+    _submitting.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Could not submit a follow-up job", exc_info=task.exception())
+
+@event.listens_for(OrmSession, "after_commit")
+def _submit_pending_jobs(session):
+    pending = session.info.pop("pending_jobs", None)
+    if not pending:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Sync sessions (scripts, migrations) run outside the event loop
+        logger.warning("Dropping %d follow-up jobs committed outside the event loop", len(pending))
+        return
+    for (kind, target_id, _), payload in pending.items():
+        task = loop.create_task(submit(kind, target_id, payload))
+        _submitting.add(task)
+        task.add_done_callback(_submitted)
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_pending_jobs(session):
+    session.info.pop("pending_jobs", None)
+
+async def latest_job(db: AsyncSession, kind: str, target_id: int) -> Optional[Job]:
+    result = await db.execute(
+        select(Job)
+        .where(Job.kind == kind, Job.target_id == target_id)
+        .order_by(Job.id.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+async def set_progress(job_id: int, progress: int, total: Optional[int] = None, db: Optional[AsyncSession] = None):
+    values = {"progress": progress}
+    if total is not None:
+        values["total"] = total
+    if db is not None:
+        await db.execute(update(Job).where(Job.id == job_id).values(**values))
+        return
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(Job).where(Job.id == job_id).values(**values))
+        await session.commit()
+
+async def _finish(job_id: int, status: str, error: Optional[str] = None):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(status=status, error=error, finished_at=datetime.now(timezone.utc))
+        )
+        await db.commit()
+
+async def run_job(job_id: int):
+    # Only the worker whose update moves the job out of "queued" runs it
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db:
+        claimed = await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "queued")
+            .values(status="running", started_at=now, heartbeat_at=now, attempts=Job.attempts + 1)
+        )
+        await db.commit()
+        if claimed.rowcount != 1:
+            return
+        job = await db.get(Job, job_id)
+    
+    handler = HANDLERS.get(job.kind)
+    if handler is None:
+        await _finish(job_id, "failed", f"No handler for job kind {job.kind}")
+        return
+    try:
+        await handler(job, json.loads(job.payload or "{}"))
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job_id, job.kind)
+        await _finish(job_id, "failed", str(e))
+    else:
+        await _finish(job_id, "completed")
+
+async def heartbeat(job_ids: Iterable[int]):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.id.in_(list(job_ids)), Job.status == "running")
+            .values(heartbeat_at=datetime.now(timezone.utc))
+        )
+        await db.commit()
+
+async def recover_jobs(queue=None, startup: bool = False) -> List[int]:
+    # Requeues running jobs whose worker stopped sending heartbeats (failing
+    # them after JOB_MAX_ATTEMPTS), ids a dead worker left on the processing
+    # list, and queued jobs that are on no queue: lost with an in-process
+    # queue or a failed push. Outside startup queued jobs get
+    # JOB_STALE_SECONDS to reach their queue first.
+    queue = queue or get_queue()
+    now = datetime.now(timezone.utc)
+    stale_before = now - timedelta(seconds=settings.job_stale_seconds)
+    requeue = set()
+    async with AsyncSessionLocal() as db:
+        last_seen = func.coalesce(Job.heartbeat_at, Job.started_at, Job.created_at)
+        result = await db.execute(select(Job.id, Job.attempts).where(Job.status == "running", last_seen < stale_before))
+        stale = result.all()
+        retry = [job_id for job_id, attempts in stale if attempts < settings.job_max_attempts]
+        exhausted = [job_id for job_id, attempts in stale if attempts >= settings.job_max_attempts]
+        if retry:
+            await db.execute(
+                update(Job).where(Job.id.in_(retry), Job.status == "running").values(status="queued", heartbeat_at=None)
+            )
+            requeue.update(retry)
+        if exhausted:
+            await db.execute(
+                update(Job).where(Job.id.in_(exhausted), Job.status == "running").values(
+                    status="failed", error="The worker running this job stopped", finished_at=now
+                )
+            )
+            logger.error("Failed jobs %s after %d attempts", exhausted, settings.job_max_attempts)
+        await db.commit()
+        
+        waiting, processing = await queue.contents()
+        if processing:
+            result = await db.execute(select(Job.id, Job.status).where(Job.id.in_(processing)))
+            statuses = dict(result.all())
+            left = {job_id for job_id in processing if statuses.get(job_id) != "running"}
+            await queue.release(left)
+            processing -= left
+            requeue.update(job_id for job_id in left if statuses.get(job_id) == "queued")
+        
+        queued = select(Job.id).where(Job.status == "queued")
+        if not startup:
+            queued = queued.where(func.coalesce(Job.updated_at, Job.created_at) < stale_before)
+        result = await db.execute(queued)
+        requeue.update(job_id for job_id in result.scalars() if job_id not in waiting and job_id not in processing)
+    
+    for job_id in sorted(requeue):
+        await queue.push(job_id)
+    if requeue:
+        logger.warning("Requeued %d lost jobs", len(requeue))
+    return sorted(requeue)
+
+async def _release(job_ids: List[int], queue):
+    # Jobs interrupted by a shutdown go straight back on the queue; the
+    # interrupted attempt does not count against JOB_MAX_ATTEMPTS
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Job).where(Job.id.in_(job_ids), Job.status == "running").values(
+                status="queued", heartbeat_at=None, attempts=Job.attempts - 1
+            )
+        )
+        await db.commit()
+    for job_id in job_ids:
+        await queue.push(job_id)
+
+async def _maintain(queue, running: Dict[asyncio.Task, int], stop: asyncio.Event):
+    startup = True
+    while not stop.is_set():
+        try:
+            if running:
+                await heartbeat(set(running.values()))
+            await recover_jobs(queue, startup=startup)
+            startup = False
+        except Exception:
+            logger.exception("Job recovery failed")
+        try:
+            await asyncio.wait_for(stop.wait(), settings.job_heartbeat_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+async def worker_loop(concurrency: int = settings.job_worker_concurrency, stop: Optional[asyncio.Event] = None, queue=None):
+    queue = queue or get_queue()
+    slots = asyncio.Semaphore(concurrency)
+    running: Dict[asyncio.Task, int] = {}
+    stop = stop or asyncio.Event()
+    
+    async def run(job_id: int):
+        try:
+            await run_job(job_id)
+        finally:
+            try:
+                await queue.ack(job_id)
+            except Exception:
+                logger.exception("Could not acknowledge job %s", job_id)
+            slots.release()
+    
+    maintenance = asyncio.create_task(_maintain(queue, running, stop))
+    try:
+        while not stop.is_set():
+            await slots.acquire()
+            job_id = await queue.pop(timeout=1)
+            if job_id is None:
+                slots.release()
+                continue
+            task = asyncio.create_task(run(job_id))
+            running[task] = job_id
+            task.add_done_callback(lambda done: running.pop(done, None))
+        
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    except asyncio.CancelledError:
+        interrupted = list(running.items())
+        for task, _ in interrupted:
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in interrupted), return_exceptions=True)
+        if interrupted:
+            await _release([job_id for _, job_id in interrupted], queue)
+        raise
+    finally:
+        stop.set()
+        maintenance.cancel()
+        await asyncio.gather(maintenance, return_exceptions=True)
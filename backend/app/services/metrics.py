@@ -0,0 +1,253 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from ..config import settings
+from ..database import async_engine, engine, pool_status
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics in the text exposition format, served from /metrics.
+# Each process keeps its own numbers; scrape every worker. Recording is a
+# dict update under a lock, cheap enough to leave on in production.
+#
+# MetricsMiddleware times every HTTP request by route template (never the raw
+# path, to keep the label set bounded), counts request and response bytes
+# (upload and download throughput per route), and attributes the SQL run
+# while serving a request to it, so N+1 patterns show up as routes with high
+# query counts. Queries from background jobs only count towards the totals.
+
+_lock = threading.Lock()
+_registry: List["Metric"] = []
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _sample(name: str, labelnames: Iterable[str], labels: Iterable[str], value: float) -> str:
+    pairs = ",".join(f'{key}="{_escape(str(label))}"' for key, label in zip(labelnames, labels))
+    return f"{name}{{{pairs}}} {value}" if pairs else f"{name} {value}"
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        _registry.append(self)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        ...
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with _lock:
+            values = list(self._values.items())
+        return [_sample(self.name, self.labelnames, labels, value) for labels, value in values]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        # labels -> per-bucket counts (last one is +Inf), then the sum
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        with _lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def samples(self) -> List[str]:
+        with _lock:
+            values = [(labels, list(state)) for labels, state in self._values.items()]
+        names = self.labelnames + ("le",)
+        lines = []
+        for labels, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), state[:-1]):
+                cumulative += count
+                lines.append(_sample(f"{self.name}_bucket", names, labels + (bound,), cumulative))
+            lines.append(_sample(f"{self.name}_sum", self.labelnames, labels, state[-1]))
+            lines.append(_sample(f"{self.name}_count", self.labelnames, labels, cumulative))
+        return lines
+
+class Collected(Metric):
+    # Values read at scrape time, e.g. connection pool state
+    def __init__(self, name: str, help: str, kind: str, labelnames: Tuple[str, ...], collect: Callable[[], Dict[tuple, float]]):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [_sample(self.name, self.labelnames, labels, value) for labels, value in self.collect().items()]
+
+def render() -> str:
+    lines = []
+    for metric in list(_registry):
+        try:
+            lines.extend(metric.render())
+        except Exception:
+            logger.exception("Could not collect metric %s", metric.name)
+    return "\n".join(lines) + "\n"
+
+REQUESTS = Histogram(
+    "rpassistant_http_request_duration_seconds", "HTTP request duration, until the response is fully sent",
+    ("method", "route", "status"))
+REQUEST_QUERIES = Histogram(
+    "rpassistant_http_request_db_queries", "SQL statements run while serving a request",
+    ("method", "route"), QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_SECONDS = Histogram(
+    "rpassistant_http_request_db_seconds", "Time spent in SQL while serving a request",
+    ("method", "route"))
+REQUEST_BYTES = Counter(
+    "rpassistant_http_request_bytes_total", "Request body bytes received (uploads)", ("method", "route"))
+RESPONSE_BYTES = Counter(
+    "rpassistant_http_response_bytes_total", "Response body bytes sent (downloads)", ("method", "route"))
+IN_PROGRESS = Gauge("rpassistant_http_requests_in_progress", "HTTP requests being served", ("method",))
+QUERIES = Counter("rpassistant_db_queries_total", "SQL statements run, including background jobs", ("engine",))
+QUERY_SECONDS = Counter("rpassistant_db_query_seconds_total", "Time spent in SQL, including background jobs", ("engine",))
+
+def _pool_values(key: str) -> Dict[tuple, float]:
+    values = {}
+    for name, pooled in (("async", async_engine), ("sync", engine)):
+        value = pool_status(pooled).get(key)
+        if value is not None:
+            values[(name,)] = value
+    return values
+
+for _key, _kind, _help in (
+    ("size", "gauge", "Connections the pool keeps open"),
+    ("checked_out", "gauge", "Connections currently in use"),
+    ("overflow", "gauge", "Connections open beyond the pool size"),
+    ("checkouts", "counter", "Connections handed out by the pool"),
+    ("timeouts", "counter", "Checkouts that gave up waiting for a free connection"),
+    ("wait_seconds", "counter", "Time spent waiting for a free connection"),
+):
+    _suffix = "_total" if _kind == "counter" else ""
+    Collected(f"rpassistant_db_pool_{_key}{_suffix}", _help, _kind, ("engine",), lambda key=_key: _pool_values(key))
+
+# Per-request SQL accounting. SQLAlchemy runs async statements in greenlets
+# that share the request's context, so the request's stats object is visible
+# from these hooks.
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    query_seconds: float = 0.0
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    engine_label = "async" if conn.dialect.is_async else "sync"
+    QUERIES.inc(engine_label)
+    QUERY_SECONDS.inc(engine_label, amount=elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.templates: Dict[Callable, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"  # 404s; raw paths would make the label set unbounded
+        if endpoint not in self.templates:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is not None:
+                    self.templates.setdefault(route.endpoint, route.path)
+        return self.templates.get(endpoint, getattr(endpoint, "__name__", "unknown"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        received = sent = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status_code, sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopysend":
+                sent += message.get("count") or 0
+            await send(message)
+
+        method = scope["method"]
+        IN_PROGRESS.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_PROGRESS.dec(method)
+            _request_stats.reset(token)
+            route = self._route(scope)
+            REQUESTS.observe(elapsed, method, route, str(status_code))
+            REQUEST_QUERIES.observe(stats.queries, method, route)
+            REQUEST_QUERY_SECONDS.observe(stats.query_seconds, method, route)
+            if received:
+                REQUEST_BYTES.inc(method, route, amount=received)
+            if sent:
+                RESPONSE_BYTES.inc(method, route, amount=sent)
+            if stats.queries >= settings.metrics_query_warning:
+                logger.warning(
+                    "%s %s ran %d SQL statements (%.0f ms); possible N+1",
+                    method, route, stats.queries, stats.query_seconds * 1000
+                )
@@ -0,0 +1,121 @@
+import json
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from ..models.npc import NPC
+from ..models.session import Session as SessionModel
+from .llm import get_llm_client
+from .prompt_context import ContextBundle
+
+# Server-side NPC generation. The model is asked for labelled sections, one
+# per NPC field, name first; SectionParser splits its output into fields as
+# tokens arrive so the DM sees words while the model is still writing.
+
+MAX_TOKENS = 700
+
+# (field, label the model is asked to use, what goes there)
+SECTIONS = [
+    ("name", "Name", "the NPC's name"),
+    ("role", "Role", "a few words, e.g. shopkeeper, witness, antagonist"),
+    ("appearance", "Appearance", "two or three sentences"),
+    ("personality_traits", "Personality", "two or three sentences"),
+    ("backstory", "Backstory", "one or two paragraphs"),
+    ("relevant_skills_stats", "Skills and stats", "what matters at the table, in the game system's terms"),
+    ("relationship_to_campaign", "Relationship to the campaign", "how they tie into the story so far"),
+]
+
+SYSTEM_PROMPT = "You are a game master's assistant who writes vivid, playable NPCs for tabletop RPGs."
+
+def build_prompt(context: ContextBundle, parameters: dict) -> str:
+    lines = ["Create one non-player character for this tabletop RPG campaign.", "", context.render(), ""]
+    requested = [f"- {key.replace('_', ' ')}: {value}" for key, value in parameters.items() if value]
+    if requested:
+        lines.append("The game master asked for:")
+        lines.extend(requested)
+        lines.append("")
+    lines.append("Answer with exactly these labelled sections, each label at the start of its own line, in this order:")
+    lines.extend(f"{label}: <{description}>" for _, label, description in SECTIONS)
+    return "\n".join(lines)
+
+class SectionParser:
+    # Text at the start of a line is held back only until it is clear whether
+    # it begins a "Label:"; everything else is passed on immediately.
+    def __init__(self):
+        self.fields = {label.lower(): field for field, label, _ in SECTIONS}
+        self.longest_label = max(len(label) for _, label, _ in SECTIONS) + 6  # room for markdown like **...**
+        self.values: Dict[str, str] = {}
+        self.field: Optional[str] = None
+        self.pending = ""
+        self.at_line_start = True
+
+    def _label(self, text: str) -> Optional[str]:
+        return self.fields.get(text.strip().strip("*#_").strip().lower())
+
+    def _emit(self, text: str) -> List[Tuple[str, str]]:
+        if self.field is None:
+            return []
+        current = self.values.get(self.field, "")
+        if not current:
+            text = text.lstrip(" *")
+            if not text.strip():
+                return []
+        self.values[self.field] = current + text
+        return [(self.field, text)]
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        pieces = []
+        self.pending += text
+        while self.pending:
+            if self.at_line_start:
+                newline = self.pending.find("\n")
+                colon = self.pending.find(":")
+                if colon != -1 and (newline == -1 or colon < newline):
+                    field = self._label(self.pending[:colon])
+                    if field is not None:
+                        self.field = field
+                        self.values.setdefault(field, "")
+                        self.pending = self.pending[colon + 1:]
+                    self.at_line_start = False
+                elif newline != -1 or len(self.pending) > self.longest_label:
+                    self.at_line_start = False
+                else:
+                    break  # can't tell yet whether this line starts with a label
+            else:
+                newline = self.pending.find("\n")
+                if newline == -1:
+                    chunk, self.pending = self.pending, ""
+                else:
+                    chunk, self.pending = self.pending[:newline + 1], self.pending[newline + 1:]
+                    self.at_line_start = True
+                pieces.extend(self._emit(chunk))
+        return pieces
+
+    def finish(self) -> List[Tuple[str, str]]:
+        self.at_line_start = False
+        pieces = self.feed("")
+        self.values = {field: value.strip() for field, value in self.values.items() if value.strip()}
+        return pieces
+
+async def stream_fields(prompt: str, parser: SectionParser) -> AsyncIterator[Tuple[str, str]]:
+    # Closing this generator (the client went away) closes the model stream too
+    async with aclosing(get_llm_client().stream(prompt, system=SYSTEM_PROMPT, max_tokens=MAX_TOKENS)) as tokens:
+        async for token in tokens:
+            for piece in parser.feed(token):
+                yield piece
+    for piece in parser.finish():
+        yield piece
+
+def build_npc(session: SessionModel, values: Dict[str, str], parameters: dict) -> NPC:
+    return NPC(
+        session_id=session.id,
+        campaign_id=session.campaign_id,
+        owner_id=session.owner_id,
+        name=values.get("name") or parameters.get("name") or "Unnamed NPC",
+        role=values.get("role") or parameters.get("role"),
+        appearance=values.get("appearance"),
+        personality_traits=values.get("personality_traits"),
+        backstory=values.get("backstory"),
+        relevant_skills_stats=values.get("relevant_skills_stats"),
+        relationship_to_campaign=values.get("relationship_to_campaign"),
+        generated_parameters=json.dumps(parameters),
+        ai_generated=True,
+    )
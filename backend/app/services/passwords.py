@@ -0,0 +1,51 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from ..config import settings
+
+# Pinning min/max rounds to the configured cost makes passlib flag hashes made
+# with any other cost, so they get rehashed on the next successful login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds,
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash",
+)
+_max_pending = settings.password_hash_workers + settings.password_hash_queue_size
+_pending = 0
+
+def _release():
+    global _pending
+    _pending -= 1
+
+async def _run(func, *args):
+    global _pending
+    if _pending >= _max_pending:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service busy, please retry",
+            headers={"Retry-After": str(settings.password_hash_retry_after)},
+        )
+    _pending += 1
+    loop = asyncio.get_running_loop()
+    # A cancelled request can't stop a hash that is already running, so the
+    # slot is only freed once the worker is done with it
+    future = _executor.submit(func, *args)
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_release))
+    return await asyncio.wrap_future(future)
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+# Returns (verified, new_hash); new_hash is set when the stored hash uses a
+# different bcrypt cost and should be replaced.
+async def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run(pwd_context.verify_and_update, password, hashed_password)
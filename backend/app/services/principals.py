@@ -0,0 +1,113 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Iterable, Optional, Set
+from sqlalchemy import DateTime, event, inspect
+from sqlalchemy.orm import Session as OrmSession
+from ..config import settings
+from ..models.user import User
+from .cache import TTLCache, get_redis
+
+logger = logging.getLogger(__name__)
+
+# Authenticated requests resolve their User from here instead of the database.
+# Entries are plain column dicts (never the password hash) so they can live in
+# Redis and be shared between workers. With Redis enabled it is the only tier:
+# a per-process copy would keep serving a user another worker invalidated.
+# For the same reason the in-process cache is off when several workers run
+# without Redis (see response_cache.enabled).
+CACHED_COLUMNS = [c for c in User.__table__.columns if c.key != "hashed_password"]
+
+_local = TTLCache(settings.principal_cache_size, settings.principal_cache_ttl)
+_invalidating: Set[asyncio.Task] = set()
+
+def principal_key(user_id: Optional[int] = None, email: Optional[str] = None) -> str:
+    if user_id is not None:
+        return f"principal:{user_id}"
+    return f"principal:email:{email}"
+
+def _dump(user: User) -> dict:
+    data = {}
+    for column in CACHED_COLUMNS:
+        value = getattr(user, column.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data[column.key] = value
+    return data
+
+def _load(data: dict) -> User:
+    values = {}
+    for column in CACHED_COLUMNS:
+        value = data.get(column.key)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        values[column.key] = value
+    return User(**values)
+
+def _local_enabled() -> bool:
+    return settings.web_concurrency <= 1
+
+async def get_principal(key: str) -> Optional[User]:
+    redis = get_redis()
+    if redis is None:
+        data = _local.get(key) if _local_enabled() else None
+    else:
+        raw = await redis.get(key)
+        data = json.loads(raw) if raw is not None else None
+    return _load(data) if data is not None else None
+
+async def set_principal(key: str, user: User):
+    data = _dump(user)
+    redis = get_redis()
+    if redis is None:
+        if _local_enabled():
+            _local.set(key, data)
+    else:
+        await redis.set(key, json.dumps(data), ex=settings.principal_cache_ttl)
+
+def _keys_for(user_id: int, emails: Iterable[str]) -> list:
+    return [principal_key(user_id=user_id)] + [principal_key(email=e) for e in emails if e]
+
+def _invalidated(task: asyncio.Task):
+    _invalidating.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Could not invalidate a cached principal", exc_info=task.exception())
+
+def invalidate_user(user_id: int, emails: Iterable[str] = ()):
+    keys = _keys_for(user_id, emails)
+    for key in keys:
+        _local.delete(key)
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        task = loop.create_task(redis.delete(*keys))
+        _invalidating.add(task)
+        task.add_done_callback(_invalidated)
+    else:
+        import redis as sync_redis
+        sync_redis.Redis.from_url(settings.redis_url).delete(*keys)
+
+# Changes to users (deactivation, email or subscription changes, deletes) are
+# collected during flush and purged once the transaction actually commits.
+@event.listens_for(OrmSession, "before_flush")
+def _collect_changed_users(session, flush_context, instances):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            history = inspect(obj).attrs.email.history
+            emails = {obj.email, *(history.deleted or ())}
+            session.info.setdefault("principal_invalidations", {}).setdefault(obj.id, set()).update(emails)
+
+@event.listens_for(OrmSession, "after_commit")
+def _purge_changed_users(session):
+    for user_id, emails in session.info.pop("principal_invalidations", {}).items():
+        invalidate_user(user_id, emails)
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("principal_invalidations", None)
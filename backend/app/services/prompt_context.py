@@ -0,0 +1,163 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..models.campaign import Campaign
+from ..models.npc import NPC
+from ..models.session import Session as SessionModel
+from . import response_cache
+from .cache import TTLCache, get_redis
+from .llm import estimate_tokens
+
+# Campaign context for AI prompts, assembled once and cached. A bundle is made
+# of independently cached sections, each trimmed to its token budget and
+# stored with its token count:
+#   campaign  name, system, description and notes
+#   recaps    the most recent session recaps
+#   session   one session, its preparation notes and its NPCs
+# Sections carry the response cache's version stamps for the rows they were
+# built from, so a write only rebuilds the sections it affects: an NPC edit
+# rebuilds that session's section and leaves the campaign and recaps alone.
+# Sections are only cached while the response cache is enabled.
+# Callers check ownership; bundles are not per user.
+
+ENTRY_PREFIX = "rpassistant:context:"
+MAX_RECAPS = 20
+MAX_NPCS = 50
+
+_local_sections = TTLCache(settings.response_cache_size, settings.response_cache_ttl)
+
+@dataclass
+class Section:
+    text: str
+    tokens: int
+
+    @classmethod
+    def of(cls, lines: List[str]) -> "Section":
+        text = "\n".join(lines)
+        return cls(text, estimate_tokens(text))
+
+@dataclass
+class ContextBundle:
+    sections: List[Section] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return sum(section.tokens for section in self.sections)
+
+    def render(self) -> str:
+        return "\n\n".join(section.text for section in self.sections if section.text)
+
+def _fit(text: str, budget: int) -> str:
+    # Trim to roughly `budget` tokens, at a word boundary
+    text = text.strip()
+    if estimate_tokens(text) <= budget:
+        return text
+    cut = text[: max(budget, 0) * 4]
+    if " " in cut:
+        cut = cut[: cut.rfind(" ")]
+    return cut.rstrip() + " ..."
+
+async def _campaign_section(db: AsyncSession, campaign_id: int) -> Section:
+    row = (await db.execute(
+        select(Campaign.name, Campaign.rpg_system, Campaign.description, Campaign.campaign_notes)
+        .where(Campaign.id == campaign_id)
+    )).one()
+    lines = [f"Campaign: {row.name} ({row.rpg_system})"]
+    remaining = settings.prompt_context_campaign_tokens - estimate_tokens(lines[0])
+    for label, text in (("Summary", row.description), ("Campaign notes", row.campaign_notes)):
+        if text and text.strip() and remaining > 0:
+            lines.append(f"{label}: {_fit(text, remaining)}")
+            remaining -= estimate_tokens(lines[-1])
+    return Section.of(lines)
+
+async def _recaps_section(db: AsyncSession, campaign_id: int) -> Section:
+    rows = (await db.execute(
+        select(SessionModel.session_number, SessionModel.name, SessionModel.recap)
+        .where(SessionModel.campaign_id == campaign_id, SessionModel.recap.is_not(None), SessionModel.recap != "")
+        .order_by(SessionModel.session_number.desc())
+        .limit(MAX_RECAPS)
+    )).all()
+    recaps, remaining = [], settings.prompt_context_recap_tokens
+    for row in rows:  # newest first, so older sessions are the ones dropped
+        title = f"Session {row.session_number}" + (f" ({row.name})" if row.name else "")
+        recap = f"{title}: {_fit(row.recap, remaining)}"
+        recaps.append(recap)
+        remaining -= estimate_tokens(recap)
+        if remaining <= 0:
+            break
+    if not recaps:
+        return Section("", 0)
+    return Section.of(["Previous sessions:"] + recaps[::-1])
+
+async def _session_section(db: AsyncSession, session_id: int) -> Section:
+    session = (await db.execute(
+        select(SessionModel.session_number, SessionModel.name, SessionModel.preparation_notes)
+        .where(SessionModel.id == session_id)
+    )).one()
+    npcs = (await db.execute(
+        select(NPC.name, NPC.role).where(NPC.session_id == session_id).order_by(NPC.id).limit(MAX_NPCS)
+    )).all()
+    lines = [f"Current session: Session {session.session_number}" + (f" ({session.name})" if session.name else "")]
+    remaining = settings.prompt_context_session_tokens - estimate_tokens(lines[0])
+    if npcs:
+        names = ", ".join(f"{npc.name} ({npc.role})" if npc.role else npc.name for npc in npcs)
+        lines.append(f"NPCs in this session: {_fit(names, remaining)}")
+        remaining -= estimate_tokens(lines[-1])
+    if session.preparation_notes and session.preparation_notes.strip() and remaining > 0:
+        lines.append(f"Preparation notes: {_fit(session.preparation_notes, remaining)}")
+    return Section.of(lines)
+
+async def _get(key: str) -> Optional[dict]:
+    data = _local_sections.get(key)
+    if data is None:
+        redis = get_redis()
+        if redis is not None:
+            raw = await redis.get(ENTRY_PREFIX + key)
+            if raw is not None:
+                data = json.loads(raw)
+                _local_sections.set(key, data)
+    return data
+
+async def _put(key: str, data: dict):
+    _local_sections.set(key, data)
+    redis = get_redis()
+    if redis is not None:
+        await redis.set(ENTRY_PREFIX + key, json.dumps(data), ex=settings.response_cache_ttl)
+
+async def _section(key: str, scopes: List[str], build: Callable[[], Awaitable[Section]]) -> Section:
+    if not response_cache.enabled():
+        return await build()
+    await response_cache.settle()
+    data = await _get(key)
+    if data is not None and await response_cache.current_versions(data["versions"]) == data["versions"]:
+        return Section(**data["section"])
+    # Stamps first, as in response_cache.cached
+    versions = await response_cache.current_versions(scopes, create=True)
+    section = await build()
+    await _put(key, {"section": asdict(section), "versions": versions})
+    return section
+
+async def build(db: AsyncSession, campaign_id: int, session_id: Optional[int] = None) -> ContextBundle:
+    sections = [
+        await _section(
+            f"campaign:{campaign_id}",
+            [response_cache.campaign_scope(campaign_id)],
+            lambda: _campaign_section(db, campaign_id)
+        ),
+        await _section(
+            f"recaps:{campaign_id}",
+            [response_cache.sessions_scope(campaign_id)],
+            lambda: _recaps_section(db, campaign_id)
+        ),
+    ]
+    if session_id is not None:
+        # Session edits bump the session's NPC scope too, so it covers both
+        sections.append(await _section(
+            f"session:{session_id}",
+            [response_cache.npcs_scope(session_id)],
+            lambda: _session_section(db, session_id)
+        ))
+    return ContextBundle(sections)
@@ -0,0 +1,266 @@
+import logging
+import math
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, Request, status
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..models.job import Job
+from ..models.session import Session as SessionModel
+from ..models.user import User
+from .cache import TTLCache, get_redis
+
+logger = logging.getLogger(__name__)
+
+# Per-user request rates and concurrency caps, both set per subscription tier
+# (settings.rate_limits / settings.concurrency_limits).
+#
+# Rates are token buckets per user and route group: a limit of "300/minute"
+# allows bursts of 300 requests and refills at 5 per second. Buckets live in
+# Redis when it is enabled so every worker shares them, otherwise in process.
+# Responses carry RateLimit-Limit/-Remaining/-Reset for the tightest bucket
+# the request drew from; rejected requests get 429 with Retry-After.
+#
+# Concurrency caps bound expensive work per user: in-flight generation streams
+# hold an expiring slot, and queued or running background jobs are counted
+# from the jobs table. Limiter failures (Redis down) let requests through
+# rather than taking the API down with them.
+
+BUCKET_PREFIX = "rpassistant:ratelimit:"
+SLOT_PREFIX = "rpassistant:slots:"
+SLOT_TTL = 600  # seconds; slots a crashed request never released expire after this
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+MAX_LOCAL_BUCKETS = 100000
+
+# KEYS[1] bucket; ARGV capacity, refill per second. Returns {allowed, tokens left}
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+# KEYS[1] slot set; ARGV slot id, cap, ttl. Returns 1 if the slot was taken
+ACQUIRE_SLOT = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+if redis.call("ZCARD", KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call("ZADD", KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+redis.call("EXPIRE", KEYS[1], tonumber(ARGV[3]))
+return 1
+"""
+
+_local_buckets = TTLCache(MAX_LOCAL_BUCKETS, PERIODS["day"])
+_local_slots: Dict[str, Dict[str, float]] = {}
+_scripts = {}
+
+@dataclass
+class Quota:
+    limit: int
+    remaining: int
+    reset: int  # seconds until the bucket is full again
+    retry_after: int = 0
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+        }
+        if self.retry_after:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+def parse_limit(limit: str) -> Tuple[int, int]:
+    # "300/minute" -> (300, 60)
+    count, _, period = limit.partition("/")
+    return int(count), PERIODS[period.strip().rstrip("s")]
+
+def tier(user: User) -> str:
+    name = user.subscription_status or "free"
+    if name != "free" and user.subscription_expires is not None and user.subscription_expires < datetime.utcnow():
+        name = "free"
+    return name if name in settings.rate_limits else "free"
+
+def _script(redis, source: str):
+    if source not in _scripts:
+        _scripts[source] = redis.register_script(source)
+    return _scripts[source]
+
+def _take_local(key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+    now = time.monotonic()
+    tokens, ts = _local_buckets.get(key) or (capacity, now)
+    tokens = min(capacity, tokens + (now - ts) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    _local_buckets.set(key, (tokens, now))
+    return allowed, tokens
+
+async def take(user: User, group: str) -> Optional[Quota]:
+    # Draws one request from the user's bucket for `group`; None if unlimited
+    spec = settings.rate_limits.get(tier(user), {}).get(group)
+    if not settings.rate_limit_enabled or spec is None:
+        return None
+    capacity, period = parse_limit(spec)
+    rate = capacity / period
+    key = f"{BUCKET_PREFIX}{group}:{user.id}"
+    redis = get_redis()
+    try:
+        if redis is not None:
+            allowed, tokens = await _script(redis, TOKEN_BUCKET)(keys=[key], args=[capacity, rate])
+            allowed, tokens = bool(int(allowed)), float(tokens)
+        else:
+            allowed, tokens = _take_local(key, capacity, rate)
+    except Exception:
+        logger.exception("Rate limiter unavailable; letting the request through")
+        return None
+    return Quota(
+        limit=capacity,
+        remaining=int(tokens),
+        reset=math.ceil((capacity - tokens) / rate),
+        retry_after=0 if allowed else max(1, math.ceil((1 - tokens) / rate)),
+    )
+
+async def check(request: Request, user: User, group: str):
+    quota = await take(user, group)
+    if quota is None:
+        return
+    # Report the bucket closest to running out
+    current = getattr(request.state, "rate_limit", None)
+    if current is None or quota.remaining / quota.limit <= current.remaining / current.limit:
+        request.state.rate_limit = quota
+    if quota.retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded, please retry later",
+            headers=quota.headers(),
+        )
+
+def concurrency_limit(user: User, name: str) -> Optional[int]:
+    if not settings.rate_limit_enabled:
+        return None
+    return settings.concurrency_limits.get(tier(user), {}).get(name)
+
+def too_many(name: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"Too many {name} requests in progress",
+        headers={"Retry-After": "10"},
+    )
+
+class Slot:
+    # One unit of a per-user concurrency cap, held for the life of a request
+    def __init__(self, key: Optional[str] = None):
+        self.key = key
+        self.id = uuid.uuid4().hex
+
+    async def release(self):
+        if self.key is None:
+            return
+        redis = get_redis()
+        try:
+            if redis is not None:
+                await redis.zrem(self.key, self.id)
+            else:
+                held = _local_slots.get(self.key, {})
+                held.pop(self.id, None)
+                if not held:
+                    _local_slots.pop(self.key, None)
+        except Exception:
+            logger.exception("Could not release concurrency slot; it expires on its own")
+
+async def acquire(user: User, name: str) -> Slot:
+    limit = concurrency_limit(user, name)
+    if limit is None:
+        return Slot()
+    slot = Slot(f"{SLOT_PREFIX}{name}:{user.id}")
+    redis = get_redis()
+    try:
+        if redis is not None:
+            taken = await _script(redis, ACQUIRE_SLOT)(keys=[slot.key], args=[slot.id, limit, SLOT_TTL])
+        else:
+            now = time.time()
+            held = {id_: until for id_, until in _local_slots.get(slot.key, {}).items() if until > now}
+            taken = len(held) < limit
+            if taken:
+                held[slot.id] = now + SLOT_TTL
+            _local_slots[slot.key] = held
+    except Exception:
+        logger.exception("Concurrency limiter unavailable; letting the request through")
+        return Slot()
+    if not int(taken):
+        raise too_many(name)
+    return slot
+
+JOB_LOCK_KEY = 0x524A4231  # advisory lock id, distinct from the blob lock's
+
+async def lock_jobs(db: AsyncSession, user: User):
+    # Starting a job reads the user's active jobs and then enqueues one; two
+    # concurrent requests would both see room under the cap (and no duplicate)
+    # and both enqueue. They serialize on a PostgreSQL advisory lock per user,
+    # held until the transaction that enqueues the job commits. SQLite (tests
+    # and local development) takes no lock here.
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(:key, :user_id)"),
+            {"key": JOB_LOCK_KEY, "user_id": user.id}
+        )
+
+async def check_jobs(db: AsyncSession, user: User, kind: str):
+    # Background jobs on a user's sessions count against their cap until they
+    # finish. Callers hold lock_jobs() from before this check until enqueue.
+    limit = concurrency_limit(user, kind)
+    if limit is None:
+        return
+    active = await db.scalar(
+        select(func.count(Job.id))
+        .join(SessionModel, SessionModel.id == Job.target_id)
+        .where(Job.kind == kind, Job.status.in_(("queued", "running")), SessionModel.owner_id == user.id)
+    )
+    if active >= limit:
+        raise too_many(kind)
+
+class RateLimitHeadersMiddleware:
+    # Adds the RateLimit-* headers recorded by check() to whatever response
+    # the route produced, including streams and cached responses
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        state = scope.setdefault("state", {})
+
+        async def send_with_headers(message):
+            quota = state.get("rate_limit")
+            if message["type"] == "http.response.start" and quota is not None:
+                present = {name.lower() for name, _ in message.get("headers", [])}
+                extra = [
+                    (name.lower().encode(), value.encode())
+                    for name, value in quota.headers().items()
+                    if name.lower().encode() not in present
+                ]
+                message["headers"] = list(message.get("headers", [])) + extra
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+from typing import List, Optional
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.campaign import Campaign
+from ..models.job import Job
+from ..models.session import Session as SessionModel
+from ..models.summary import SummaryCache
+from . import jobs, vector_index
+from .llm import LLMClient, estimate_tokens, get_llm_client
+
+JOB_KIND = "recap"
+
+MAP_PROMPT = (
+    "Summarize this part of a tabletop RPG session transcript. Keep names of "
+    "characters, NPCs, places and items, decisions the party made, and open "
+    "plot threads. Write in past tense.\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "Combine these consecutive partial summaries of one tabletop RPG session "
+    "into a single recap, in order, without repeating events.\n\n{text}"
+)
+
+# Transcripts are cut into token-bounded windows of whole lines, packed
+# greedily from the start. Edits near the end of a transcript therefore only
+# change the last windows, and every other window's summary is served from
+# summary_cache (keyed by the hash of model + prompt + text). Partial summaries
+# are then merged level by level until one recap is left.
+
+def split_windows(text: str, max_tokens: int) -> List[str]:
+    windows, current, current_tokens = [], [], 0
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        tokens = estimate_tokens(line)
+        while tokens > max_tokens:
+            # A single enormous line: hard-split it on the character budget
+            head, line = line[: max_tokens * 4], line[max_tokens * 4:]
+            if current:
+                windows.append("\n".join(current))
+                current, current_tokens = [], 0
+            windows.append(head)
+            tokens = estimate_tokens(line)
+        if current and current_tokens + tokens > max_tokens:
+            windows.append("\n".join(current))
+            current, current_tokens = [], 0
+        if line:
+            current.append(line)
+            current_tokens += tokens
+    if current:
+        windows.append("\n".join(current))
+    return windows
+
+def group_for_reduce(summaries: List[str], max_tokens: int) -> List[List[str]]:
+    # Always at least two summaries per group so every level shrinks
+    groups, current, current_tokens = [], [], 0
+    for summary in summaries:
+        tokens = estimate_tokens(summary)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(summary)
+        current_tokens += tokens
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
+
+def cache_key(prompt: str, system: Optional[str] = None) -> str:
+    return hashlib.sha256(f"{settings.llm_model}\0{system or ''}\0{prompt}".encode()).hexdigest()
+
+class RecapEngine:
+    def __init__(
+        self,
+        client: Optional[LLMClient] = None,
+        system: Optional[str] = None,
+        concurrency: int = settings.recap_concurrency,
+    ):
+        self.client = client or get_llm_client()
+        self.system = system
+        self.slots = asyncio.Semaphore(concurrency)
+
+    async def _cached(self, keys: List[str]) -> dict:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(SummaryCache.key, SummaryCache.summary).where(SummaryCache.key.in_(keys))
+            )
+            return dict(result.all())
+
+    async def _store(self, key: str, summary: str, input_tokens: int):
+        async with AsyncSessionLocal() as db:
+            dialect = db.bind.dialect.name
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            await db.execute(
+                insert(SummaryCache)
+                .values(key=key, summary=summary, input_tokens=input_tokens)
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+            await db.commit()
+
+    async def _summarize(self, prompt: str, key: str) -> str:
+        async with self.slots:
+            summary = await self.client.complete(
+                prompt, system=self.system, max_tokens=settings.recap_summary_tokens
+            )
+        await self._store(key, summary.strip(), estimate_tokens(prompt))
+        return summary.strip()
+
+    async def summarize_all(self, template: str, texts: List[str], on_done=None) -> List[str]:
+        prompts = [template.format(text=text) for text in texts]
+        keys = [cache_key(prompt, self.system) for prompt in prompts]
+        cached = await self._cached(keys)
+        
+        async def run(prompt: str, key: str) -> str:
+            summary = cached.get(key)
+            if summary is None:
+                summary = await self._summarize(prompt, key)
+            if on_done is not None:
+                await on_done()
+            return summary
+        
+        return await asyncio.gather(*(run(p, k) for p, k in zip(prompts, keys)))
+
+    async def recap(self, transcript: str, on_window_done=None) -> str:
+        windows = split_windows(transcript, settings.recap_window_tokens)
+        if not windows:
+            return ""
+        summaries = await self.summarize_all(MAP_PROMPT, windows, on_window_done)
+        while len(summaries) > 1:
+            groups = group_for_reduce(summaries, settings.recap_window_tokens)
+            summaries = await self.summarize_all(REDUCE_PROMPT, ["\n\n".join(g) for g in groups])
+        return summaries[0]
+
+@jobs.job_handler(JOB_KIND)
+async def generate_recap(job: Job, payload: dict):
+    session_id = job.target_id
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(SessionModel.transcript, Campaign.name, Campaign.rpg_system)
+            .join(Campaign)
+            .where(SessionModel.id == session_id)
+        )
+        row = result.first()
+    if row is None:
+        raise ValueError("Session not found")
+    if not row.transcript:
+        raise ValueError("Session has no transcript")
+    
+    engine = RecapEngine(
+        system=f"You write session recaps for the {row.rpg_system} campaign \"{row.name}\"."
+    )
+    total = len(split_windows(row.transcript, settings.recap_window_tokens))
+    done = 0
+    await jobs.set_progress(job.id, 0, total)
+    
+    async def window_done():
+        nonlocal done
+        done += 1
+        await jobs.set_progress(job.id, done, total)
+    
+    recap = await engine.recap(row.transcript, on_window_done=window_done)
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(SessionModel).where(SessionModel.id == session_id).values(recap=recap))
+        await db.commit()
+    # Bulk updates bypass the ORM change hooks, so refresh the lore index explicitly
+    await jobs.submit(vector_index.JOB_KIND, session_id, {"source_type": "session"})
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from ..config import settings
+from ..models.user import User
+from . import changes
+from .cache import TTLCache, get_redis
+from .downloads import is_not_modified, strong_etag
+
+# Cache for the read endpoints clients poll during play. Every response is
+# stored with the version stamps of the scopes it was built from, e.g.
+# "campaign:3" or "session:7:npcs". A write bumps the stamps of the scopes it
+# touches once its transaction commits (see the bottom of this file), which
+# orphans every entry built from older data. A hit costs a version lookup
+# and no database access; the ETag lets clients skip the body too.
+#
+# Stamps and entries live in Redis when it is enabled, so all workers share
+# them. Without Redis each process keeps its own and only sees its own writes,
+# so the cache is only used when there is a single worker (see enabled()).
+
+VERSION_PREFIX = "rpassistant:cache:version:"
+ENTRY_PREFIX = "rpassistant:cache:response:"
+
+_local_entries = TTLCache(settings.response_cache_size, settings.response_cache_ttl)
+_local_versions = TTLCache(settings.response_cache_size, settings.response_cache_ttl)
+_pending_bumps: Set[asyncio.Task] = set()
+
+@dataclass
+class CacheEntry:
+    body: str
+    owner_id: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Scopes only known once the data is loaded, e.g. an NPC list's campaign
+    depends_on: List[str] = field(default_factory=list)
+    versions: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def etag(self) -> str:
+        return strong_etag(hashlib.sha256(self.body.encode()).hexdigest()[:32])
+
+def campaign_scope(campaign_id: int) -> str:
+    return f"campaign:{campaign_id}"
+
+def sessions_scope(campaign_id: int) -> str:
+    return f"campaign:{campaign_id}:sessions"
+
+def npcs_scope(session_id: int) -> str:
+    return f"session:{session_id}:npcs"
+
+def enabled() -> bool:
+    # Per-process stamps would let other workers serve stale entries for up
+    # to response_cache_ttl after a write
+    return settings.response_cache_enabled and (get_redis() is not None or settings.web_concurrency <= 1)
+
+def render(model, data: Any, **dump_options) -> str:
+    adapter = TypeAdapter(model)
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True), **dump_options).decode()
+
+def _new_stamp() -> str:
+    return f"{time.time_ns():x}"
+
+# Version stamps are shared with other caches of derived data (see
+# services/prompt_context), which get the same invalidation for free
+
+async def current_versions(scopes: Iterable[str], create: bool = False) -> Dict[str, str]:
+    scopes = list(scopes)
+    if not scopes:
+        return {}
+    redis = get_redis()
+    if redis is not None:
+        stamps = await redis.mget([VERSION_PREFIX + scope for scope in scopes])
+    else:
+        stamps = [_local_versions.get(scope) for scope in scopes]
+    versions = dict(zip(scopes, stamps))
+    if create:
+        # First use of a scope: start it at a fresh stamp. Never reuse an old
+        # value, or entries from before an eviction would come back to life.
+        for scope, stamp in versions.items():
+            if stamp is not None:
+                continue
+            stamp = _new_stamp()
+            if redis is not None:
+                if not await redis.set(VERSION_PREFIX + scope, stamp, nx=True):
+                    stamp = await redis.get(VERSION_PREFIX + scope)
+            else:
+                _local_versions.set(scope, stamp)
+            versions[scope] = stamp
+    return versions
+
+async def settle():
+    # Let this process's own recent writes land before trusting a stamp
+    if _pending_bumps:
+        await asyncio.gather(*_pending_bumps, return_exceptions=True)
+
+async def _get_entry(key: str) -> Optional[CacheEntry]:
+    data = _local_entries.get(key)
+    if data is None:
+        redis = get_redis()
+        if redis is not None:
+            raw = await redis.get(ENTRY_PREFIX + key)
+            if raw is not None:
+                data = json.loads(raw)
+                _local_entries.set(key, data)
+    return CacheEntry(**data) if data is not None else None
+
+async def _put_entry(key: str, entry: CacheEntry):
+    data = asdict(entry)
+    _local_entries.set(key, data)
+    redis = get_redis()
+    if redis is not None:
+        await redis.set(ENTRY_PREFIX + key, json.dumps(data), ex=settings.response_cache_ttl)
+
+def _respond(request: Request, entry: CacheEntry) -> Response:
+    etag = entry.etag
+    headers = {**entry.headers, "ETag": f"W/{etag}", "Cache-Control": "private, no-cache"}
+    if is_not_modified(request.headers, etag, None):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+async def cached(
+    request: Request,
+    current_user: User,
+    scopes: List[str],
+    load: Callable[[], Awaitable[CacheEntry]],
+) -> Response:
+    if not enabled():
+        return _respond(request, await load())
+    await settle()
+    key = f"{request.url.path}?{request.url.query}"
+    entry = await _get_entry(key)
+    if entry is not None and entry.owner_id == current_user.id:
+        if await current_versions(entry.versions) == entry.versions:
+            return _respond(request, entry)
+
+    # Read the stamps before the data: a write that commits meanwhile bumps
+    # them, so the entry stored below is never served
+    versions = await current_versions(scopes, create=True)
+    entry = await load()
+    versions.update(await current_versions(entry.depends_on, create=True))
+    entry.versions = versions
+    await _put_entry(key, entry)
+    return _respond(request, entry)
+
+def bump(scopes: Iterable[str]):
+    scopes = list(scopes)
+    stamp = _new_stamp()
+    redis = get_redis()
+    if redis is None:
+        for scope in scopes:
+            _local_versions.set(scope, stamp)
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        import redis as sync_redis
+        sync_redis.Redis.from_url(settings.redis_url).mset({VERSION_PREFIX + scope: stamp for scope in scopes})
+        return
+    task = loop.create_task(redis.mset({VERSION_PREFIX + scope: stamp for scope in scopes}))
+    _pending_bumps.add(task)
+    task.add_done_callback(_pending_bumps.discard)
+
+# Stamps are bumped from the committed row changes (services/changes), so
+# routers never have to remember to purge
+
+def _scopes(change: changes.Change) -> List[str]:
+    if change.entity == "campaign":
+        pairs = [(campaign_scope, change.campaign_id)]
+    elif change.entity == "session":
+        pairs = [(sessions_scope, change.campaign_id), (npcs_scope, change.id)]
+    else:
+        pairs = [(npcs_scope, change.session_id)]
+    return [scope(value) for scope, value in pairs if value is not None]
+
+@changes.on_commit
+def _invalidate(committed: List[changes.Change]):
+    scopes = {scope for change in committed for scope in _scopes(change)}
+    if scopes:
+        bump(scopes)
@@ -0,0 +1,191 @@
+from typing import List, Optional
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..database import Base
+
+# Full-text search over campaigns, sessions and NPCs. The index is maintained
+# by the database itself so every write path (ORM, bulk updates from jobs,
+# raw SQL) keeps it current:
+#
+# - PostgreSQL: a stored generated `search_vector` tsvector column per table
+#   with a GIN index; ranked with ts_rank_cd, snippets from ts_headline.
+# - SQLite (local development and tests): external-content FTS5 tables kept
+#   in sync by triggers; ranked with bm25, snippets from snippet().
+
+SEARCH_TYPES = ("campaign", "session", "npc")
+
+# table -> (weighted columns, title expression, owner column)
+INDEXED = {
+    "campaign": {
+        "table": "campaigns",
+        "columns": {"name": "A", "description": "B", "campaign_notes": "C"},
+        "title": "t.name",
+        "campaign_id": "t.id",
+        "owner": "t.owner_id",
+    },
+    "session": {
+        "table": "sessions",
+        "columns": {"name": "A", "recap": "B", "preparation_notes": "C", "transcript": "D"},
+        "title": "coalesce(t.name, 'Session ' || t.session_number)",
+        "campaign_id": "t.campaign_id",
+        "owner": "t.owner_id",
+    },
+    "npc": {
+        "table": "npcs",
+        "columns": {
+            "name": "A", "role": "B", "personality_traits": "C", "appearance": "C",
+            "backstory": "C", "relationship_to_campaign": "C",
+        },
+        "title": "t.name",
+        "campaign_id": "t.campaign_id",
+        "owner": "t.owner_id",
+    },
+}
+
+def _tsvector_expression(columns: dict) -> str:
+    language = settings.search_language
+    return " || ".join(
+        f"setweight(to_tsvector('{language}', coalesce({column}, '')), '{weight}')"
+        for column, weight in columns.items()
+    )
+
+def postgresql_ddl() -> List[str]:
+    statements = []
+    for spec in INDEXED.values():
+        table = spec["table"]
+        statements.append(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({_tsvector_expression(spec['columns'])}) STORED"
+        )
+        statements.append(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)"
+        )
+    return statements
+
+def sqlite_ddl() -> List[str]:
+    statements = []
+    for spec in INDEXED.values():
+        table = spec["table"]
+        columns = list(spec["columns"])
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{c}" for c in columns)
+        old_values = ", ".join(f"old.{c}" for c in columns)
+        statements += [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+            f"{column_list}, content='{table}', content_rowid='id')",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {table}_fts({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {table}_fts({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+        ]
+    return statements
+
+def install(connection):
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        statements = postgresql_ddl()
+    elif dialect == "sqlite":
+        statements = sqlite_ddl()
+    else:
+        return
+    for statement in statements:
+        connection.execute(text(statement))
+
+def uninstall(connection):
+    dialect = connection.dialect.name
+    for spec in INDEXED.values():
+        table = spec["table"]
+        if dialect == "postgresql":
+            connection.execute(text(f"DROP INDEX IF EXISTS ix_{table}_search_vector"))
+            connection.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector"))
+        elif dialect == "sqlite":
+            for suffix in ("insert", "delete", "update"):
+                connection.execute(text(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}"))
+            connection.execute(text(f"DROP TABLE IF EXISTS {table}_fts"))
+
+# create_all() (scripts and throwaway databases) installs the index through
+# this hook. Alembic revisions carry their own frozen copy of the DDL (see
+# 0003), so changes to INDEXED also need a new revision.
+@event.listens_for(Base.metadata, "after_create")
+def _install_after_create(target, connection, **kw):
+    install(connection)
+
+def _campaign_filter(spec: dict, campaign_id: Optional[int]) -> str:
+    # Campaigns awaiting deletion (and everything in them) drop out of results,
+    # including when the search is narrowed to one of them
+    clause = f"AND {spec['campaign_id']} NOT IN (SELECT id FROM campaigns WHERE deleted_at IS NOT NULL)"
+    if campaign_id is not None:
+        clause += f" AND {spec['campaign_id']} = :campaign_id"
+    return clause
+
+def _postgresql_query(kind: str, campaign_id: Optional[int]) -> str:
+    # Rank first, then run the comparatively expensive ts_headline only on the
+    # rows that made the cut
+    spec = INDEXED[kind]
+    body = ", ".join(f"x.{c}" for c in spec["columns"] if c != "name")
+    return f"""
+        SELECT '{kind}' AS type, hit.id, hit.campaign_id, hit.title, hit.rank,
+               ts_headline(CAST(:language AS regconfig), concat_ws(' ', {body}), q,
+                           'StartSel=<b>, StopSel=</b>, MaxFragments=2, MaxWords=20, MinWords=5') AS snippet
+        FROM (
+            SELECT t.id, {spec['campaign_id']} AS campaign_id, {spec['title']} AS title,
+                   ts_rank_cd(t.search_vector, q) AS rank
+            FROM {spec['table']} t,
+                 websearch_to_tsquery(CAST(:language AS regconfig), :query) q
+            WHERE {spec['owner']} = :owner_id AND t.search_vector @@ q {_campaign_filter(spec, campaign_id)}
+            ORDER BY rank DESC
+            LIMIT :limit
+        ) hit
+        JOIN {spec['table']} x ON x.id = hit.id,
+             websearch_to_tsquery(CAST(:language AS regconfig), :query) q
+    """
+
+def _sqlite_query(kind: str, campaign_id: Optional[int]) -> str:
+    spec = INDEXED[kind]
+    table = spec["table"]
+    return f"""
+        SELECT '{kind}' AS type, t.id, {spec['campaign_id']} AS campaign_id, {spec['title']} AS title,
+               -bm25({table}_fts) AS rank,
+               snippet({table}_fts, -1, '<b>', '</b>', '…', 16) AS snippet
+        FROM {table}_fts JOIN {table} t ON t.id = {table}_fts.rowid
+        WHERE {table}_fts MATCH :query AND {spec['owner']} = :owner_id {_campaign_filter(spec, campaign_id)}
+        ORDER BY rank DESC
+        LIMIT :limit
+    """
+
+def fts5_query(query: str) -> str:
+    # Treat user input as plain terms: quote each one so FTS5 syntax can't leak in
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+async def search(
+    db: AsyncSession,
+    owner_id: int,
+    query: str,
+    types: Optional[List[str]] = None,
+    campaign_id: Optional[int] = None,
+    limit: int = 20,
+) -> List[dict]:
+    kinds = [kind for kind in SEARCH_TYPES if types is None or kind in types]
+    if not kinds:
+        return []
+    dialect = db.bind.dialect.name
+    params = {"owner_id": owner_id, "limit": limit}
+    if campaign_id is not None:
+        params["campaign_id"] = campaign_id
+    if dialect == "postgresql":
+        build, params["query"], params["language"] = _postgresql_query, query, settings.search_language
+    elif dialect == "sqlite":
+        build, params["query"] = _sqlite_query, fts5_query(query)
+    else:
+        raise RuntimeError(f"Full-text search is not supported on {dialect}")
+    if not params["query"].strip():
+        return []
+    
+    # Each table contributes its own top `limit` hits; merge and keep the best
+    sql = " UNION ALL ".join(f"SELECT * FROM ({build(kind, campaign_id)}) AS {kind}_hits" for kind in kinds)
+    result = await db.execute(text(f"SELECT * FROM ({sql}) AS hits ORDER BY rank DESC LIMIT :limit"), params)
+    return [dict(row._mapping) for row in result]
@@ -0,0 +1,153 @@
+import asyncio
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+import aiofiles
+import aiofiles.os
+from ..config import settings
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed for the s3 backend
+    boto3 = None
+
+# Blobs are addressed by the hex SHA-256 of their content. Drivers only know
+# how to move bytes; reference counting and ownership live in the database.
+
+def blob_key(digest: str) -> str:
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+class StorageBackend(ABC):
+    @abstractmethod
+    async def exists(self, digest: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def put(self, digest: str, source: Path):
+        # Takes ownership of `source`; it no longer exists afterwards
+        ...
+
+    @abstractmethod
+    async def delete(self, digest: str):
+        ...
+
+    @abstractmethod
+    async def iter_chunks(self, digest: str, start: int = 0, length: Optional[int] = None,
+                          chunk_size: int = settings.upload_chunk_size) -> AsyncIterator[bytes]:
+        # Yields `length` bytes from `start` (to the end of the blob when None)
+        yield b""  # makes this an async generator, like the drivers
+
+    def local_path(self, digest: str) -> Optional[Path]:
+        # Backends that keep blobs on a local filesystem return the path so it
+        # can be served with sendfile; remote backends return None.
+        return None
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: Path):
+        self.root = root
+
+    def local_path(self, digest: str) -> Path:
+        return self.root / blob_key(digest)
+
+    async def exists(self, digest: str) -> bool:
+        return await aiofiles.os.path.exists(self.local_path(digest))
+
+    async def put(self, digest: str, source: Path):
+        target = self.local_path(digest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        await aiofiles.os.replace(source, target)
+
+    async def delete(self, digest: str):
+        try:
+            await aiofiles.os.remove(self.local_path(digest))
+        except FileNotFoundError:
+            pass
+
+    async def iter_chunks(self, digest: str, start: int = 0, length: Optional[int] = None,
+                          chunk_size: int = settings.upload_chunk_size) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.local_path(digest), "rb") as f:
+            if start:
+                await f.seek(start)
+            remaining = length
+            while remaining is None or remaining > 0:
+                chunk = await f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+class S3Storage(StorageBackend):
+    # Works against AWS S3 or any compatible server (MinIO, moto_server, ...)
+    # via S3_ENDPOINT_URL. boto3 is blocking, so every call runs in a thread.
+    def __init__(self, bucket: str, prefix: str = "", **client_kwargs):
+        if boto3 is None:
+            raise RuntimeError("The s3 storage backend requires boto3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", **client_kwargs)
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}{blob_key(digest)}"
+
+    async def exists(self, digest: str) -> bool:
+        try:
+            await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self._key(digest))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    async def put(self, digest: str, source: Path):
+        await asyncio.to_thread(self.client.upload_file, str(source), self.bucket, self._key(digest))
+        await aiofiles.os.remove(source)
+
+    async def delete(self, digest: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self._key(digest))
+
+    async def iter_chunks(self, digest: str, start: int = 0, length: Optional[int] = None,
+                          chunk_size: int = settings.upload_chunk_size) -> AsyncIterator[bytes]:
+        kwargs = {"Bucket": self.bucket, "Key": self._key(digest)}
+        if start or length is not None:
+            end = "" if length is None else str(start + length - 1)
+            kwargs["Range"] = f"bytes={start}-{end}"
+        response = await asyncio.to_thread(self.client.get_object, **kwargs)
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+def staging_dir() -> Path:
+    # Incoming uploads are written here before their hash is known
+    path = Path(settings.upload_folder) / ".staging"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def create_storage() -> StorageBackend:
+    if settings.storage_backend == "s3":
+        return S3Storage(
+            settings.s3_bucket,
+            prefix=settings.s3_prefix,
+            endpoint_url=settings.s3_endpoint_url,
+            region_name=settings.s3_region,
+            aws_access_key_id=settings.s3_access_key_id,
+            aws_secret_access_key=settings.s3_secret_access_key,
+        )
+    if settings.storage_backend == "local":
+        return LocalStorage(Path(settings.upload_folder) / "blobs")
+    raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+
+_storage: Optional[StorageBackend] = None
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
@@ -0,0 +1,184 @@
+import asyncio
+import importlib
+import tempfile
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, update
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.job import Job
+from ..models.session import Session as SessionModel
+from . import jobs
+from .storage import staging_dir
+from .uploads import find_upload, local_copy
+
+JOB_KIND = "transcription"
+AUDIO_EXTENSIONS = {".mp3", ".wav"}
+
+# Recordings are split at silences near every `transcription_chunk_seconds`
+# mark, and the chunks are transcribed in parallel on a process pool. Results
+# are stitched into Session.transcript in order as soon as a contiguous prefix
+# of chunks is done, so a long session fills in progressively.
+
+Chunk = Tuple[str, int, int]  # wav path, start ms, end ms
+
+# Recognizers run inside pool processes, so they must be importable top-level
+# functions taking a wav path and returning text.
+
+def recognize_stub(path: str) -> str:
+    # Deterministic, offline recognizer for tests and local development
+    with wave.open(path, "rb") as audio:
+        seconds = audio.getnframes() / float(audio.getframerate())
+    return f"[{seconds:.1f}s of speech]"
+
+def _speech_recognition(path: str, method: str, **kwargs) -> str:
+    import speech_recognition as sr
+    recognizer = sr.Recognizer()
+    with sr.AudioFile(path) as source:
+        audio = recognizer.record(source)
+    try:
+        return getattr(recognizer, method)(audio, **kwargs)
+    except sr.UnknownValueError:
+        return ""
+
+def recognize_google(path: str) -> str:
+    return _speech_recognition(path, "recognize_google")
+
+def recognize_sphinx(path: str) -> str:
+    return _speech_recognition(path, "recognize_sphinx")
+
+def recognize_whisper_api(path: str) -> str:
+    return _speech_recognition(path, "recognize_whisper_api", api_key=settings.openai_api_key)
+
+RECOGNIZERS: Dict[str, Callable[[str], str]] = {
+    "stub": recognize_stub,
+    "google": recognize_google,
+    "sphinx": recognize_sphinx,
+    "whisper_api": recognize_whisper_api,
+}
+
+def resolve_recognizer(name: str) -> Callable[[str], str]:
+    # Either a built-in name or "package.module:function"
+    if name in RECOGNIZERS:
+        return RECOGNIZERS[name]
+    module_name, _, func_name = name.partition(":")
+    if not func_name:
+        raise ValueError(f"Unknown recognizer: {name}")
+    return getattr(importlib.import_module(module_name), func_name)
+
+def transcribe_chunk(recognizer: str, path: str) -> str:
+    return resolve_recognizer(recognizer)(path).strip()
+
+def _find_cut(audio, target_ms: int, window_ms: int, min_silence_ms: int, threshold: float) -> int:
+    from pydub.silence import detect_silence
+    low = max(target_ms - window_ms, 0)
+    high = min(target_ms + window_ms, len(audio))
+    silences = detect_silence(
+        audio[low:high], min_silence_len=min_silence_ms, silence_thresh=threshold, seek_step=10
+    )
+    if not silences:
+        return target_ms
+    start, end = min(silences, key=lambda s: abs(low + (s[0] + s[1]) // 2 - target_ms))
+    return low + (start + end) // 2
+
+def split_recording(path: str, out_dir: str, chunk_seconds: int) -> List[Chunk]:
+    # Runs in a pool process: decoding a multi-hour recording is both CPU and
+    # memory heavy, so it stays out of the API and worker event loops.
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(path).set_channels(1).set_frame_rate(16000)
+    threshold = audio.dBFS - 16
+    chunk_ms = chunk_seconds * 1000
+    window_ms = chunk_ms // 4
+    
+    bounds = []
+    position = 0
+    while len(audio) - position > chunk_ms + window_ms:
+        cut = _find_cut(audio, position + chunk_ms, window_ms, 500, threshold)
+        bounds.append((position, cut))
+        position = cut
+    bounds.append((position, len(audio)))
+    
+    chunks = []
+    for index, (start, end) in enumerate(bounds):
+        chunk_path = str(Path(out_dir) / f"{index:05d}.wav")
+        audio[start:end].export(chunk_path, format="wav")
+        chunks.append((chunk_path, start, end))
+    return chunks
+
+def format_timestamp(ms: int) -> str:
+    seconds = ms // 1000
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def stitch(chunks: List[Chunk], texts: List[str]) -> str:
+    return "\n".join(
+        f"[{format_timestamp(start)}] {text}"
+        for (_, start, _), text in zip(chunks, texts)
+        if text
+    )
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.transcription_workers)
+    return _pool
+
+async def _save_progress(job_id: int, session_id: int, transcript: str, done: int, total: int):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(SessionModel).where(SessionModel.id == session_id).values(transcript=transcript)
+        )
+        await jobs.set_progress(job_id, done, total, db=db)
+        await db.commit()
+
+@jobs.job_handler(JOB_KIND)
+async def transcribe_session(job: Job, payload: dict):
+    session_id = job.target_id
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(SessionModel.audio_recording_path, SessionModel.owner_id)
+            .where(SessionModel.id == session_id)
+        )
+        row = result.first()
+        if row is None:
+            raise ValueError("Session not found")
+        uploaded = await find_upload(db, row.owner_id, row.audio_recording_path)
+    if uploaded is None:
+        raise ValueError("Recording not found")
+    
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    recognizer = payload.get("recognizer") or settings.transcription_recognizer
+    
+    async with local_copy(uploaded) as audio_path:
+        with tempfile.TemporaryDirectory(dir=staging_dir()) as chunk_dir:
+            chunks = await loop.run_in_executor(
+                pool, split_recording, str(audio_path), chunk_dir, settings.transcription_chunk_seconds
+            )
+            total = len(chunks)
+            await jobs.set_progress(job.id, 0, total)
+            
+            async def run_chunk(index: int, path: str):
+                return index, await loop.run_in_executor(pool, transcribe_chunk, recognizer, path)
+            
+            tasks = [asyncio.ensure_future(run_chunk(i, path)) for i, (path, _, _) in enumerate(chunks)]
+            texts: List[Optional[str]] = [None] * total
+            stitched = 0
+            try:
+                for done, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+                    index, text = await next_done
+                    texts[index] = text
+                    previous = stitched
+                    while stitched < total and texts[stitched] is not None:
+                        stitched += 1
+                    if stitched > previous:
+                        transcript = stitch(chunks[:stitched], texts[:stitched])
+                        await _save_progress(job.id, session_id, transcript, done, total)
+                    else:
+                        await jobs.set_progress(job.id, done, total)
+            finally:
+                for task in tasks:
+                    task.cancel()
@@ -0,0 +1,338 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from sqlalchemy import bindparam, select, text, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..models.document import CampaignDocument
+from ..models.upload import StoredBlob, UploadedFile
+from .downloads import guess_media_type
+from .storage import get_storage, staging_dir
+
+CHUNK_SIZE = settings.upload_chunk_size
+
+class UploadTooLarge(Exception):
+    pass
+
+class UploadBusy(Exception):
+    pass
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, expected: int):
+        super().__init__(f"Expected offset {expected}")
+        self.expected = expected
+
+async def iter_upload_file(file: UploadFile, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+async def _copy_stream(chunks: AsyncIterator[bytes], out, max_size: int, hasher=None, offset: int = 0) -> int:
+    # Writes chunks as they arrive and stops as soon as the running total
+    # (including `offset` bytes already on disk) goes over `max_size`.
+    total = offset
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > max_size:
+            raise UploadTooLarge()
+        if hasher is not None:
+            hasher.update(chunk)
+        await out.write(chunk)
+    return total - offset
+
+async def write_stream(
+    chunks: AsyncIterator[bytes],
+    path: Path,
+    max_size: int,
+    hasher=None,
+    append: bool = False,
+    offset: int = 0,
+) -> int:
+    async with aiofiles.open(path, "ab" if append else "wb") as out:
+        return await _copy_stream(chunks, out, max_size, hasher=hasher, offset=offset)
+
+async def hash_file(path: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    hasher = hashlib.sha256()
+    async with aiofiles.open(path, "rb") as f:
+        while True:
+            chunk = await f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+async def remove_quietly(path: Path):
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Resumable uploads: each upload session is a `<id>.part` data file and a
+# `<id>.json` descriptor under the user's partial directory. The current offset
+# is simply the size of the part file, so a session survives worker restarts.
+# Sessions that receive no data for upload_session_ttl seconds are discarded.
+
+def partial_dir(user_id: int) -> Path:
+    return Path(settings.upload_folder) / ".partial" / str(user_id)
+
+def part_path(user_id: int, upload_id: str) -> Path:
+    return partial_dir(user_id) / f"{upload_id}.part"
+
+def meta_path(user_id: int, upload_id: str) -> Path:
+    return partial_dir(user_id) / f"{upload_id}.json"
+
+async def create_upload_session(
+    user_id: int, upload_id: str, filename: str, size: int, campaign_id: Optional[int] = None
+) -> dict:
+    directory = partial_dir(user_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(expire_upload_sessions, user_id)
+    meta = {"upload_id": upload_id, "filename": filename, "size": size, "campaign_id": campaign_id}
+    async with aiofiles.open(meta_path(user_id, upload_id), "w") as f:
+        await f.write(json.dumps(meta))
+    async with aiofiles.open(part_path(user_id, upload_id), "wb"):
+        pass
+    return {**meta, "offset": 0}
+
+async def get_upload_session(user_id: int, upload_id: str) -> Optional[dict]:
+    try:
+        async with aiofiles.open(meta_path(user_id, upload_id)) as f:
+            meta = json.loads(await f.read())
+        stat = await aiofiles.os.stat(part_path(user_id, upload_id))
+    except FileNotFoundError:
+        return None
+    return {**meta, "offset": stat.st_size}
+
+def _lock_part(part):
+    # Chunk writers and the completing request hold an exclusive flock on the
+    # part file, which also covers other worker processes
+    try:
+        fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise UploadBusy()
+
+async def append_to_upload_session(
+    user_id: int, upload_id: str, meta: dict, offset: int, chunks: AsyncIterator[bytes]
+) -> int:
+    # Two PUTs at the same offset (a client retry racing the original) would
+    # both pass the offset check and both append, so the offset is re-read
+    # once the part file lock is held.
+    async with aiofiles.open(part_path(user_id, upload_id), "r+b") as out:
+        _lock_part(out)
+        current = os.fstat(out.fileno()).st_size
+        if offset != current:
+            raise UploadOffsetMismatch(current)
+        await out.seek(current)
+        written = await _copy_stream(chunks, out, meta["size"], offset=offset)
+    return offset + written
+
+@asynccontextmanager
+async def locked_upload_session(user_id: int, upload_id: str) -> AsyncIterator[Optional[dict]]:
+    # Yields the session as it stands once the part file lock is held, or None
+    # when it is gone. A duplicated complete request may have opened the part
+    # file before the first one moved it into storage and discarded the
+    # session; the descriptor is only read under the lock, so it sees None.
+    try:
+        part = await aiofiles.open(part_path(user_id, upload_id), "r+b")
+    except FileNotFoundError:
+        yield None
+        return
+    try:
+        _lock_part(part)
+        yield await get_upload_session(user_id, upload_id)
+    finally:
+        await part.close()
+
+async def discard_upload_session(user_id: int, upload_id: str):
+    await remove_quietly(part_path(user_id, upload_id))
+    await remove_quietly(meta_path(user_id, upload_id))
+
+def expire_upload_sessions(user_id: Optional[int] = None, max_age: int = settings.upload_session_ttl) -> int:
+    # Removes abandoned sessions, for one user or everyone; returns how many
+    root = Path(settings.upload_folder) / ".partial"
+    directories = [partial_dir(user_id)] if user_id is not None else [d for d in root.glob("*") if d.is_dir()]
+    cutoff = time.time() - max_age
+    expired = 0
+    for directory in directories:
+        for meta in directory.glob("*.json"):
+            part = meta.with_suffix(".part")
+            try:
+                last_write = max(meta.stat().st_mtime, part.stat().st_mtime if part.exists() else 0)
+            except FileNotFoundError:
+                continue
+            if last_write < cutoff:
+                part.unlink(missing_ok=True)
+                meta.unlink(missing_ok=True)
+                expired += 1
+    return expired
+
+# Deduplicated storage: every upload becomes an uploaded_files manifest row
+# pointing at a content-addressed blob whose ref_count tracks how many rows
+# share it. The bytes are only written to storage the first time a hash is seen.
+
+BLOB_LOCK_KEY = 0x52504231  # advisory lock id, any constant unique to this app
+
+async def lock_blobs(db: AsyncSession, exclusive: bool = False, digests=()):
+    # Transactions that change reference counts share a PostgreSQL advisory
+    # lock; the catalogue recount takes it exclusively, so it never counts
+    # around an upload that has acquired a blob but not committed its row.
+    # Uploads and releases of the same content also serialize on a lock per
+    # digest, taken in sorted order so two releases can't deadlock.
+    # SQLite serializes write transactions already.
+    if db.bind.dialect.name == "postgresql":
+        function = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+        await db.execute(text(f"SELECT {function}(:key)"), {"key": BLOB_LOCK_KEY})
+        for digest in sorted(set(digests)):
+            await db.execute(
+                text("SELECT pg_advisory_xact_lock(:key, hashtext(:digest))"),
+                {"key": BLOB_LOCK_KEY, "digest": digest}
+            )
+
+async def _acquire_blob(db: AsyncSession, digest: str, size: int) -> bool:
+    # Returns whether this call created the blob row
+    await lock_blobs(db, digests=[digest])
+    result = await db.execute(
+        update(StoredBlob)
+        .where(StoredBlob.sha256 == digest)
+        .values(ref_count=StoredBlob.ref_count + 1)
+    )
+    if result.rowcount:
+        return False
+    try:
+        async with db.begin_nested():
+            db.add(StoredBlob(sha256=digest, size=size, ref_count=1))
+    except IntegrityError:
+        # Another request inserted the same blob concurrently
+        await db.execute(
+            update(StoredBlob)
+            .where(StoredBlob.sha256 == digest)
+            .values(ref_count=StoredBlob.ref_count + 1)
+        )
+        return False
+    return True
+
+async def register_upload(
+    db: AsyncSession,
+    owner_id: int,
+    file_id: str,
+    original_name: str,
+    staged_path: Path,
+    digest: str,
+    size: int,
+    campaign_id: Optional[int] = None,
+    commit: bool = True,
+) -> UploadedFile:
+    inserted = await _acquire_blob(db, digest, size)
+    
+    # A new row means any bytes still in storage belong to a blob that is
+    # being purged, so they are written again rather than trusted
+    storage = get_storage()
+    if inserted or not await storage.exists(digest):
+        await storage.put(digest, staged_path)
+    else:
+        await remove_quietly(staged_path)
+    
+    uploaded = UploadedFile(
+        file_id=file_id,
+        owner_id=owner_id,
+        campaign_id=campaign_id,
+        original_name=original_name,
+        content_type=guess_media_type(original_name),
+        size=size,
+        sha256=digest,
+    )
+    db.add(uploaded)
+    if not commit:
+        # Caller owns the transaction (campaign import)
+        await db.flush()
+        return uploaded
+    await db.commit()
+    await db.refresh(uploaded)
+    return uploaded
+
+async def release_upload(db: AsyncSession, uploaded: UploadedFile):
+    await release_uploads(db, [uploaded])
+
+async def release_uploads(db: AsyncSession, uploads: List[UploadedFile]):
+    # Drops the manifest rows and one reference per row from their blobs, then
+    # purges blobs nobody references any more once the transaction is durable
+    released = Counter(uploaded.sha256 for uploaded in uploads)
+    ids = [uploaded.id for uploaded in uploads]
+    await lock_blobs(db, digests=released)
+    await db.execute(delete(CampaignDocument).where(CampaignDocument.uploaded_file_id.in_(ids)))
+    await db.execute(delete(UploadedFile).where(UploadedFile.id.in_(ids)).execution_options(synchronize_session=False))
+    for uploaded in uploads:
+        if uploaded in db:
+            db.expunge(uploaded)
+    
+    blobs = StoredBlob.__table__
+    await db.execute(
+        update(blobs)
+        .where(blobs.c.sha256 == bindparam("digest"))
+        .values(ref_count=blobs.c.ref_count - bindparam("released")),
+        [{"digest": digest, "released": count} for digest, count in released.items()]
+    )
+    result = await db.execute(
+        select(StoredBlob.sha256).where(StoredBlob.sha256.in_(released), StoredBlob.ref_count <= 0)
+    )
+    unreferenced = result.scalars().all()
+    await db.commit()
+    await purge_blobs(db, unreferenced)
+
+async def purge_blobs(db: AsyncSession, digests: List[str]):
+    # Each blob loses its row and its bytes in one transaction holding its
+    # digest lock, and only if it is still unreferenced: an upload of the same
+    # content either revived the row first, or waits and then stores the bytes
+    # again under a new row. The bytes go before the commit; a row left at
+    # zero by a failed commit is re-stored by the next upload or removed by
+    # the catalogue recount.
+    storage = get_storage()
+    for digest in sorted(digests):
+        await lock_blobs(db, digests=[digest])
+        result = await db.execute(
+            delete(StoredBlob)
+            .where(StoredBlob.sha256 == digest, StoredBlob.ref_count <= 0)
+            .returning(StoredBlob.sha256)
+        )
+        if result.scalar() is not None:
+            await storage.delete(digest)
+        await db.commit()
+
+async def find_upload(db: AsyncSession, owner_id: int, file_id: str) -> Optional[UploadedFile]:
+    result = await db.execute(
+        select(UploadedFile).where(
+            UploadedFile.file_id == file_id,
+            UploadedFile.owner_id == owner_id
+        )
+    )
+    return result.scalar_one_or_none()
+
+@asynccontextmanager
+async def local_copy(uploaded: UploadedFile):
+    # Yields a filesystem path for tools that need one (pydub, PyPDF2). Remote
+    # blobs are downloaded to the staging directory for the duration.
+    storage = get_storage()
+    path = storage.local_path(uploaded.sha256)
+    if path is not None:
+        yield path
+        return
+    temp_path = staging_dir() / f"{uuid.uuid4().hex}{Path(uploaded.original_name).suffix}"
+    try:
+        await write_stream(storage.iter_chunks(uploaded.sha256), temp_path, uploaded.size)
+        yield temp_path
+    finally:
+        await remove_quietly(temp_path)
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as OrmSession, undefer
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.campaign import Campaign
+from ..models.embedding import EmbeddingChunk, EmbeddingVersion
+from ..models.job import Job
+from ..models.npc import NPC
+from ..models.session import Session as SessionModel
+from . import jobs
+from .cache import TTLCache
+from .embeddings import chunk_text, get_embedder, normalize
+
+JOB_KIND = "embedding_refresh"
+
+# Semantic retrieval over campaign lore. Source text (campaign description and
+# notes, session recaps, NPCs) is chunked and embedded into embedding_chunks;
+# only chunks whose content hash changed are re-embedded. Search loads a
+# campaign's vectors into one float32 matrix, brute-forces small campaigns and
+# uses an IVF index above VECTOR_ANN_THRESHOLD chunks. Built indexes are cached
+# per process (the most recently used VECTOR_INDEX_CACHE_SIZE campaigns) and
+# rebuilt when the campaign's embedding version changes; every write to its
+# chunks bumps the version in the same transaction.
+
+SOURCE_TYPES = ("campaign", "session", "npc")
+NPC_FIELDS = ("name", "role", "appearance", "personality_traits", "backstory", "relationship_to_campaign")
+CAMPAIGN_FIELDS = ("name", "description", "campaign_notes")
+SESSION_FIELDS = ("recap",)
+
+def source_text(source_type: str, obj) -> str:
+    if source_type == "npc":
+        return "\n\n".join(f"{field.replace('_', ' ').title()}: {getattr(obj, field)}"
+                           for field in NPC_FIELDS if getattr(obj, field))
+    if source_type == "campaign":
+        return "\n\n".join(getattr(obj, field) for field in CAMPAIGN_FIELDS if getattr(obj, field))
+    if source_type == "session":
+        return obj.recap or ""
+    raise ValueError(f"Unknown source type: {source_type}")
+
+async def _load_source(db: AsyncSession, source_type: str, source_id: int) -> Tuple[Optional[int], str]:
+    if source_type == "campaign":
+        campaign = await db.get(Campaign, source_id, options=[undefer(Campaign.campaign_notes)])
+        return (campaign.id, source_text("campaign", campaign)) if campaign else (None, "")
+    if source_type == "session":
+        session = await db.get(SessionModel, source_id)
+        return (session.campaign_id, source_text("session", session)) if session else (None, "")
+    if source_type == "npc":
+        npc = await db.get(NPC, source_id, options=[undefer(NPC.backstory)])
+        return (npc.campaign_id, source_text("npc", npc)) if npc else (None, "")
+    raise ValueError(f"Unknown source type: {source_type}")
+
+async def bump_versions(db: AsyncSession, campaign_ids: Iterable[int]):
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    for campaign_id in sorted(set(campaign_ids)):
+        await db.execute(
+            insert(EmbeddingVersion)
+            .values(campaign_id=campaign_id, version=1)
+            .on_conflict_do_update(index_elements=["campaign_id"], set_={"version": EmbeddingVersion.version + 1})
+        )
+
+async def reindex_source(db: AsyncSession, source_type: str, source_id: int) -> int:
+    # Returns the number of chunks that had to be (re-)embedded
+    campaign_id, text = await _load_source(db, source_type, source_id)
+    source_filter = (EmbeddingChunk.source_type == source_type, EmbeddingChunk.source_id == source_id)
+    if campaign_id is None:
+        result = await db.execute(delete(EmbeddingChunk).where(*source_filter).returning(EmbeddingChunk.campaign_id))
+        await bump_versions(db, result.scalars())
+        await db.commit()
+        return 0
+    if await db.scalar(select(Campaign.deleted_at).where(Campaign.id == campaign_id)) is not None:
+        return 0  # campaign is being deleted; its chunks go with it
+    
+    embedder = get_embedder()
+    chunks = chunk_text(text)
+    hashes = [hashlib.sha256(chunk.encode()).hexdigest() for chunk in chunks]
+    result = await db.execute(select(EmbeddingChunk).where(*source_filter))
+    existing = {row.chunk_index: row for row in result.scalars()}
+    
+    stale = [
+        i for i, digest in enumerate(hashes)
+        if i not in existing or existing[i].content_hash != digest or existing[i].model != embedder.name
+    ]
+    vectors = await embedder.embed([chunks[i] for i in stale])
+    for i, vector in zip(stale, vectors):
+        row = existing.get(i)
+        if row is None:
+            row = EmbeddingChunk(source_type=source_type, source_id=source_id, chunk_index=i)
+            db.add(row)
+        row.campaign_id = campaign_id
+        row.text = chunks[i]
+        row.content_hash = hashes[i]
+        row.model = embedder.name
+        row.dim = vector.shape[0]
+        row.vector = vector.astype(np.float32).tobytes()
+    
+    try:
+        result = await db.execute(
+            delete(EmbeddingChunk).where(*source_filter, EmbeddingChunk.chunk_index >= len(chunks))
+        )
+        if stale or result.rowcount:
+            await bump_versions(db, [campaign_id])
+        await db.commit()
+    except IntegrityError:
+        # The campaign was deleted while this source was being embedded
+        await db.rollback()
+        if await db.get(Campaign, campaign_id) is not None:
+            raise
+        return 0
+    return len(stale)
+
+@jobs.job_handler(JOB_KIND)
+async def refresh_embeddings(job: Job, payload: dict):
+    # Bulk writes queue one job for many sources via payload["ids"]
+    source_ids = payload.get("ids") or [job.target_id]
+    async with AsyncSessionLocal() as db:
+        for done, source_id in enumerate(source_ids, 1):
+            await reindex_source(db, payload["source_type"], source_id)
+            if len(source_ids) > 1 and (done % 50 == 0 or done == len(source_ids)):
+                await jobs.set_progress(job.id, done, len(source_ids))
+
+# Bulk endpoints write with Core-style statements that skip the flush events
+# below, so they queue refreshes and drop chunks for deleted rows themselves
+def queue_refresh(db: AsyncSession, source_type: str, ids: Iterable[int]):
+    ids = sorted(ids)
+    if ids:
+        jobs.enqueue_after_commit(db.sync_session, JOB_KIND, payload={"source_type": source_type, "ids": ids})
+
+async def drop_sources(db: AsyncSession, source_type: str, ids: Iterable[int]):
+    result = await db.execute(delete(EmbeddingChunk).where(
+        EmbeddingChunk.source_type == source_type,
+        EmbeddingChunk.source_id.in_(list(ids))
+    ).returning(EmbeddingChunk.campaign_id))
+    await bump_versions(db, result.scalars())
+
+# ORM changes to indexed fields queue a refresh once the transaction commits
+WATCHED = {Campaign: ("campaign", CAMPAIGN_FIELDS), SessionModel: ("session", SESSION_FIELDS), NPC: ("npc", NPC_FIELDS)}
+
+@event.listens_for(OrmSession, "after_flush")
+def _queue_reindex(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        watched = WATCHED.get(type(obj))
+        if watched is None or obj.id is None:
+            continue
+        source_type, fields = watched
+        if obj in session.dirty:
+            state = inspect(obj)
+            if not any(state.attrs[field].history.has_changes() for field in fields):
+                continue
+        jobs.enqueue_after_commit(session, JOB_KIND, target_id=obj.id, payload={"source_type": source_type})
+
+class BruteForceIndex:
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+class IVFIndex:
+    # Inverted-file index: spherical k-means partitions the vectors into
+    # ~sqrt(n) lists and a query only scans the `probes` nearest lists.
+    def __init__(self, vectors: np.ndarray, probes: int, iterations: int = 8, seed: int = 0, train_size: int = 20000):
+        self.vectors = vectors
+        self.probes = probes
+        n = len(vectors)
+        n_lists = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, min(n, train_size), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = normalize(centroids)
+        self.centroids = centroids
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(n_lists)]
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        probes = min(self.probes, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+        candidates = np.concatenate([self.lists[c] for c in nearest])
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+        scores = self.vectors[candidates] @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+@dataclass
+class CampaignIndex:
+    version: tuple
+    ids: np.ndarray
+    index: object
+
+_indexes = TTLCache(settings.vector_index_cache_size, settings.vector_index_cache_ttl)
+
+def build_index(vectors: np.ndarray):
+    if len(vectors) > settings.vector_ann_threshold:
+        return IVFIndex(vectors, settings.vector_ann_probes)
+    return BruteForceIndex(vectors)
+
+async def get_campaign_index(db: AsyncSession, campaign_id: int, model: str) -> Optional[CampaignIndex]:
+    scope = (EmbeddingChunk.campaign_id == campaign_id, EmbeddingChunk.model == model)
+    stamp = select(EmbeddingVersion.version).where(EmbeddingVersion.campaign_id == campaign_id).scalar_subquery()
+    result = await db.execute(select(func.count(EmbeddingChunk.id), stamp).where(*scope))
+    version = tuple(result.one())
+    if version[0] == 0:
+        return None
+    cached = _indexes.get((campaign_id, model))
+    if cached is not None and cached.version == version:
+        return cached
+    
+    result = await db.execute(select(EmbeddingChunk.id, EmbeddingChunk.vector).where(*scope))
+    rows = result.all()
+    ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+    vectors = np.frombuffer(b"".join(row.vector for row in rows), dtype=np.float32).reshape(len(rows), -1)
+    index = await asyncio.to_thread(build_index, vectors)
+    cached = CampaignIndex(version, ids, index)
+    _indexes.set((campaign_id, model), cached)
+    return cached
+
+async def search(
+    db: AsyncSession, campaign_id: int, query: str, k: int = 5, source_types: Optional[List[str]] = None
+) -> List[dict]:
+    embedder = get_embedder()
+    campaign_index = await get_campaign_index(db, campaign_id, embedder.name)
+    if campaign_index is None:
+        return []
+    query_vector = (await embedder.embed([query]))[0]
+    # Over-fetch when filtering by source type so k results survive the filter
+    fetch = k * 4 if source_types else k
+    positions, scores = campaign_index.index.search(query_vector, fetch)
+    chunk_ids = [int(campaign_index.ids[p]) for p in positions]
+    
+    query_rows = select(EmbeddingChunk).where(EmbeddingChunk.id.in_(chunk_ids))
+    if source_types:
+        query_rows = query_rows.where(EmbeddingChunk.source_type.in_(source_types))
+    result = await db.execute(query_rows)
+    chunks = {chunk.id: chunk for chunk in result.scalars()}
+    
+    hits = []
+    for chunk_id, score in zip(chunk_ids, scores):
+        chunk = chunks.get(chunk_id)
+        if chunk is not None:
+            hits.append({
+                "source_type": chunk.source_type,
+                "source_id": chunk.source_id,
+                "chunk_index": chunk.chunk_index,
+                "text": chunk.text,
+                "score": float(score),
+            })
+    return hits[:k]
@@ -0,0 +1,22 @@
+import asyncio
+import logging
+import signal
+from .database import async_engine
+from .services import jobs
+from .services import deletion, documents, recaps, transcription, vector_index  # noqa: F401 (registers job handlers)
+
+# Standalone job worker for deployments with REDIS_ENABLED=true:
+#
+#     python -m app.worker
+
+async def main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await jobs.worker_loop(stop=stop)
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
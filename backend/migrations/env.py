@@ -8,21 +8,35 @@ import sys
 # Add the app directory to the path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+from app.config import settings
 from app.database import Base
 from app.models import *
 
 config = context.config
 
+# Migrations always run through the sync driver, even when the app uses asyncpg
+config.set_main_option("sqlalchemy.url", settings.database_url)
+
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 target_metadata = Base.metadata
 
+# The full-text index (FTS5 tables and triggers, tsvector columns) is owned by
+# app.services.search, not the models; keep autogenerate from dropping it
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and reflected and "_fts" in name:
+        return False
+    if name is not None and "search_vector" in name:
+        return False
+    return True
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -39,7 +53,8 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,73 @@
+"""full-text search
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:48:13.904127
+
+"""
+from alembic import op
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# A frozen copy of the index app.services.search defines: later changes to the
+# indexed columns need a revision of their own, not an edit here.
+# table -> {column: weight}
+INDEXED = {
+    'campaigns': {'name': 'A', 'description': 'B', 'campaign_notes': 'C'},
+    'sessions': {'name': 'A', 'recap': 'B', 'preparation_notes': 'C', 'transcript': 'D'},
+    'npcs': {
+        'name': 'A', 'role': 'B', 'personality_traits': 'C', 'appearance': 'C',
+        'backstory': 'C', 'relationship_to_campaign': 'C',
+    },
+}
+
+
+def sqlite_triggers(table, columns):
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {table}_fts({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {table}_fts({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table, columns in INDEXED.items():
+        if dialect == 'postgresql':
+            vector = ' || '.join(
+                f"setweight(to_tsvector('{settings.search_language}', coalesce({column}, '')), '{weight}')"
+                for column, weight in columns.items()
+            )
+            op.execute(f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED")
+            op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} USING GIN (search_vector)")
+        elif dialect == 'sqlite':
+            op.execute(f"CREATE VIRTUAL TABLE {table}_fts USING fts5({', '.join(columns)}, content='{table}', content_rowid='id')")
+            for statement in sqlite_triggers(table, columns):
+                op.execute(statement)
+            # Index the rows that are already there
+            op.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table in INDEXED:
+        if dialect == 'postgresql':
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_search_vector")
+            op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+        elif dialect == 'sqlite':
+            for suffix in ('insert', 'delete', 'update'):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+            op.execute(f"DROP TABLE IF EXISTS {table}_fts")
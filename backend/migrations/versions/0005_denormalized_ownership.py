@@ -0,0 +1,91 @@
+"""denormalized ownership
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 12:02:11.408326
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# Full-text columns of the tables rebuilt below, as installed by 0003
+FTS_COLUMNS = {
+    'sessions': ['name', 'recap', 'preparation_notes', 'transcript'],
+    'npcs': ['name', 'role', 'personality_traits', 'appearance', 'backstory', 'relationship_to_campaign'],
+}
+
+
+def _restore_fts_triggers():
+    # On SQLite batch mode rebuilds the tables, which drops their full-text
+    # triggers (the FTS5 tables and their contents are untouched)
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, columns in FTS_COLUMNS.items():
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{c}' for c in columns)
+        old_values = ', '.join(f'old.{c}' for c in columns)
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {table}_fts({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {table}_fts({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        )
+
+
+def upgrade() -> None:
+    op.add_column('sessions', sa.Column('owner_id', sa.Integer(), nullable=True))
+    op.add_column('npcs', sa.Column('campaign_id', sa.Integer(), nullable=True))
+    op.add_column('npcs', sa.Column('owner_id', sa.Integer(), nullable=True))
+
+    op.execute(
+        "UPDATE sessions SET owner_id = "
+        "(SELECT campaigns.owner_id FROM campaigns WHERE campaigns.id = sessions.campaign_id)"
+    )
+    op.execute(
+        "UPDATE npcs SET "
+        "campaign_id = (SELECT sessions.campaign_id FROM sessions WHERE sessions.id = npcs.session_id), "
+        "owner_id = (SELECT sessions.owner_id FROM sessions WHERE sessions.id = npcs.session_id)"
+    )
+
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.alter_column('owner_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_sessions_owner_id_users', 'users', ['owner_id'], ['id'])
+    with op.batch_alter_table('npcs') as batch_op:
+        batch_op.alter_column('campaign_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('owner_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_npcs_campaign_id_campaigns', 'campaigns', ['campaign_id'], ['id'])
+        batch_op.create_foreign_key('fk_npcs_owner_id_users', 'users', ['owner_id'], ['id'])
+    _restore_fts_triggers()
+
+    op.create_index(op.f('ix_sessions_owner_id'), 'sessions', ['owner_id'], unique=False)
+    op.create_index(op.f('ix_npcs_campaign_id'), 'npcs', ['campaign_id'], unique=False)
+    op.create_index(op.f('ix_npcs_owner_id'), 'npcs', ['owner_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_npcs_owner_id'), table_name='npcs')
+    op.drop_index(op.f('ix_npcs_campaign_id'), table_name='npcs')
+    op.drop_index(op.f('ix_sessions_owner_id'), table_name='sessions')
+    with op.batch_alter_table('npcs') as batch_op:
+        batch_op.drop_constraint('fk_npcs_owner_id_users', type_='foreignkey')
+        batch_op.drop_constraint('fk_npcs_campaign_id_campaigns', type_='foreignkey')
+        batch_op.drop_column('owner_id')
+        batch_op.drop_column('campaign_id')
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_constraint('fk_sessions_owner_id_users', type_='foreignkey')
+        batch_op.drop_column('owner_id')
+    _restore_fts_triggers()
@@ -0,0 +1,100 @@
+"""campaign tombstones and cascading deletes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 11:59:36.603525
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+# Lets SQLite batch mode address the foreign keys 0001 and 0002 created without names
+NAMING = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+# table -> [(column, referred table, ondelete)]
+FOREIGN_KEYS = {
+    'sessions': [('campaign_id', 'campaigns', 'CASCADE')],
+    'npcs': [('session_id', 'sessions', 'CASCADE'), ('campaign_id', 'campaigns', 'CASCADE')],
+    'campaign_documents': [('campaign_id', 'campaigns', 'CASCADE')],
+    'uploaded_files': [('campaign_id', 'campaigns', 'SET NULL')],
+}
+
+
+# Full-text columns of the tables rebuilt below, as installed by 0003
+FTS_COLUMNS = {
+    'sessions': ['name', 'recap', 'preparation_notes', 'transcript'],
+    'npcs': ['name', 'role', 'personality_traits', 'appearance', 'backstory', 'relationship_to_campaign'],
+}
+
+
+def _name(table, column, referred):
+    return f'fk_{table}_{column}_{referred}'
+
+
+def _original_name(table, column, referred):
+    # 0001 and 0002 created their foreign keys unnamed, which Postgres calls
+    # <table>_<column>_fkey; on SQLite the naming convention covers them and
+    # 0005 already used the convention for its own
+    name = _name(table, column, referred)
+    if op.get_bind().dialect.name != 'postgresql' or name == 'fk_npcs_campaign_id_campaigns':
+        return name
+    return f'{table}_{column}_fkey'
+
+
+def _restore_fts_triggers():
+    # Batch mode rebuilds the tables on SQLite, dropping the full-text triggers
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, columns in FTS_COLUMNS.items():
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{c}' for c in columns)
+        old_values = ', '.join(f'old.{c}' for c in columns)
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {table}_fts({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {table}_fts({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {table}_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        )
+
+
+def upgrade() -> None:
+    op.add_column('campaigns', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_campaigns_deleted', 'campaigns', ['id'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NOT NULL'),
+                    sqlite_where=sa.text('deleted_at IS NOT NULL'))
+
+    for table, foreign_keys in FOREIGN_KEYS.items():
+        with op.batch_alter_table(table, naming_convention=NAMING) as batch_op:
+            for column, referred, ondelete in foreign_keys:
+                name = _name(table, column, referred)
+                batch_op.drop_constraint(_original_name(table, column, referred), type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+    _restore_fts_triggers()
+
+
+def downgrade() -> None:
+    for table, foreign_keys in FOREIGN_KEYS.items():
+        with op.batch_alter_table(table, naming_convention=NAMING) as batch_op:
+            for column, referred, _ in foreign_keys:
+                batch_op.drop_constraint(_name(table, column, referred), type_='foreignkey')
+                batch_op.create_foreign_key(_original_name(table, column, referred), referred, [column], ['id'])
+    _restore_fts_triggers()
+
+    op.drop_index('ix_campaigns_deleted', table_name='campaigns',
+                  postgresql_where=sa.text('deleted_at IS NOT NULL'),
+                  sqlite_where=sa.text('deleted_at IS NOT NULL'))
+    op.drop_column('campaigns', 'deleted_at')
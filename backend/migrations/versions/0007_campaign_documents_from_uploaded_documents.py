@@ -0,0 +1,161 @@
+"""campaign documents from uploaded_documents
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 12:09:41.275093
+
+"""
+import json
+import logging
+import posixpath
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger('alembic.runtime.migration')
+
+# As of this revision; the same values live in app.services.documents
+INGESTION_JOB_KIND = 'document_ingestion'
+DOCUMENT_EXTENSIONS = {'.pdf', '.md', '.txt'}
+
+# Full-text columns of campaigns, as installed by 0003
+FTS_COLUMNS = ['name', 'description', 'campaign_notes']
+
+
+def _stored_paths(campaign_id, value):
+    # A JSON array of file paths; anything else is kept as a single path
+    try:
+        paths = json.loads(value)
+    except ValueError:
+        log.warning('Campaign %s has uploaded_documents that are not JSON; keeping it as one path', campaign_id)
+        paths = [value]
+    if not isinstance(paths, list):
+        paths = [paths]
+    return [str(path).strip() for path in paths if path is not None and str(path).strip()]
+
+
+def _attach(bind, campaign_id, uploaded_id, file_id, sha256):
+    # What documents.attach_document and the upload routes do for a file
+    # uploaded into a campaign
+    bind.execute(
+        sa.text("UPDATE uploaded_files SET campaign_id = :campaign_id WHERE id = :id AND campaign_id IS NULL"),
+        {'campaign_id': campaign_id, 'id': uploaded_id}
+    )
+    if posixpath.splitext(file_id)[1].lower() not in DOCUMENT_EXTENSIONS:
+        return
+    status = bind.execute(sa.text("SELECT status FROM document_texts WHERE sha256 = :sha256"), {'sha256': sha256}).scalar()
+    if status is None:
+        status = 'pending'
+        bind.execute(sa.text("INSERT INTO document_texts (sha256, status) VALUES (:sha256, 'pending')"), {'sha256': sha256})
+    linked = bind.execute(
+        sa.text("SELECT 1 FROM campaign_documents WHERE campaign_id = :campaign_id AND uploaded_file_id = :id"),
+        {'campaign_id': campaign_id, 'id': uploaded_id}
+    ).scalar()
+    if not linked:
+        bind.execute(
+            sa.text("INSERT INTO campaign_documents (campaign_id, uploaded_file_id, sha256) VALUES (:campaign_id, :id, :sha256)"),
+            {'campaign_id': campaign_id, 'id': uploaded_id, 'sha256': sha256}
+        )
+    queued = bind.execute(
+        sa.text("SELECT 1 FROM jobs WHERE kind = :kind AND target_id = :id AND status IN ('queued', 'running')"),
+        {'kind': INGESTION_JOB_KIND, 'id': uploaded_id}
+    ).scalar()
+    if status in ('pending', 'failed') and not queued:
+        # Picked up by the job worker when it starts
+        bind.execute(
+            sa.text("INSERT INTO jobs (kind, target_id, status, progress) VALUES (:kind, :id, 'queued', 0)"),
+            {'kind': INGESTION_JOB_KIND, 'id': uploaded_id}
+        )
+
+
+def _restore_fts_triggers():
+    # Batch mode rebuilds campaigns on SQLite, dropping its full-text triggers
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    column_list = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{c}' for c in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{c}' for c in FTS_COLUMNS)
+    op.execute(
+        f"CREATE TRIGGER IF NOT EXISTS campaigns_fts_insert AFTER INSERT ON campaigns BEGIN "
+        f"INSERT INTO campaigns_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER IF NOT EXISTS campaigns_fts_delete AFTER DELETE ON campaigns BEGIN "
+        f"INSERT INTO campaigns_fts(campaigns_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER IF NOT EXISTS campaigns_fts_update AFTER UPDATE ON campaigns BEGIN "
+        f"INSERT INTO campaigns_fts(campaigns_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO campaigns_fts(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+    )
+
+
+def upgrade() -> None:
+    op.create_table('legacy_campaign_documents',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('campaign_id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['campaign_id'], ['campaigns.id'], name='fk_legacy_campaign_documents_campaign_id_campaigns', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_legacy_campaign_documents_campaign_id'), 'legacy_campaign_documents', ['campaign_id'], unique=False)
+    op.create_index(op.f('ix_legacy_campaign_documents_id'), 'legacy_campaign_documents', ['id'], unique=False)
+
+    # Files uploaded before the catalogue existed were stored as
+    # uploads/<owner_id>/<file_id>; the catalogue imports them under the same
+    # file_id. Paths whose file is not in the catalogue yet wait in
+    # legacy_campaign_documents for `python -m app.services.catalogue`.
+    bind = op.get_bind()
+    campaigns = bind.execute(sa.text(
+        "SELECT id, owner_id, uploaded_documents FROM campaigns "
+        "WHERE uploaded_documents IS NOT NULL AND uploaded_documents != ''"
+    )).all()
+    for campaign_id, owner_id, value in campaigns:
+        for path in _stored_paths(campaign_id, value):
+            file_id = posixpath.basename(path.replace('\\', '/'))
+            uploaded = bind.execute(
+                sa.text("SELECT id, sha256 FROM uploaded_files WHERE file_id = :file_id AND owner_id = :owner_id"),
+                {'file_id': file_id, 'owner_id': owner_id}
+            ).first()
+            if uploaded is None:
+                bind.execute(
+                    sa.text("INSERT INTO legacy_campaign_documents (campaign_id, path) VALUES (:campaign_id, :path)"),
+                    {'campaign_id': campaign_id, 'path': path}
+                )
+            else:
+                _attach(bind, campaign_id, uploaded.id, file_id, uploaded.sha256)
+
+    with op.batch_alter_table('campaigns') as batch_op:
+        batch_op.drop_column('uploaded_documents')
+    _restore_fts_triggers()
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('campaigns') as batch_op:
+        batch_op.add_column(sa.Column('uploaded_documents', sa.Text(), nullable=True))
+    _restore_fts_triggers()
+
+    # Only the paths still waiting are written back; links the upgrade made
+    # stay in campaign_documents
+    bind = op.get_bind()
+    paths = {}
+    for campaign_id, path in bind.execute(sa.text(
+        "SELECT campaign_id, path FROM legacy_campaign_documents ORDER BY id"
+    )):
+        paths.setdefault(campaign_id, []).append(path)
+    for campaign_id, campaign_paths in paths.items():
+        bind.execute(
+            sa.text("UPDATE campaigns SET uploaded_documents = :value WHERE id = :id"),
+            {'value': json.dumps(campaign_paths), 'id': campaign_id}
+        )
+
+    op.drop_index(op.f('ix_legacy_campaign_documents_id'), table_name='legacy_campaign_documents')
+    op.drop_index(op.f('ix_legacy_campaign_documents_campaign_id'), table_name='legacy_campaign_documents')
+    op.drop_table('legacy_campaign_documents')
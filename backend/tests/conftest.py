@@ -0,0 +1,66 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Settings are read when app.config is imported, so the test environment has
+# to be in place before any test module imports the app.
+_scratch = tempfile.mkdtemp(prefix="rpassistant-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.setdefault("UPLOAD_FOLDER", f"{_scratch}/uploads")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# The app's in-process worker recovers jobs once at startup and then stays
+# out of the way of tests that set up job rows themselves
+os.environ.setdefault("JOB_HEARTBEAT_SECONDS", "3600")
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=BACKEND, check=True, capture_output=True)
+    from app.main import app
+    with TestClient(app) as client:
+        yield client
+
+def login(client, email: str, password: str = "pw") -> dict:
+    # Registers the user on first use
+    client.post("/auth/register", json={"email": email, "password": password, "full_name": email.split("@")[0]})
+    token = client.post("/auth/token", data={"username": email, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    return login(client, "dm@example.com")
+
+def open_stream(app, method: str, path: str, headers: dict, body: bytes = b""):
+    # Runs one HTTP request against the ASGI app in the current event loop,
+    # for streaming responses (TestClient buffers the whole body). Returns
+    # the request task, a queue of the ASGI messages sent back, and an event
+    # that disconnects the client when set.
+    path, _, query = path.partition("?")
+    received, disconnect = asyncio.Queue(), asyncio.Event()
+    requests = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": ("testclient", 50000), "server": ("testserver", 80),
+    }
+    return asyncio.create_task(app(scope, receive, received.put)), received, disconnect
@@ -0,0 +1,94 @@
+import hashlib
+import io
+import json
+import tarfile
+from conftest import login
+
+def build_archive(files=(), blobs=None) -> bytes:
+    # A minimal archive in export's layout; `blobs` maps digest to the bytes
+    # stored as files/<digest>
+    members = [
+        ("manifest.json", json.dumps({"format": "rpassistant-campaign", "version": 1}).encode()),
+        ("campaign.ndjson", json.dumps({"name": "Imported", "rpg_system": "dnd"}).encode() + b"\n"),
+        ("files.ndjson", b"".join(json.dumps(entry).encode() + b"\n" for entry in files)),
+    ]
+    members += [(f"files/{digest}", data) for digest, data in (blobs or {}).items()]
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def upload(client, headers, name: str, content: bytes) -> dict:
+    response = client.post("/uploads/file", files={"file": (name, content)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_import_cannot_claim_a_stored_blob_without_its_bytes(client, auth_headers):
+    secret = upload(client, auth_headers, "secret.txt", b"the lich is the innkeeper")
+    attacker = login(client, "thief@example.com")
+    entry = {"file_id": "loot.txt", "original_name": "loot.txt", "sha256": secret["sha256"], "attached": True}
+
+    response = client.post(
+        "/campaigns/import", content=build_archive([entry], {secret["sha256"]: b"guessed"}), headers=attacker
+    )
+    assert response.status_code == 400
+    assert "Checksum mismatch" in response.json()["detail"]
+    listing = client.get("/uploads/files", headers=attacker).json()["files"]
+    assert secret["sha256"] not in {uploaded["sha256"] for uploaded in listing}
+
+    # With the real bytes the import shares the stored blob
+    response = client.post(
+        "/campaigns/import", content=build_archive([entry], {secret["sha256"]: b"the lich is the innkeeper"}),
+        headers=attacker
+    )
+    assert response.status_code == 201, response.text
+    listing = client.get("/uploads/files", headers=attacker).json()["files"]
+    assert [uploaded["sha256"] for uploaded in listing] == [hashlib.sha256(b"the lich is the innkeeper").hexdigest()]
+
+def test_export_round_trips_through_import(client):
+    headers = login(client, "archivist@example.com")
+    campaign_id = client.post(
+        "/campaigns/", json={"name": "Tides", "rpg_system": "dnd", "description": "Islands"}, headers=headers
+    ).json()["id"]
+    session_id = client.post(
+        "/sessions/", json={"campaign_id": campaign_id, "session_number": 1, "name": "Landfall"}, headers=headers
+    ).json()["id"]
+    client.post("/npcs/", json={"session_id": session_id, "name": "Oona", "backstory": "Lost at sea"}, headers=headers)
+    map_file = client.post(
+        "/uploads/file", files={"file": ("map.txt", b"isles of tide")}, data={"campaign_id": campaign_id}, headers=headers
+    ).json()
+
+    response = client.get(f"/campaigns/{campaign_id}/export", headers=headers)
+    assert response.status_code == 200
+    with tarfile.open(fileobj=io.BytesIO(response.content)) as tar:
+        names = tar.getnames()
+    assert names[0] == "manifest.json"
+    assert f"files/{map_file['sha256']}" in names
+
+    imported = client.post("/campaigns/import", content=response.content, headers=headers)
+    assert imported.status_code == 201, imported.text
+    assert {key: imported.json()[key] for key in ("sessions", "npcs", "files")} == {"sessions": 1, "npcs": 1, "files": 1}
+    copy_id = imported.json()["campaign_id"]
+    assert copy_id != campaign_id
+    assert client.get(f"/campaigns/{copy_id}", headers=headers).json()["description"] == "Islands"
+    sessions = client.get(f"/sessions/campaign/{copy_id}", headers=headers).json()
+    assert [session["name"] for session in sessions] == ["Landfall"]
+    npcs = client.get(f"/npcs/session/{sessions[0]['id']}", headers=headers).json()
+    assert client.get(f"/npcs/{npcs[0]['id']}/backstory", headers=headers).json()["backstory"] == "Lost at sea"
+    listing = client.get("/uploads/files", headers=headers).json()["files"]
+    assert [uploaded["sha256"] for uploaded in listing] == [map_file["sha256"]] * 2
+
+def test_import_rejects_members_missing_from_the_file_list(client, auth_headers):
+    data = b"a stowaway"
+    digest = hashlib.sha256(data).hexdigest()
+    response = client.post("/campaigns/import", content=build_archive(blobs={digest: data}), headers=auth_headers)
+    assert response.status_code == 400
+    assert "not listed in files.ndjson" in response.json()["detail"]
+
+    entry = {"file_id": "gone.txt", "original_name": "gone.txt", "sha256": digest}
+    response = client.post("/campaigns/import", content=build_archive([entry]), headers=auth_headers)
+    assert response.status_code == 400
+    assert "missing 1 file(s)" in response.json()["detail"]
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import bcrypt
+import pytest
+from app.database import AsyncSessionLocal
+from app.models.user import User
+from app.services import cache, passwords, principals
+from conftest import login
+
+@pytest.mark.anyio
+async def test_deactivated_user_loses_access(client):
+    headers = login(client, "retired@example.com")
+    user_id = client.get("/auth/me", headers=headers).json()["id"]  # now cached
+
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        user.is_active = False
+        await db.commit()
+    assert client.get("/auth/me", headers=headers).status_code == 401
+
+@pytest.mark.anyio
+async def test_redis_is_the_only_principal_tier(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setattr(principals.settings, "redis_enabled", True)
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeAsyncRedis(decode_responses=True))
+    key = principals.principal_key(user_id=4242)
+    await principals.set_principal(key, User(id=4242, email="shared@example.com", is_active=True))
+    assert principals._local.get(key) is None
+    assert (await principals.get_principal(key)).email == "shared@example.com"
+
+    # Another worker's invalidation reaches this one through Redis
+    principals.invalidate_user(4242, ["shared@example.com"])
+    await asyncio.gather(*principals._invalidating)
+    assert await principals.get_principal(key) is None
+
+@pytest.mark.anyio
+async def test_saturated_hash_pool_answers_503(client):
+    login(client, "queued@example.com")
+    gate = threading.Event()
+    blockers = [asyncio.create_task(passwords._run(gate.wait)) for _ in range(passwords._max_pending)]
+    await asyncio.sleep(0)
+    try:
+        response = client.post("/auth/token", data={"username": "queued@example.com", "password": "pw"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(passwords.settings.password_hash_retry_after)
+    finally:
+        gate.set()
+        await asyncio.gather(*blockers)
+    assert client.post("/auth/token", data={"username": "queued@example.com", "password": "pw"}).status_code == 200
+
+@pytest.mark.anyio
+async def test_login_rehashes_at_the_configured_cost(client):
+    async with AsyncSessionLocal() as db:
+        user = User(email="veteran@example.com", hashed_password=bcrypt.hashpw(b"old secret", bcrypt.gensalt(5)).decode())
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    assert client.post("/auth/token", data={"username": "veteran@example.com", "password": "wrong"}).status_code == 401
+    assert client.post("/auth/token", data={"username": "veteran@example.com", "password": "old secret"}).status_code == 200
+    async with AsyncSessionLocal() as db:
+        rehashed = (await db.get(User, user_id)).hashed_password
+    assert rehashed.startswith(f"$2b${passwords.settings.bcrypt_rounds:02d}$")
+    assert client.post("/auth/token", data={"username": "veteran@example.com", "password": "old secret"}).status_code == 200
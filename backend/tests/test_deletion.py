@@ -0,0 +1,44 @@
+import asyncio
+import hashlib
+import pytest
+from app.database import AsyncSessionLocal
+from app.models.job import Job
+from app.models.upload import StoredBlob
+from app.services.storage import get_storage
+from conftest import login
+
+async def finished(job_id: int) -> Job:
+    for _ in range(100):
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+        if job.status in ("completed", "failed"):
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+@pytest.mark.anyio
+async def test_deleted_campaign_releases_its_blobs(client):
+    headers = login(client, "mortal@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Doomed", "rpg_system": "dnd"}, headers=headers).json()["id"]
+    client.post("/sessions/", json={"campaign_id": campaign_id, "session_number": 1}, headers=headers)
+
+    def upload(name: str, content: bytes, **data) -> dict:
+        return client.post("/uploads/file", files={"file": (name, content)}, data=data, headers=headers).json()
+    only_here = upload("doomed.txt", b"only in the doomed campaign", campaign_id=campaign_id)
+    shared = upload("shared.txt", b"kept outside the campaign too", campaign_id=campaign_id)
+    kept = upload("kept.txt", b"kept outside the campaign too")
+
+    response = client.delete(f"/campaigns/{campaign_id}", headers=headers)
+    assert response.status_code == 202
+    # Tombstoned at once, removed by the background job
+    assert client.get(f"/campaigns/{campaign_id}", headers=headers).status_code == 404
+    assert (await finished(response.json()["job_id"])).status == "completed"
+
+    listing = client.get("/uploads/files", headers=headers).json()["files"]
+    assert [uploaded["file_id"] for uploaded in listing] == [kept["file_id"]]
+    storage = get_storage()
+    async with AsyncSessionLocal() as db:
+        assert await db.get(StoredBlob, only_here["sha256"]) is None
+        assert not await storage.exists(only_here["sha256"])
+        assert (await db.get(StoredBlob, shared["sha256"])).ref_count == 1
+    assert await storage.exists(hashlib.sha256(b"kept outside the campaign too").hexdigest())
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import pytest
+from sqlalchemy import insert
+from app.database import AsyncSessionLocal
+from app.main import app
+from app.models.session import Session as SessionModel
+from app.services import changefeed
+from conftest import login, open_stream
+
+@pytest.fixture(scope="module")
+def campaign(client):
+    headers = login(client, "watcher@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Watched", "rpg_system": "dnd"}, headers=headers).json()["id"]
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+    return headers, campaign_id, user_id
+
+async def add_sessions(campaign_id: int, owner_id: int, numbers):
+    # A bulk insert, as the bulk endpoints do; it queues no embedding jobs
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(SessionModel).returning(SessionModel.id), [
+            {"campaign_id": campaign_id, "owner_id": owner_id, "session_number": n} for n in numbers
+        ])
+        await db.commit()
+
+async def next_event(received: asyncio.Queue) -> dict:
+    while True:
+        body = (await asyncio.wait_for(received.get(), 5))["body"].decode()
+        if body.startswith("data: "):
+            return json.loads(body[len("data: "):])
+
+@pytest.mark.anyio
+async def test_committed_changes_reach_sse_subscribers(client, campaign):
+    headers, campaign_id, user_id = campaign
+    request, received, disconnect = open_stream(app, "GET", f"/campaigns/{campaign_id}/events", headers)
+    try:
+        assert (await asyncio.wait_for(received.get(), 5))["status"] == 200
+        assert (await asyncio.wait_for(received.get(), 5))["body"] == b"retry: 3000\n\n"
+
+        await add_sessions(campaign_id, user_id, [1])
+        event = await next_event(received)
+        assert event["type"] == "change" and event["entity"] == "session" and event["action"] == "created"
+        assert event["campaign_id"] == campaign_id
+
+        # One commit publishes more than a subscriber buffers; it is told to resync
+        await add_sessions(campaign_id, user_id, range(2, 2 + changefeed.settings.changefeed_queue_size + 10))
+        event = await next_event(received)
+        assert event == changefeed.RESYNC
+    finally:
+        disconnect.set()
+        await asyncio.wait_for(request, 5)
+        await asyncio.gather(*changefeed._publishing)
+    assert campaign_id not in changefeed.get_broker().subscribers
+
+def test_websocket_subscribers_get_changes(client, campaign):
+    headers, campaign_id, _ = campaign
+    token = headers["Authorization"].split()[1]
+    with client.websocket_connect(f"/campaigns/{campaign_id}/ws?access_token={token}") as websocket:
+        session_id = client.post(
+            "/sessions/", json={"campaign_id": campaign_id, "session_number": 500}, headers=headers
+        ).json()["id"]
+        event = websocket.receive_json()
+        assert event["entity"] == "session" and event["id"] == session_id
+        assert event["action"] == "created"
@@ -0,0 +1,45 @@
+import os
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import database
+from app.services import health
+
+def test_ready_reports_checks_and_pool(client):
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "ready"
+    assert body["checks"]["database"]["status"] == "ok"
+    assert body["checks"]["database"]["latency_ms"] >= 0
+    assert body["checks"]["redis"] == {"status": "disabled"}
+    assert body["pool"]["pool"] == "InstrumentedAsyncQueuePool"
+    assert body["pool"]["checkouts"] > 0
+    assert {"size", "checked_out", "overflow", "timeouts", "wait_seconds"} <= body["pool"].keys()
+
+def test_unanswered_check_makes_the_node_unready(client, monkeypatch):
+    monkeypatch.setattr(health.settings, "health_check_timeout", 0)
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    database_check = response.json()["checks"]["database"]
+    assert (database_check["status"], database_check["error"]) == ("error", "timed out")
+    # Liveness doesn't depend on anything
+    assert client.get("/health").status_code == 200
+
+@pytest.mark.anyio
+async def test_pool_counts_checkouts_that_time_out():
+    engine = create_async_engine(
+        database.to_async_url(os.environ["DATABASE_URL"]),
+        poolclass=database.InstrumentedAsyncQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    try:
+        async with engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                await engine.connect().start()
+            status = database.pool_status(engine)
+            assert status["checked_out"] == 1
+        status = database.pool_status(engine)
+        assert (status["checkouts"], status["timeouts"], status["checked_out"]) == (1, 1, 0)
+        assert status["max_wait_seconds"] >= 0.05
+    finally:
+        await engine.dispose()
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.job import Job
+from app.services import jobs
+
+HOUR_AGO = datetime.now(timezone.utc) - timedelta(hours=1)
+
+calls = []
+started = asyncio.Event()
+
+@jobs.job_handler("test_count")
+async def count(job, payload):
+    calls.append(job.id)
+
+@jobs.job_handler("test_block")
+async def block(job, payload):
+    started.set()
+    await asyncio.Event().wait()
+
+async def add_job(**values) -> int:
+    values.setdefault("kind", "test_count")
+    values.setdefault("status", "queued")
+    async with AsyncSessionLocal() as db:
+        job = Job(**values)
+        db.add(job)
+        await db.commit()
+        return job.id
+
+async def get_job(job_id: int) -> Job:
+    async with AsyncSessionLocal() as db:
+        return await db.get(Job, job_id)
+
+@pytest.mark.anyio
+async def test_recovery_requeues_lost_and_stale_jobs(client):
+    lost = await add_job(created_at=HOUR_AGO)
+    fresh = await add_job()
+    stale = await add_job(status="running", heartbeat_at=HOUR_AGO, attempts=1)
+    dead = await add_job(status="running", heartbeat_at=HOUR_AGO, attempts=settings.job_max_attempts)
+    alive = await add_job(status="running", heartbeat_at=datetime.now(timezone.utc), attempts=1)
+    queue = jobs.InMemoryQueue()
+
+    assert set(await jobs.recover_jobs(queue)) >= {lost, stale}
+    waiting, _ = await queue.contents()
+    assert {lost, stale} <= waiting and not {fresh, dead, alive} & waiting
+    assert (await get_job(stale)).status == "queued"
+    assert (await get_job(dead)).status == "failed"
+    assert (await get_job(alive)).status == "running"
+
+    # After a restart nothing is on the queue, so every queued job goes back
+    assert fresh in await jobs.recover_jobs(jobs.InMemoryQueue(), startup=True)
+
+@pytest.mark.anyio
+async def test_job_delivered_twice_runs_once(client):
+    job_id = await add_job()
+    await asyncio.gather(jobs.run_job(job_id), jobs.run_job(job_id))
+    assert calls.count(job_id) == 1
+    job = await get_job(job_id)
+    assert (job.status, job.attempts) == ("completed", 1)
+
+@pytest.mark.anyio
+async def test_worker_hands_back_interrupted_jobs(client):
+    queue = jobs.InMemoryQueue()
+    job_id = await add_job(kind="test_block")
+    await queue.push(job_id)
+    worker = asyncio.create_task(jobs.worker_loop(queue=queue))
+    await asyncio.wait_for(started.wait(), 5)
+
+    worker.cancel()
+    await asyncio.gather(worker, return_exceptions=True)
+    job = await get_job(job_id)
+    assert (job.status, job.attempts) == ("queued", 0)
+    assert job_id in (await queue.contents())[0]
+    async with AsyncSessionLocal() as db:
+        await db.delete(await db.get(Job, job_id))
+        await db.commit()
+
+@pytest.mark.anyio
+async def test_redis_queue_keeps_ids_until_acked(client):
+    fakeredis = pytest.importorskip("fakeredis")
+    queue = jobs.RedisQueue(fakeredis.FakeAsyncRedis(decode_responses=True), "test:jobs")
+    orphaned = await add_job(created_at=HOUR_AGO)
+    finished = await add_job(status="completed")
+    for job_id in (orphaned, finished):
+        await queue.push(job_id)
+        assert await queue.pop(timeout=1) == job_id
+    # Popped by a worker that died before claiming or acknowledging them
+    assert await queue.contents() == (set(), {orphaned, finished})
+
+    assert orphaned in await jobs.recover_jobs(queue)
+    waiting, processing = await queue.contents()
+    assert orphaned in waiting and finished not in waiting and not processing
+
+    job_id = await queue.pop(timeout=1)
+    assert job_id in (await queue.contents())[1]
+    await queue.ack(job_id)
+    assert job_id not in (await queue.contents())[1]
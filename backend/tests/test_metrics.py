@@ -0,0 +1,36 @@
+from conftest import login
+
+def sample(text: str, name: str, **labels) -> float:
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f"{name}{{{pairs}}} " if pairs else f"{name} "
+    values = [float(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix)]
+    return values[0] if values else 0.0
+
+def test_requests_are_recorded_by_route_template(client):
+    headers = login(client, "measured@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Counted", "rpg_system": "dnd"}, headers=headers).json()["id"]
+    route = {"method": "GET", "route": "/campaigns/{campaign_id}"}
+    before = client.get("/metrics").text
+
+    client.get(f"/campaigns/{campaign_id}", headers=headers)
+    client.get("/campaigns/999999", headers=headers)
+    client.get("/no/such/path")
+    client.post("/uploads/file", files={"file": ("tally.txt", b"x" * 1000)}, headers=headers)
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = response.text
+
+    def grew(name: str, **labels) -> float:
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    duration = "rpassistant_http_request_duration_seconds_count"
+    assert grew(duration, **route, status="200") == 1
+    assert grew(duration, **route, status="404") == 1
+    assert grew(duration, method="GET", route="unmatched", status="404") == 1
+    assert grew("rpassistant_http_request_db_queries_count", **route) == 2
+    assert grew("rpassistant_http_request_bytes_total", method="POST", route="/uploads/file") > 1000
+    assert grew("rpassistant_db_queries_total", engine="async") > 0
+    assert "# TYPE rpassistant_http_request_duration_seconds histogram" in after
+    assert "# TYPE rpassistant_db_pool_checkouts_total counter" in after
+    assert sample(after, "rpassistant_db_pool_checkouts_total", engine="async") > 0
+    assert f'route="/campaigns/{campaign_id}"' not in after
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite
+from app.dependencies import live
+from app.models.campaign import Campaign
+from app.models.npc import NPC
+from app.models.session import Session as SessionModel
+from app.services.pagination import paginate
+from conftest import BACKEND
+
+def migrate(path, *args):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}")
+    subprocess.run([sys.executable, "-m", "alembic", *args], cwd=BACKEND, env=env, check=True, capture_output=True)
+
+@pytest.fixture(scope="module")
+def migrated(tmp_path_factory):
+    path = tmp_path_factory.mktemp("migrations") / "head.db"
+    migrate(path, "upgrade", "head")
+    return path
+
+def query_plan(path, query) -> str:
+    sql = str(query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    with sqlite3.connect(path) as db:
+        return "\n".join(row[-1] for row in db.execute("EXPLAIN QUERY PLAN " + sql))
+
+# The list endpoints' queries, built the way the routers build them
+@pytest.mark.parametrize("query, index", [
+    (
+        paginate(select(Campaign.id, Campaign.name).where(Campaign.owner_id == 1, live(Campaign)), [Campaign.id], None, 20),
+        "ix_campaigns_owner_created",
+    ),
+    (
+        paginate(select(SessionModel.id).where(SessionModel.campaign_id == 1),
+                 [SessionModel.session_number, SessionModel.id], None, 20),
+        "uq_sessions_campaign_number",
+    ),
+    (
+        paginate(select(NPC.id, NPC.name).where(NPC.session_id == 1), [NPC.id], None, 20),
+        "ix_npcs_session_status",
+    ),
+    (
+        select(NPC.id).where(NPC.session_id == 1, NPC.integration_status == "pending"),
+        "ix_npcs_session_status",
+    ),
+], ids=["campaigns-by-owner", "sessions-by-campaign", "npcs-by-session", "npcs-by-status"])
+def test_list_queries_use_their_index(migrated, query, index):
+    plan = query_plan(migrated, query)
+    assert f"INDEX {index} " in plan, plan
+    assert "SCAN" not in plan.replace("SCAN CONSTANT ROW", ""), plan
+
+def test_baseline_database_upgrades_to_head(tmp_path):
+    # A database the pre-Alembic API created is at 0001
+    path = tmp_path / "legacy.db"
+    migrate(path, "upgrade", "0001")
+    with sqlite3.connect(path) as db:
+        db.executescript("""
+            INSERT INTO users (id, email) VALUES (1, 'dm@example.com');
+            INSERT INTO campaigns (id, name, rpg_system, owner_id, description) VALUES (1, 'Dragons', 'dnd', 1, 'A wyrm lair');
+            INSERT INTO sessions (id, campaign_id, session_number, name) VALUES (1, 1, 1, 'First'), (2, 1, 1, 'Also first'), (3, 1, 2, 'Second');
+            INSERT INTO npcs (id, session_id, name) VALUES (1, 2, 'Bob');
+        """)
+    migrate(path, "upgrade", "head")
+
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT id, session_number, owner_id FROM sessions ORDER BY id").fetchall() == [
+            (1, 1, 1), (2, 3, 1), (3, 2, 1)
+        ]
+        assert db.execute("SELECT campaign_id, owner_id FROM npcs").fetchall() == [(1, 1)]
+        assert db.execute("SELECT rowid FROM campaigns_fts WHERE campaigns_fts MATCH 'wyrm'").fetchall() == [(1,)]
+        # Triggers survive the table rebuilds of later revisions
+        db.execute("UPDATE npcs SET backstory = 'A retired smuggler' WHERE id = 1")
+        assert db.execute("SELECT rowid FROM npcs_fts WHERE npcs_fts MATCH 'smuggler'").fetchall() == [(1,)]
+
+def test_uploaded_documents_move_to_campaign_documents(tmp_path):
+    path = tmp_path / "documents.db"
+    migrate(path, "upgrade", "0006")
+    with sqlite3.connect(path) as db:
+        db.executescript("""
+            INSERT INTO users (id, email) VALUES (1, 'dm@example.com'), (2, 'other@example.com');
+            INSERT INTO campaigns (id, name, rpg_system, owner_id, uploaded_documents)
+                VALUES (1, 'Dragons', 'dnd', 1, '["uploads/1/lore.pdf", "uploads/1/theme.mp3", "uploads/1/gone.md", "uploads/2/theirs.txt"]');
+            INSERT INTO blobs (sha256, size, ref_count) VALUES ('a', 1, 1), ('b', 1, 1), ('c', 1, 1);
+            INSERT INTO uploaded_files (id, file_id, owner_id, original_name, content_type, size, sha256) VALUES
+                (1, 'lore.pdf', 1, 'lore.pdf', 'application/pdf', 1, 'a'),
+                (2, 'theme.mp3', 1, 'theme.mp3', 'audio/mpeg', 1, 'b'),
+                (3, 'theirs.txt', 2, 'theirs.txt', 'text/plain', 1, 'c');
+        """)
+    migrate(path, "upgrade", "head")
+
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT campaign_id, uploaded_file_id, sha256 FROM campaign_documents").fetchall() == [(1, 1, "a")]
+        assert db.execute("SELECT kind, target_id, status FROM jobs").fetchall() == [("document_ingestion", 1, "queued")]
+        assert db.execute("SELECT id, campaign_id FROM uploaded_files ORDER BY id").fetchall() == [(1, 1), (2, 1), (3, None)]
+        # Left for the catalogue: not imported yet, or not the campaign owner's
+        assert db.execute("SELECT campaign_id, path FROM legacy_campaign_documents ORDER BY id").fetchall() == [
+            (1, "uploads/1/gone.md"), (1, "uploads/2/theirs.txt")
+        ]
+        columns = {row[1] for row in db.execute("PRAGMA table_info(campaigns)")}
+        assert "uploaded_documents" not in columns
+
+def test_downgrade_to_baseline(tmp_path):
+    path = tmp_path / "roundtrip.db"
+    migrate(path, "upgrade", "head")
+    migrate(path, "downgrade", "0001")
+    with sqlite3.connect(path) as db:
+        tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert tables == {"alembic_version", "users", "campaigns", "sessions", "npcs"}
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import pytest
+from sqlalchemy import func, select
+from app.database import AsyncSessionLocal
+from app.main import app
+from app.models.npc import NPC
+from app.services import bulk, llm, rate_limits
+from app.services.npc_generation import SectionParser
+from conftest import login, open_stream
+
+def parse(tokens) -> dict:
+    parser = SectionParser()
+    streamed = {}
+    for token in tokens:
+        for field, text in parser.feed(token):
+            streamed[field] = streamed.get(field, "") + text
+    for field, text in parser.finish():
+        streamed[field] = streamed.get(field, "") + text
+    assert {field: text.strip() for field, text in streamed.items()} == parser.values
+    return parser.values
+
+def test_parser_joins_labels_split_across_tokens():
+    assert parse(["Na", "me", ": Mi", "ra\nRo", "le:", " black", "smith\n", "Back", "story: Born in ", "Thornwall.\n", "She left."]) == {
+        "name": "Mira",
+        "role": "blacksmith",
+        "backstory": "Born in Thornwall.\nShe left.",
+    }
+
+def test_parser_accepts_markdown_labels():
+    text = "**Name:** Mira\n## Role: smith\n**Skills and stats**: Str 16\n__Relationship to the campaign__: owes the party"
+    assert parse([text[i:i + 3] for i in range(0, len(text), 3)]) == {
+        "name": "Mira",
+        "role": "smith",
+        "relevant_skills_stats": "Str 16",
+        "relationship_to_campaign": "owes the party",
+    }
+
+def test_parser_keeps_colons_that_are_not_labels():
+    assert parse(["Name: Mira\nBackstory: ", "Motto: never ", "again\nTime: 3:00"]) == {
+        "name": "Mira",
+        "backstory": "Motto: never again\nTime: 3:00",
+    }
+
+@pytest.fixture(scope="module")
+def generator(client):
+    headers = login(client, "generator@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Sky", "rpg_system": "dnd"}, headers=headers).json()["id"]
+    session_id = client.post("/sessions/", json={"campaign_id": campaign_id, "session_number": 1}, headers=headers).json()["id"]
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+    return headers, session_id, user_id
+
+def events(body: str) -> list:
+    return [json.loads(line[len("data: "):]) for line in body.split("\n\n") if line.startswith("data: ")]
+
+def test_generation_streams_fields_and_saves_the_npc(client, generator):
+    headers, session_id, _ = generator
+    response = client.post("/npcs/generate", json={"session_id": session_id, "role": "ferryman"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    streamed = events(response.text)
+    assert streamed[0] == {"type": "field", "field": "name", "text": "the "}
+    assert {event["field"] for event in streamed if event["type"] == "field"} >= {"name", "role", "backstory"}
+    saved = streamed[-1]["npc"]
+    assert streamed[-1]["type"] == "npc" and saved["ai_generated"]
+    assert saved["name"] == "the NPC's name"
+    npc = client.get(f"/npcs/{saved['id']}", headers=headers).json()
+    assert npc["backstory"] == "one or two paragraphs"
+
+class EndlessLLM(llm.FakeLLMClient):
+    def __init__(self):
+        self.closed = asyncio.Event()
+
+    async def stream(self, prompt, system=None, max_tokens=512):
+        try:
+            yield "Name: "
+            while True:
+                yield "la "
+                await asyncio.sleep(0.01)
+        finally:
+            self.closed.set()
+
+@pytest.mark.anyio
+async def test_abandoned_generation_releases_its_slot(client, generator):
+    headers, session_id, user_id = generator
+    model = EndlessLLM()
+    llm.set_llm_client(model)
+    count = select(func.count(NPC.id)).where(NPC.session_id == session_id)
+    async with AsyncSessionLocal() as db:
+        before = await db.scalar(count)
+    try:
+        request, received, disconnect = open_stream(
+            app, "POST", "/npcs/generate", {**headers, "Content-Type": "application/json"},
+            json.dumps({"session_id": session_id}).encode()
+        )
+        assert (await asyncio.wait_for(received.get(), 5))["status"] == 200
+        first = await asyncio.wait_for(received.get(), 5)
+        assert b'"field": "name"' in first["body"]
+        assert rate_limits._local_slots[f"{rate_limits.SLOT_PREFIX}generation:{user_id}"]
+
+        disconnect.set()
+        await asyncio.wait_for(request, 5)
+    finally:
+        llm.set_llm_client(None)
+    assert model.closed.is_set()
+    assert f"{rate_limits.SLOT_PREFIX}generation:{user_id}" not in rate_limits._local_slots
+    async with AsyncSessionLocal() as db:
+        assert await db.scalar(count) == before
+
+def test_bulk_create_reports_bad_items_by_index(client, generator):
+    headers, session_id, _ = generator
+    other = login(client, "bystander@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Elsewhere", "rpg_system": "dnd"}, headers=other).json()["id"]
+    foreign = client.post("/sessions/", json={"campaign_id": campaign_id, "session_number": 1}, headers=other).json()["id"]
+
+    items = [
+        {"session_id": session_id, "name": "Ada"},
+        {"session_id": session_id},
+        {"session_id": foreign, "name": "Spy"},
+        {"session_id": session_id, "name": "Bo", "role": "cook"},
+    ]
+    response = client.post("/npcs/bulk", json={"items": items}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["index"] for item in body["succeeded"]] == [0, 3]
+    assert [error["index"] for error in body["errors"]] == [1, 2]
+    assert body["errors"][1]["detail"] == "Session not found"
+    assert client.get(f"/npcs/{body['succeeded'][1]['id']}", headers=headers).json()["role"] == "cook"
+
+    assert client.post("/npcs/bulk", json={"items": [{"session_id": session_id, "name": "x"}] * 1001}, headers=headers).status_code == 413
+
+def test_bulk_ndjson_is_written_in_batches(client, generator, monkeypatch):
+    headers, session_id, _ = generator
+    batches = []
+    iter_batches = bulk.iter_batches
+
+    async def recording(*args, **kwargs):
+        async for batch in iter_batches(*args, **kwargs):
+            batches.append(len(batch))
+            yield batch
+    monkeypatch.setattr(bulk, "iter_batches", recording)
+
+    lines = [json.dumps({"session_id": session_id, "name": f"Extra {n}"}) for n in range(1200)]
+    lines.insert(700, "{not json")
+    response = client.post(
+        "/npcs/bulk", content="\n".join(lines) + "\n",
+        headers={**headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert batches == [bulk.BATCH_SIZE, bulk.BATCH_SIZE, 200]
+    assert body["errors"] == [{"index": 700, "detail": "Invalid JSON"}]
+    assert len(body["succeeded"]) == 1200
+    ids = [item["id"] for item in body["succeeded"]]
+    assert ids == sorted(ids) and len(set(ids)) == 1200
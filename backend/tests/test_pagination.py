@@ -0,0 +1,53 @@
+import pytest
+from app.services.pagination import encode_cursor
+from conftest import login
+
+@pytest.fixture(scope="module")
+def campaign(client):
+    headers = login(client, "pager@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Pages", "rpg_system": "dnd"}, headers=headers).json()["id"]
+    for number in (5, 1, 3, 2, 4):
+        client.post("/sessions/", json={"campaign_id": campaign_id, "session_number": number, "name": f"S{number}"}, headers=headers)
+    return headers, campaign_id
+
+def test_sessions_page_in_keyset_order(client, campaign):
+    headers, campaign_id = campaign
+    url, pages = f"/sessions/campaign/{campaign_id}?limit=2&fields=name", []
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor:
+            assert 'rel="next"' in response.headers["Link"]
+        url = f"/sessions/campaign/{campaign_id}?limit=2&fields=name&cursor={cursor}" if cursor else None
+    assert pages == [[{"name": "S1"}, {"name": "S2"}], [{"name": "S3"}, {"name": "S4"}], [{"name": "S5"}]]
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 at all!",
+    encode_cursor([3]),
+    encode_cursor(["3", 1]),
+    encode_cursor([True, 1]),
+    encode_cursor([{"dt": "yesterday"}, 1]),
+    encode_cursor([3, 1.5]),
+])
+def test_malformed_cursors_are_rejected(client, campaign, cursor):
+    headers, campaign_id = campaign
+    response = client.get(f"/sessions/campaign/{campaign_id}?cursor={cursor}", headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+def test_unknown_fields_are_rejected(client, campaign):
+    headers, campaign_id = campaign
+    response = client.get(f"/sessions/campaign/{campaign_id}?fields=name,transcript", headers=headers)
+    assert response.status_code == 400
+    assert "transcript" in response.json()["detail"]
+
+def test_the_frontend_can_read_the_next_cursor(client, campaign):
+    headers, campaign_id = campaign
+    response = client.get(
+        f"/sessions/campaign/{campaign_id}?limit=2",
+        headers={**headers, "Origin": "http://localhost:5173"}
+    )
+    exposed = response.headers["Access-Control-Expose-Headers"]
+    assert "X-Next-Cursor" in exposed and "Link" in exposed
@@ -0,0 +1,53 @@
+import pytest
+from app.database import AsyncSessionLocal
+from app.services import metrics, prompt_context
+from conftest import login
+
+@pytest.fixture(scope="module")
+def campaign(client):
+    headers = login(client, "storyteller@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Ashes", "rpg_system": "dnd", "campaign_notes": "The king is dead"}, headers=headers).json()["id"]
+    session_id = client.post("/sessions/", json={"campaign_id": campaign_id, "session_number": 1}, headers=headers).json()["id"]
+    npc_id = client.post("/npcs/", json={"session_id": session_id, "name": "Mara", "role": "smuggler"}, headers=headers).json()["id"]
+    return headers, campaign_id, session_id, npc_id
+
+async def build_counting(campaign_id: int, session_id: int, monkeypatch):
+    # Returns the bundle, the sections that were rebuilt and the SQL it took
+    rebuilt = []
+    put = prompt_context._put
+
+    async def recording_put(key, data):
+        rebuilt.append(key)
+        await put(key, data)
+
+    stats = metrics.RequestStats()
+    token = metrics._request_stats.set(stats)
+    try:
+        with monkeypatch.context() as patch:
+            patch.setattr(prompt_context, "_put", recording_put)
+            async with AsyncSessionLocal() as db:
+                bundle = await prompt_context.build(db, campaign_id, session_id)
+    finally:
+        metrics._request_stats.reset(token)
+    return bundle, rebuilt, stats.queries
+
+@pytest.mark.anyio
+async def test_writes_rebuild_only_the_sections_they_touch(client, campaign, monkeypatch):
+    headers, campaign_id, session_id, npc_id = campaign
+    bundle, rebuilt, _ = await build_counting(campaign_id, session_id, monkeypatch)
+    assert rebuilt == [f"campaign:{campaign_id}", f"recaps:{campaign_id}", f"session:{session_id}"]
+    assert "Mara (smuggler)" in bundle.render()
+
+    # Warm: every section comes from the cache without touching the database
+    _, rebuilt, queries = await build_counting(campaign_id, session_id, monkeypatch)
+    assert rebuilt == [] and queries == 0
+
+    client.put(f"/npcs/{npc_id}", json={"role": "informant"}, headers=headers)
+    bundle, rebuilt, _ = await build_counting(campaign_id, session_id, monkeypatch)
+    assert rebuilt == [f"session:{session_id}"]
+    assert "Mara (informant)" in bundle.render()
+
+    client.put(f"/campaigns/{campaign_id}", json={"campaign_notes": "The king lives"}, headers=headers)
+    bundle, rebuilt, _ = await build_counting(campaign_id, session_id, monkeypatch)
+    assert rebuilt == [f"campaign:{campaign_id}"]
+    assert "The king lives" in bundle.render()
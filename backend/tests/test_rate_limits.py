@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from app.models.user import User
+from app.services import rate_limits
+from conftest import login
+
+def test_bucket_headers_count_down_to_a_429(client, monkeypatch):
+    monkeypatch.setitem(rate_limits.settings.rate_limits, "free", {"api": "3/minute"})
+    headers = login(client, "hasty@example.com")
+
+    remaining = []
+    for _ in range(3):
+        response = client.get("/campaigns/", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["RateLimit-Limit"] == "3"
+        remaining.append(response.headers["RateLimit-Remaining"])
+    assert remaining == ["2", "1", "0"]
+
+    response = client.get("/campaigns/", headers=headers)
+    assert response.status_code == 429
+    assert response.headers["RateLimit-Remaining"] == "0"
+    # One token refills every 20 seconds
+    assert 1 <= int(response.headers["Retry-After"]) <= 20
+
+    # Buckets are per user
+    assert client.get("/campaigns/", headers=login(client, "patient@example.com")).status_code == 200
+
+def test_expired_subscriptions_fall_back_to_free():
+    later = datetime.utcnow() + timedelta(days=1)
+    earlier = datetime.utcnow() - timedelta(days=1)
+    assert rate_limits.tier(User(subscription_status="premium", subscription_expires=later)) == "premium"
+    assert rate_limits.tier(User(subscription_status="premium", subscription_expires=earlier)) == "free"
+    assert rate_limits.tier(User(subscription_status="platinum")) == "free"
+    assert rate_limits.tier(User()) == "free"
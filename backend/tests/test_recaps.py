@@ -0,0 +1,94 @@
+import pytest
+from app.database import AsyncSessionLocal
+from app.models.campaign import Campaign
+from app.models.job import Job
+from app.models.session import Session as SessionModel
+from app.models.user import User
+from app.services import llm, recaps
+from conftest import login
+
+class CountingLLM(llm.FakeLLMClient):
+    def __init__(self):
+        self.prompts = []
+
+    async def complete(self, prompt, system=None, max_tokens=512):
+        self.prompts.append(prompt)
+        return await super().complete(prompt, system=system, max_tokens=max_tokens)
+
+    def calls(self, template: str) -> int:
+        prefix = template.split("{text}")[0]
+        return sum(prompt.startswith(prefix) for prompt in self.prompts)
+
+TRANSCRIPT = "\n".join(
+    f"GM: Scene {n}. The party reaches the {n}th gate of the drowned city and argues about the toll."
+    for n in range(1, 13)
+)
+
+@pytest.fixture
+async def session_id(client):
+    async with AsyncSessionLocal() as db:
+        user = User(email="recaps@example.com")
+        db.add(user)
+        await db.flush()
+        campaign = Campaign(name="Drowned", rpg_system="dnd", owner_id=user.id)
+        db.add(campaign)
+        await db.flush()
+        session = SessionModel(campaign_id=campaign.id, owner_id=user.id, session_number=1, transcript=TRANSCRIPT)
+        db.add(session)
+        await db.commit()
+        return session.id
+
+async def run_recap(session_id: int) -> str:
+    async with AsyncSessionLocal() as db:
+        job = Job(kind=recaps.JOB_KIND, target_id=session_id, status="running")
+        db.add(job)
+        await db.commit()
+        await recaps.generate_recap(job, {})
+        session = await db.get(SessionModel, session_id)
+        await db.refresh(session)
+        return session.recap
+
+@pytest.mark.anyio
+async def test_rerunning_a_recap_reuses_cached_summaries(session_id, monkeypatch):
+    monkeypatch.setattr(recaps.settings, "recap_window_tokens", 60)
+    windows = recaps.split_windows(TRANSCRIPT, 60)
+    assert len(windows) > 2
+    model = CountingLLM()
+    llm.set_llm_client(model)
+    try:
+        recap = await run_recap(session_id)
+        assert recap
+        assert model.calls(recaps.MAP_PROMPT) == len(windows)
+        assert model.calls(recaps.REDUCE_PROMPT) >= 1
+
+        model.prompts.clear()
+        assert await run_recap(session_id) == recap
+        assert model.prompts == []
+
+        # Appending to the transcript only summarizes the windows that changed
+        async with AsyncSessionLocal() as db:
+            session = await db.get(SessionModel, session_id)
+            session.transcript = TRANSCRIPT + "\nGM: The toll collector turns out to be a ghost."
+            await db.commit()
+        model.prompts.clear()
+        await run_recap(session_id)
+        assert model.calls(recaps.MAP_PROMPT) == 1
+    finally:
+        llm.set_llm_client(None)
+
+@pytest.mark.anyio
+async def test_recap_generation_needs_a_transcript(client):
+    headers = login(client, "recap-starter@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Quiet", "rpg_system": "dnd"}, headers=headers).json()["id"]
+    session_id = client.post("/sessions/", json={"campaign_id": campaign_id, "session_number": 1}, headers=headers).json()["id"]
+    for transcript in (None, ""):
+        async with AsyncSessionLocal() as db:
+            (await db.get(SessionModel, session_id)).transcript = transcript
+            await db.commit()
+        response = client.post(f"/sessions/{session_id}/recap/generation", headers=headers)
+        assert response.status_code == 400
+
+    async with AsyncSessionLocal() as db:
+        (await db.get(SessionModel, session_id)).transcript = TRANSCRIPT
+        await db.commit()
+    assert client.post(f"/sessions/{session_id}/recap/generation", headers=headers).status_code == 202
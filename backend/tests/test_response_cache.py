@@ -0,0 +1,39 @@
+from conftest import login
+
+def test_etag_revalidates_until_a_write_bumps_the_stamp(client):
+    headers = login(client, "poller@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Polled", "rpg_system": "dnd"}, headers=headers).json()["id"]
+
+    first = client.get(f"/campaigns/{campaign_id}", headers=headers)
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"') and first.headers["Cache-Control"] == "private, no-cache"
+    cached = client.get(f"/campaigns/{campaign_id}", headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    client.put(f"/campaigns/{campaign_id}", json={"description": "Now with lore"}, headers=headers)
+    fresh = client.get(f"/campaigns/{campaign_id}", headers={**headers, "If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.json()["description"] == "Now with lore"
+    assert fresh.headers["ETag"] != etag
+
+    # Entries are per owner, never served to someone else
+    assert client.get(f"/campaigns/{campaign_id}", headers=login(client, "snoop@example.com")).status_code == 404
+
+def test_bulk_writes_invalidate_cached_lists(client):
+    headers = login(client, "poller@example.com")
+    campaign_id = client.post("/campaigns/", json={"name": "Crowded", "rpg_system": "dnd"}, headers=headers).json()["id"]
+    session_id = client.post("/sessions/", json={"campaign_id": campaign_id, "session_number": 1}, headers=headers).json()["id"]
+
+    listing = client.get(f"/npcs/session/{session_id}", headers=headers)
+    assert listing.json() == []
+    created = client.post("/npcs/bulk", json={"items": [{"session_id": session_id, "name": "Pell"}]}, headers=headers).json()
+    listing = client.get(f"/npcs/session/{session_id}", headers={**headers, "If-None-Match": listing.headers["ETag"]})
+    assert listing.status_code == 200
+    assert [npc["name"] for npc in listing.json()] == ["Pell"]
+
+    npc_id = created["succeeded"][0]["id"]
+    client.patch("/npcs/bulk", json={"items": [{"id": npc_id, "name": "Pellam"}]}, headers=headers)
+    assert [npc["name"] for npc in client.get(f"/npcs/session/{session_id}", headers=headers).json()] == ["Pellam"]
+    client.delete(f"/npcs/bulk?ids={npc_id}", headers=headers)
+    assert client.get(f"/npcs/session/{session_id}", headers=headers).json() == []
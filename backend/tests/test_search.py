@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import func, update
+from app.database import AsyncSessionLocal
+from app.models.campaign import Campaign
+
+@pytest.fixture(scope="module")
+def campaign_id(client, auth_headers):
+    response = client.post("/campaigns/", json={"name": "Curse", "rpg_system": "CoC", "description": "An innkeeper named Bob"}, headers=auth_headers)
+    return response.json()["id"]
+
+def test_search_filters_by_type(client, auth_headers, campaign_id):
+    response = client.get("/search/?q=innkeeper&types=campaign,npc", headers=auth_headers)
+    assert response.status_code == 200
+    assert [hit["type"] for hit in response.json()] == ["campaign"]
+
+@pytest.mark.parametrize("types", ["foo", "npc,foo", "", ","])
+def test_search_rejects_unknown_or_empty_types(client, auth_headers, campaign_id, types):
+    response = client.get(f"/search/?q=innkeeper&types={types}", headers=auth_headers)
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("sources", ["foo", ""])
+def test_lore_search_rejects_unknown_or_empty_sources(client, auth_headers, campaign_id, sources):
+    response = client.get(f"/search/lore?campaign_id={campaign_id}&q=innkeeper&sources={sources}", headers=auth_headers)
+    assert response.status_code == 400
+
+@pytest.mark.anyio
+async def test_search_within_a_tombstoned_campaign_finds_nothing(client, auth_headers):
+    doomed = client.post("/campaigns/", json={"name": "Doomed", "rpg_system": "dnd"}, headers=auth_headers).json()["id"]
+    client.post("/sessions/", json={"campaign_id": doomed, "session_number": 1, "name": "Gravedigger"}, headers=auth_headers)
+    assert client.get(f"/search/?q=gravedigger&campaign_id={doomed}", headers=auth_headers).json()
+    # Tombstoned, as DELETE /campaigns/{id} leaves it until the cleanup job runs
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Campaign).where(Campaign.id == doomed).values(deleted_at=func.now()))
+        await db.commit()
+    assert client.get(f"/search/?q=gravedigger&campaign_id={doomed}", headers=auth_headers).json() == []
@@ -0,0 +1,51 @@
+import pytest
+from app.services.storage import LocalStorage, S3Storage
+
+moto = pytest.importorskip("moto")
+
+DIGEST = "ab" * 32
+CONTENT = bytes(range(256)) * 40
+
+@pytest.fixture
+def s3():
+    with moto.mock_aws():
+        storage = S3Storage("blobs", prefix="test/", region_name="us-east-1")
+        storage.client.create_bucket(Bucket="blobs")
+        yield storage
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalStorage(tmp_path / "blobs")
+
+@pytest.fixture(params=["local", "s3"])
+def storage(request):
+    return request.getfixturevalue(request.param)
+
+async def collect(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+@pytest.mark.anyio
+async def test_put_exists_delete(storage, tmp_path):
+    source = tmp_path / "upload.bin"
+    source.write_bytes(CONTENT)
+    assert not await storage.exists(DIGEST)
+
+    await storage.put(DIGEST, source)
+    assert await storage.exists(DIGEST)
+    assert not source.exists()  # put takes ownership of the staged file
+
+    await storage.delete(DIGEST)
+    assert not await storage.exists(DIGEST)
+    await storage.delete(DIGEST)  # deleting a missing blob is not an error
+
+@pytest.mark.anyio
+async def test_iter_chunks_ranges(storage, tmp_path):
+    source = tmp_path / "upload.bin"
+    source.write_bytes(CONTENT)
+    await storage.put(DIGEST, source)
+
+    assert await collect(storage.iter_chunks(DIGEST, chunk_size=1000)) == CONTENT
+    assert await collect(storage.iter_chunks(DIGEST, 100, 2500, chunk_size=1000)) == CONTENT[100:2600]
+    assert await collect(storage.iter_chunks(DIGEST, 10000)) == CONTENT[10000:]
+    chunks = [chunk async for chunk in storage.iter_chunks(DIGEST, 0, 2500, chunk_size=1000)]
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
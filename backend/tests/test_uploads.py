@@ -0,0 +1,165 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+import pytest
+from app.services import uploads as upload_service
+
+async def slow_chunks(data: bytes, started: asyncio.Event, release: asyncio.Event):
+    started.set()
+    await release.wait()
+    yield data
+
+async def chunks(data: bytes):
+    yield data
+
+@pytest.mark.anyio
+async def test_concurrent_chunks_at_the_same_offset_append_once():
+    meta = await upload_service.create_upload_session(1, "concurrent", "notes.txt", 10)
+    started, release = asyncio.Event(), asyncio.Event()
+    first = asyncio.create_task(upload_service.append_to_upload_session(
+        1, "concurrent", meta, 0, slow_chunks(b"12345", started, release)
+    ))
+    await started.wait()
+
+    with pytest.raises(upload_service.UploadBusy):
+        await upload_service.append_to_upload_session(1, "concurrent", meta, 0, chunks(b"12345"))
+    release.set()
+    assert await first == 5
+
+    # The lock is gone with the first writer; a late retry sees the new offset
+    with pytest.raises(upload_service.UploadOffsetMismatch) as mismatch:
+        await upload_service.append_to_upload_session(1, "concurrent", meta, 0, chunks(b"12345"))
+    assert mismatch.value.expected == 5
+    assert upload_service.part_path(1, "concurrent").read_bytes() == b"12345"
+
+@pytest.mark.anyio
+async def test_abandoned_sessions_expire():
+    await upload_service.create_upload_session(2, "abandoned", "a.txt", 10)
+    await upload_service.create_upload_session(2, "active", "b.txt", 10)
+    stale = time.time() - 2 * 86400
+    for path in (upload_service.part_path(2, "abandoned"), upload_service.meta_path(2, "abandoned")):
+        os.utime(path, (stale, stale))
+
+    assert upload_service.expire_upload_sessions(max_age=86400) == 1
+    assert await upload_service.get_upload_session(2, "abandoned") is None
+    assert await upload_service.get_upload_session(2, "active") is not None
+
+@pytest.mark.anyio
+async def test_recount_waits_for_uncommitted_uploads(client, auth_headers, tmp_path):
+    from sqlalchemy import select
+    from app.database import AsyncSessionLocal
+    from app.models.upload import StoredBlob
+    from app.services import catalogue
+
+    owner_id = client.get("/auth/me", headers=auth_headers).json()["id"]
+    staged = tmp_path / "lore.txt"
+    staged.write_bytes(b"recount me")
+    digest = await upload_service.hash_file(staged)
+    async with AsyncSessionLocal() as uploading, AsyncSessionLocal() as recounting:
+        # Blob acquired and stored, manifest row not committed yet
+        uploaded = await upload_service.register_upload(
+            uploading, owner_id, "recount.txt", "lore.txt", staged, digest, 10, commit=False
+        )
+        recount = asyncio.create_task(catalogue.recount_references(recounting, {}))
+        await asyncio.sleep(0.2)
+        assert not recount.done()
+        await uploading.commit()
+        await recount
+
+        assert await recounting.scalar(select(StoredBlob.ref_count).where(StoredBlob.sha256 == digest)) == 1
+        assert await upload_service.get_storage().exists(digest)
+        await upload_service.release_upload(uploading, uploaded)
+
+@pytest.mark.anyio
+async def test_catalogue_attaches_legacy_campaign_documents(client, auth_headers):
+    from app.config import settings
+    from app.database import AsyncSessionLocal
+    from app.models.document import LegacyCampaignDocument
+    from app.services import catalogue
+
+    owner_id = client.get("/auth/me", headers=auth_headers).json()["id"]
+    campaign_id = client.post("/campaigns/", json={"name": "Old", "rpg_system": "dnd"}, headers=auth_headers).json()["id"]
+    # Written by the pre-catalogue upload route, then referenced by uploaded_documents
+    legacy_dir = Path(settings.upload_folder) / str(owner_id)
+    legacy_dir.mkdir(parents=True, exist_ok=True)
+    (legacy_dir / "old-notes.md").write_text("# Old notes")
+    async with AsyncSessionLocal() as db:
+        db.add_all([
+            LegacyCampaignDocument(campaign_id=campaign_id, path=f"uploads/{owner_id}/old-notes.md"),
+            LegacyCampaignDocument(campaign_id=campaign_id, path=f"uploads/{owner_id}/missing.md"),
+        ])
+        await db.commit()
+        report = await catalogue.reconcile_catalogue(db)
+
+    assert report["legacy_documents_attached"] == 1
+    assert report["unresolved_legacy_documents"] == 1
+    documents = client.get(f"/campaigns/{campaign_id}/documents", headers=auth_headers).json()
+    assert [document["file_id"] for document in documents] == ["old-notes.md"]
+
+@pytest.mark.anyio
+async def test_released_blob_is_purged_only_while_unreferenced(client, auth_headers, tmp_path, monkeypatch):
+    from sqlalchemy import select
+    from app.database import AsyncSessionLocal
+    from app.models.upload import StoredBlob
+
+    owner_id = client.get("/auth/me", headers=auth_headers).json()["id"]
+    storage = upload_service.get_storage()
+
+    async def register(db, file_id: str):
+        staged = tmp_path / file_id
+        staged.write_bytes(b"purge me")
+        digest = await upload_service.hash_file(staged)
+        return await upload_service.register_upload(db, owner_id, file_id, "purge.txt", staged, digest, 8)
+
+    async with AsyncSessionLocal() as db:
+        first = await register(db, "purge-1.txt")
+        digest = first.sha256
+        # Released and committed, but not purged before the same content is
+        # uploaded again: the new upload revives the row and the purge skips it
+        with monkeypatch.context() as patch:
+            patch.setattr(upload_service, "purge_blobs", lambda db, digests: asyncio.sleep(0))
+            await upload_service.release_upload(db, first)
+        assert await db.scalar(select(StoredBlob.ref_count).where(StoredBlob.sha256 == digest)) == 0
+        second = await register(db, "purge-2.txt")
+        await upload_service.purge_blobs(db, [digest])
+        assert await db.scalar(select(StoredBlob.ref_count).where(StoredBlob.sha256 == digest)) == 1
+        assert await storage.exists(digest)
+
+        await upload_service.release_upload(db, second)
+        assert await db.get(StoredBlob, digest) is None
+        assert not await storage.exists(digest)
+        # A later upload of the same content stores the bytes again
+        third = await register(db, "purge-3.txt")
+        assert await storage.exists(digest)
+        await upload_service.release_upload(db, third)
+
+def start_upload(client, headers, data: bytes, campaign_id=None) -> str:
+    upload_id = client.post(
+        "/uploads/sessions", json={"filename": "notes.txt", "size": len(data), "campaign_id": campaign_id}, headers=headers
+    ).json()["upload_id"]
+    assert client.put(f"/uploads/sessions/{upload_id}?offset=0", content=data, headers=headers).status_code == 200
+    return upload_id
+
+@pytest.mark.anyio
+async def test_a_repeated_complete_finds_the_upload_gone(client, auth_headers):
+    owner_id = client.get("/auth/me", headers=auth_headers).json()["id"]
+    upload_id = start_upload(client, auth_headers, b"complete me once")
+
+    # A complete arriving while another holds the session is turned away
+    async with upload_service.locked_upload_session(owner_id, upload_id) as meta:
+        assert meta["offset"] == meta["size"]
+        response = client.post(f"/uploads/sessions/{upload_id}/complete", headers=auth_headers)
+        assert response.status_code == 409 and response.headers["Retry-After"] == "1"
+
+    assert client.post(f"/uploads/sessions/{upload_id}/complete", headers=auth_headers).status_code == 200
+    assert client.post(f"/uploads/sessions/{upload_id}/complete", headers=auth_headers).status_code == 404
+
+def test_complete_rechecks_the_campaign(client, auth_headers):
+    campaign_id = client.post("/campaigns/", json={"name": "Doomed", "rpg_system": "dnd"}, headers=auth_headers).json()["id"]
+    upload_id = start_upload(client, auth_headers, b"orphaned notes", campaign_id=campaign_id)
+    assert client.delete(f"/campaigns/{campaign_id}", headers=auth_headers).status_code == 202
+
+    response = client.post(f"/uploads/sessions/{upload_id}/complete", headers=auth_headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Campaign not found"
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from app.database import AsyncSessionLocal
+from app.models.campaign import Campaign
+from app.models.user import User
+from app.services import vector_index
+from app.services.embeddings import get_embedder, normalize
+
+def test_ivf_recall_matches_brute_force():
+    rng = np.random.default_rng(7)
+    centers = normalize(rng.normal(size=(50, 64)))
+    vectors = normalize(np.repeat(centers, 120, axis=0) + 0.05 * rng.normal(size=(6000, 64))).astype(np.float32)
+    queries = normalize(vectors[rng.choice(len(vectors), 50, replace=False)] + 0.05 * rng.normal(size=(50, 64)))
+    exact = vector_index.BruteForceIndex(vectors)
+    approximate = vector_index.IVFIndex(vectors, probes=8)
+
+    found = 0
+    for query in queries.astype(np.float32):
+        expected, scores = exact.search(query, 10)
+        assert list(scores) == sorted(scores, reverse=True)
+        found += len(set(expected) & set(approximate.search(query, 10)[0]))
+    assert found / (10 * len(queries)) >= 0.9
+
+async def set_description(campaign_id: int, description: str):
+    async with AsyncSessionLocal() as db:
+        campaign = await db.get(Campaign, campaign_id)
+        campaign.description = description
+        await db.commit()
+
+@pytest.mark.anyio
+async def test_same_second_rewrite_rebuilds_the_index(client):
+    async with AsyncSessionLocal() as db:
+        user = User(email="lore@example.com")
+        db.add(user)
+        await db.flush()
+        campaign = Campaign(name="Lore", rpg_system="dnd", owner_id=user.id, description="A city of brass bells.")
+        db.add(campaign)
+        await db.commit()
+        campaign_id = campaign.id
+    model = get_embedder().name
+
+    async with AsyncSessionLocal() as db:
+        await vector_index.reindex_source(db, "campaign", campaign_id)
+        first = await vector_index.get_campaign_index(db, campaign_id, model)
+        assert await vector_index.get_campaign_index(db, campaign_id, model) is first
+
+    # Same chunk count, and on SQLite most likely the same updated_at second
+    await set_description(campaign_id, "A forest of glass trees.")
+    async with AsyncSessionLocal() as db:
+        assert await vector_index.reindex_source(db, "campaign", campaign_id) == 1
+        second = await vector_index.get_campaign_index(db, campaign_id, model)
+        assert second is not first
+        assert list(second.ids) == list(first.ids)
+        assert not np.allclose(second.index.vectors, first.index.vectors)
+        query = (await get_embedder().embed(["glass trees"]))[0]
+        hits = await vector_index.search(db, campaign_id, "glass trees", k=1)
+        assert hits[0]["text"].endswith("A forest of glass trees.")
+        assert hits[0]["score"] == pytest.approx(float(second.index.vectors[0] @ query))
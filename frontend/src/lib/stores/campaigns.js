@@ -30,15 +30,25 @@ function createCampaignStore() {
       
       try {
         const headers = await getAuthHeaders();
-        const response = await fetch(`${API_BASE}/campaigns/`, {
-          headers
-        });
+        // The list is paged; keep following X-Next-Cursor until it is absent
+        const campaigns = [];
+        let cursor = null;
+        do {
+          const url = cursor
+            ? `${API_BASE}/campaigns/?cursor=${encodeURIComponent(cursor)}`
+            : `${API_BASE}/campaigns/`;
+          const response = await fetch(url, {
+            headers
+          });
+          
+          if (!response.ok) {
+            throw new Error('Failed to load campaigns');
+          }
+          
+          campaigns.push(...await response.json());
+          cursor = response.headers.get('X-Next-Cursor');
+        } while (cursor);
         
-        if (!response.ok) {
-          throw new Error('Failed to load campaigns');
-        }
-        
-        const campaigns = await response.json();
         update(state => ({ ...state, campaigns, isLoading: false }));
       } catch (error) {
         update(state => ({ ...state, isLoading: false }));
@@ -119,6 +129,25 @@ function createCampaignStore() {
       } catch (error) {
         throw error;
       }
+    },
+    
+    // Subscribes to the campaign's change feed instead of polling. onEvent
+    // gets {type: 'change', entity, action, id, session_id} for each change
+    // and {type: 'resync'} when events were dropped and data should be
+    // refetched. Returns a function that closes the stream.
+    watchCampaign(campaignId, onEvent) {
+      const auth = get(authStore);
+      if (!auth.token) {
+        throw new Error('Not authenticated');
+      }
+      // EventSource can't send headers, so the token goes in the query string
+      const source = new EventSource(
+        `${API_BASE}/campaigns/${campaignId}/events?access_token=${encodeURIComponent(auth.token)}`
+      );
+      source.onmessage = (message) => onEvent(JSON.parse(message.data));
+      // The browser reconnects on its own; anything missed meanwhile is lost
+      source.onerror = () => onEvent({ type: 'resync' });
+      return () => source.close();
     }
   };
 }